@@ -1,76 +1,364 @@
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Dict
+from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.config import get_stream_writer
+from langgraph.types import RetryPolicy, Send
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Annotated, Callable, Iterator, Tuple, TypedDict, List, Dict, Optional
+from agents.market_analyst import MarketAnalystAgent, UNIVERSE_WORKERS
+from agents.quant_scorer import FACTORS, QuantScorer, write_narrative
 from agents.reasoning_agent import ReasoningAgent
+from agents.registry import get_agent
+from data.price_snapshot import PriceSnapshot
+from gamification.virtual_currency import get_positions
 from utils.logger import logger
-import finnhub
-from utils.config import FINNHUB_API_KEY
+from utils.llm_cache import snapshot_scope
+import contextvars
+import operator
+import threading
 import time
+import uuid
 
-class WorkflowState(TypedDict):
+def merge_dicts(left: Dict, right: Dict) -> Dict:
+    """State reducer for keys written by parallel nodes."""
+    return {**(left or {}), **(right or {})}
+
+class WorkflowState(TypedDict, total=False):
     preferences: Dict
     user_id: str
+    is_trade: bool
+    price_snapshot: Dict  # PriceSnapshot.to_dict(), so checkpoints hold plain data
+    research_symbols: List[str]  # held symbols plus the best pre-ranked candidates
+    holdings: Dict[str, float]
+    thinking_process: List[str]
+    symbol_analysis: Annotated[Dict[str, Dict], merge_dicts]
+    news_sentiment: Annotated[Dict[str, str], merge_dicts]
     recommendations: List[Dict]
     market_insights: str
-    reasoning_steps: List[str]
-    thinking_process: List[str]
+    reasoning_steps: Annotated[List[str], operator.add]
+    risk_projection: Optional[Dict]
+    node_timings: Annotated[Dict[str, float], merge_dicts]
+
+class NodeFailed(Exception):
+    """Raised by a node whose work should be retried."""
 
-finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
 STOCK_LIST = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "JPM", "WMT", "V"]
+VALIDATION_WORKERS = 3      # concurrent validate_trade calls per run
+VALIDATION_DEADLINE = 45.0  # seconds before pending validations are given up on
+NODE_RETRY_ATTEMPTS = 2     # attempts per node before the run fails
+RESUME_ATTEMPTS = 1         # times a failed run is resumed from its last checkpoint
+RESEARCH_CANDIDATES = 6     # unheld symbols researched per run, pre-ranked without network calls
+# Compiled graphs are reused across runs; each run checkpoints under its own
+# thread id in the shared saver and deletes it when done
+_graphs: Dict[Tuple[str, int, float], object] = {}
+_graphs_lock = threading.Lock()
+_checkpointer = MemorySaver()
+# Research kept from MarketAnalystAgent.analyze_stock, which is given the
+# snapshot quote; recommendations only ever see snapshot prices
+RESEARCH_FIELDS = ("company", "pe_ratio", "debt_to_equity", "news_sentiment", "analysis")
 
-def run_workflow(preferences: Dict, user_id: str, is_trade: bool = False) -> Dict:
-    """Run the investment recommendation workflow with step-by-step reasoning."""
+def _current_holdings(user_id: str, snapshot: PriceSnapshot) -> Dict[str, float]:
+    """Dollar value of each symbol the user holds, marked at snapshot prices."""
+    return {position["symbol"]: position["quantity"] * snapshot.price(position["symbol"])
+            for position in get_positions(user_id)}
+
+def research_candidates(quant_scorer: QuantScorer, symbols: List[str], preferences: Dict,
+                        snapshot: PriceSnapshot, holdings: Dict[str, float],
+                        limit: int = RESEARCH_CANDIDATES) -> List[str]:
+    """Symbols worth per-symbol research: every held one plus the `limit` best of the rest.
+
+    The rest are ranked by QuantScorer on snapshot prices and stored price
+    history alone, so choosing them costs no Finnhub, NewsAPI or LLM calls.
+    """
+    held = [symbol for symbol in symbols if holdings.get(symbol, 0) > 0]
+    others = [symbol for symbol in symbols if symbol not in held and snapshot.price(symbol) > 0]
+    if len(others) > limit:
+        scored = quant_scorer.score([{"symbol": symbol, "price": snapshot.price(symbol)} for symbol in others],
+                                    preferences)
+        others = [others[i] for i in sorted(np.argsort(-scored.composite, kind="stable")[:limit])]
+    return held + others
+
+def validate_recommendations(reasoning_agent: ReasoningAgent, recommendations: List[Dict], preferences: Dict,
+                             snapshot: PriceSnapshot, max_workers: int = VALIDATION_WORKERS,
+                             deadline: float = VALIDATION_DEADLINE):
+    """Validate recommendations concurrently, giving up on any still pending after `deadline` seconds.
+
+    Returns (recommendations, steps). Valid recommendations are marked
+    "validated"; ones that missed the deadline or whose validation raised are
+    kept, marked "unvalidated", after the validated ones. Rejected ones are dropped.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="validate")
     try:
-        reasoning_agent = ReasoningAgent()
+        # Each call runs in a copy of this context so it keys the LLM cache to the same snapshot
+        futures = [
+            executor.submit(contextvars.copy_context().run, reasoning_agent.validate_trade, rec, preferences, snapshot)
+            for rec in recommendations
+        ]
+        done, _ = wait(futures, timeout=deadline)
+    finally:
+        # Don't block the response on validations that missed the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    validated, unvalidated, steps = [], [], []
+    for rec, future in zip(recommendations, futures):
+        symbol = rec.get("Symbol", "unknown")
+        if future not in done:
+            logger.warning(f"Validation of {symbol} missed the {deadline:.0f}s deadline")
+            steps.append(f"Validation of {symbol} did not finish within {deadline:.0f} seconds; marked as unvalidated")
+            unvalidated.append({**rec, "ValidationStatus": "unvalidated"})
+            continue
+        try:
+            is_valid, explanation, val_steps = future.result()
+        except Exception as e:
+            logger.error(f"Validation of {symbol} failed: {str(e)}")
+            steps.append(f"Validation of {symbol} failed; marked as unvalidated")
+            unvalidated.append({**rec, "ValidationStatus": "unvalidated"})
+            continue
+        steps.extend(val_steps)
+        if is_valid:
+            validated.append({**rec, "ValidationStatus": "validated"})
+    return validated + unvalidated, steps
+
+def _retryable(error: Exception) -> bool:
+    """Retry upstream failures (network, rate limits, empty LLM output), not programming errors."""
+    return not isinstance(error, (ValueError, TypeError, KeyError, AttributeError))
 
-        # Initialize state
-        state = WorkflowState(
+def _timed(name: str, fn: Callable[[Dict], Dict], label: Optional[Callable[[Dict], str]] = None):
+    """Wrap a node so it runs under the run's snapshot scope and records its duration."""
+    def node(state: Dict) -> Dict:
+        started = time.perf_counter()
+        snapshot = state.get("price_snapshot") or {}
+        with snapshot_scope(snapshot.get("version", "")):
+            update = fn(state) or {}
+        elapsed = time.perf_counter() - started
+        key = label(state) if label else name
+        logger.info(f"Workflow node {key} finished in {elapsed:.2f}s")
+        return {**update, "node_timings": {key: round(elapsed, 3)}}
+    return node
+
+def build_workflow_graph(reasoning_agent: ReasoningAgent, market_analyst: MarketAnalystAgent,
+                         validation_workers: int = VALIDATION_WORKERS,
+                         validation_deadline: float = VALIDATION_DEADLINE, checkpointer=None,
+                         engine: str = "llm"):
+    """Compile the recommendation graph.
+
+    snapshot -> (thinking | sentiment -> analyze_symbol per research symbol)
+    -> recommend -> validate (trades only) -> project. Thinking runs
+    concurrently with the research branch, whose per-symbol analyses reuse the
+    batched sentiment labels instead of fetching news again. Node updates are checkpointed, so a node that still
+    fails after its retries can be resumed without rerunning the others.
+    With engine="quant" the recommend node ranks and sizes positions with
+    QuantScorer and the LLM only writes the narrative.
+    """
+    symbols = reasoning_agent.ALLOWED_STOCKS
+    quant_scorer = QuantScorer()
+
+    def snapshot_node(state: WorkflowState) -> Dict:
+        # Take one price snapshot for the whole run so every agent sees the same numbers
+        snapshot = PriceSnapshot.capture()
+        holdings = _current_holdings(state["user_id"], snapshot)
+        research_symbols = research_candidates(quant_scorer, symbols, state["preferences"], snapshot, holdings)
+        if not research_symbols:
+            # An empty fan-out would leave the recommend join waiting forever
+            raise NodeFailed("Price snapshot has no priced symbols and the user holds none")
+        return {
+            "price_snapshot": snapshot.to_dict(),
+            "holdings": holdings,
+            "research_symbols": research_symbols
+        }
+
+    def thinking_node(state: WorkflowState) -> Dict:
+        snapshot = PriceSnapshot.from_dict(state["price_snapshot"])
+        writer = get_stream_writer()
+        thoughts = []
+        for thought in reasoning_agent.stream_thinking_process(state["preferences"], snapshot, state.get("holdings")):
+            thoughts.append(thought)
+            writer(("thought", thought))
+        return {"thinking_process": thoughts}
+
+    def fan_out_symbols(state: WorkflowState) -> List[Send]:
+        sentiments = state.get("news_sentiment", {})
+        return [Send("analyze_symbol", {"symbol": symbol, "price_snapshot": state["price_snapshot"],
+                                        "news_sentiment": sentiments.get(symbol, "Neutral")})
+                for symbol in state["research_symbols"]]
+
+    def analyze_symbol_node(state: Dict) -> Dict:
+        snapshot = PriceSnapshot.from_dict(state["price_snapshot"])
+        result = market_analyst.analyze_stock(state["symbol"], quote=snapshot.quote(state["symbol"]),
+                                              news_sentiment=state["news_sentiment"])
+        if str(result.get("analysis", "")).startswith("Error"):
+            return {"symbol_analysis": {}}
+        return {"symbol_analysis": {state["symbol"]: {field: result.get(field) for field in RESEARCH_FIELDS}}}
+
+    def sentiment_node(state: WorkflowState) -> Dict:
+        return {"news_sentiment": market_analyst.fetch_news_sentiment(state["research_symbols"])}
+
+    def quant_recommend(state: WorkflowState, snapshot: PriceSnapshot, market_context: Dict[str, Dict]) -> Dict:
+        market_data = [{**market_context.get(symbol, {}), "symbol": symbol, "price": snapshot.price(symbol)}
+                       for symbol in state["research_symbols"]]
+        recommendations = quant_scorer.recommend(state["preferences"], market_data)
+        if not recommendations:
+            raise NodeFailed("Quant scorer found no symbols to recommend")
+        writer = get_stream_writer()
+        for rec in recommendations:
+            writer(("recommendation", rec))
+        recommendations, insights = write_narrative(reasoning_agent.llm, recommendations, state["preferences"])
+        weights = ", ".join(f"{factor} {weight:.0%}" for factor, weight in
+                            zip(FACTORS, quant_scorer.factor_weights(state["preferences"])))
+        steps = [f"Ranked {len(market_data)} symbols on weighted factors: {weights}"]
+        steps.extend(reasoning_agent._format_recommendation_step(rec) for rec in recommendations)
+        return {"recommendations": recommendations, "market_insights": insights, "reasoning_steps": steps}
+
+    def recommend_node(state: WorkflowState) -> Dict:
+        snapshot = PriceSnapshot.from_dict(state["price_snapshot"])
+        market_context = {symbol: dict(research) for symbol, research in state.get("symbol_analysis", {}).items()}
+        for symbol, label in state.get("news_sentiment", {}).items():
+            market_context.setdefault(symbol, {})["news_sentiment"] = label
+        if engine == "quant":
+            return quant_recommend(state, snapshot, market_context)
+        writer = get_stream_writer()
+        for kind, payload in reasoning_agent.stream_investment_scenario(
+            state["preferences"],
+            is_trade=state.get("is_trade", False),
+            snapshot=snapshot,
+            holdings=state.get("holdings"),
+            thinking_process=state.get("thinking_process"),
+            market_context=market_context
+        ):
+            if kind == "result":
+                recommendations, insights, steps, _ = payload
+            else:
+                writer((kind, payload))
+        if not recommendations:
+            raise NodeFailed("No recommendations generated")
+        return {"recommendations": recommendations, "market_insights": insights, "reasoning_steps": steps}
+
+    def validate_node(state: WorkflowState) -> Dict:
+        recommendations, steps = validate_recommendations(
+            reasoning_agent, state["recommendations"], state["preferences"],
+            PriceSnapshot.from_dict(state["price_snapshot"]),
+            max_workers=validation_workers, deadline=validation_deadline
+        )
+        return {"recommendations": recommendations, "reasoning_steps": steps}
+
+    def project_node(state: WorkflowState) -> Dict:
+        # Simulate the portfolio as it would look after the recommended trades
+        projection = reasoning_agent.get_risk_projection(
+            state["preferences"], PriceSnapshot.from_dict(state["price_snapshot"]),
+            state.get("holdings"), state["recommendations"]
+        )
+        return {"risk_projection": projection.to_dict() if projection is not None else None}
+
+    retry = RetryPolicy(max_attempts=NODE_RETRY_ATTEMPTS, retry_on=_retryable)
+    graph = StateGraph(WorkflowState)
+    graph.add_node("snapshot", _timed("snapshot", snapshot_node), retry_policy=retry)
+    graph.add_node("thinking", _timed("thinking", thinking_node), retry_policy=retry)
+    graph.add_node("analyze_symbol", _timed("analyze_symbol", analyze_symbol_node,
+                                            label=lambda state: f"analyze_symbol:{state['symbol']}"),
+                   retry_policy=retry)
+    graph.add_node("sentiment", _timed("sentiment", sentiment_node), retry_policy=retry)
+    graph.add_node("recommend", _timed("recommend", recommend_node), retry_policy=retry)
+    graph.add_node("validate", _timed("validate", validate_node), retry_policy=retry)
+    graph.add_node("project", _timed("project", project_node), retry_policy=retry)
+
+    graph.add_edge(START, "snapshot")
+    graph.add_edge("snapshot", "thinking")
+    graph.add_edge("snapshot", "sentiment")
+    graph.add_conditional_edges("sentiment", fan_out_symbols, ["analyze_symbol"])
+    graph.add_edge(["thinking", "analyze_symbol"], "recommend")
+    graph.add_conditional_edges("recommend", lambda state: "validate" if state.get("is_trade") else "project",
+                                ["validate", "project"])
+    graph.add_edge("validate", "project")
+    graph.add_edge("project", END)
+    return graph.compile(checkpointer=checkpointer or MemorySaver())
+
+def get_workflow_graph(engine: str = "llm", validation_workers: int = VALIDATION_WORKERS,
+                       validation_deadline: float = VALIDATION_DEADLINE):
+    """Compiled graph for these settings, built once with the registry's agents."""
+    key = (engine, validation_workers, validation_deadline)
+    with _graphs_lock:
+        if key not in _graphs:
+            _graphs[key] = build_workflow_graph(get_agent(ReasoningAgent), get_agent(MarketAnalystAgent),
+                                                validation_workers, validation_deadline,
+                                                checkpointer=_checkpointer, engine=engine)
+        return _graphs[key]
+
+def _result_from_state(state: Dict) -> Dict:
+    return {
+        "recommendations": state.get("recommendations", []),
+        "market_insights": state.get("market_insights", ""),
+        "reasoning_steps": state.get("reasoning_steps", []),
+        "thinking_process": state.get("thinking_process", []),
+        "snapshot_version": (state.get("price_snapshot") or {}).get("version"),
+        "risk_projection": state.get("risk_projection"),
+        "node_timings": state.get("node_timings", {})
+    }
+
+def stream_workflow(preferences: Dict, user_id: str, is_trade: bool = False,
+                    validation_workers: int = VALIDATION_WORKERS,
+                    validation_deadline: float = VALIDATION_DEADLINE,
+                    engine: str = "llm") -> Iterator[Tuple[str, object]]:
+    """Run the workflow, yielding ("thought", text) and ("recommendation", rec) as they are produced.
+
+    The last item is ("result", dict) with the same dict run_workflow returns.
+    Streamed recommendations are previews from before validation.
+    """
+    thread_id = str(uuid.uuid4())
+    try:
+        graph = get_workflow_graph(engine, validation_workers, validation_deadline)
+        config = {"configurable": {"thread_id": thread_id}, "max_concurrency": UNIVERSE_WORKERS}
+        inputs = WorkflowState(
             preferences=preferences,
             user_id=user_id,
-            recommendations=[],
-            market_insights="",
+            is_trade=is_trade,
             reasoning_steps=[],
-            thinking_process=[]
+            node_timings={}
         )
 
-        # Run the analysis
-        recommendations, insights, steps, thinking = reasoning_agent.analyze_investment_scenario(
-            preferences,
-            is_trade=is_trade
-        )
-
-        if not recommendations:
-            logger.warning("No recommendations generated")
-            return {
-                "recommendations": [],
-                "market_insights": "Unable to generate recommendations at this time.",
-                "reasoning_steps": steps,
-                "thinking_process": thinking
-            }
-
-        # If this is a trade request, validate the recommendations
-        if is_trade:
-            valid_recommendations = []
-            validation_steps = []
-            for rec in recommendations:
-                is_valid, explanation, val_steps = reasoning_agent.validate_trade(rec, preferences)
-                if is_valid:
-                    valid_recommendations.append(rec)
-                validation_steps.extend(val_steps)
-            recommendations = valid_recommendations
-            steps.extend(validation_steps)
+        state = {}
+        for attempt in range(RESUME_ATTEMPTS + 1):
+            try:
+                for mode, chunk in graph.stream(inputs, config, stream_mode=["custom", "values"]):
+                    if mode == "custom":
+                        yield chunk
+                    else:
+                        state = chunk
+                break
+            except Exception as e:
+                if attempt == RESUME_ATTEMPTS:
+                    if not isinstance(e, NodeFailed):
+                        raise
+                    logger.warning(f"No recommendations generated: {str(e)}")
+                    result = _result_from_state(graph.get_state(config).values)
+                    result.update(recommendations=[],
+                                  market_insights="Unable to generate recommendations at this time.")
+                    yield "result", result
+                    return
+                # Resume from the last checkpoint; nodes that already finished are not rerun
+                logger.warning(f"Workflow node failed ({str(e)}), resuming from checkpoint")
+                inputs = None
 
-        return {
-            "recommendations": recommendations,
-            "market_insights": insights,
-            "reasoning_steps": steps,
-            "thinking_process": thinking
-        }
+        logger.info(f"Workflow node timings: {state.get('node_timings')}")
+        yield "result", _result_from_state(state)
 
     except Exception as e:
         logger.error(f"Workflow failed: {str(e)}")
-        return {
+        yield "result", {
             "recommendations": [],
             "market_insights": f"Analysis failed: {str(e)}",
             "reasoning_steps": ["Error occurred during analysis"],
             "thinking_process": ["Thinking: An error occurred during analysis"]
         }
+    finally:
+        # The compiled graph and its saver outlive the run; its checkpoints should not
+        _checkpointer.delete_thread(thread_id)
+
+def run_workflow(preferences: Dict, user_id: str, is_trade: bool = False,
+                 validation_workers: int = VALIDATION_WORKERS,
+                 validation_deadline: float = VALIDATION_DEADLINE,
+                 engine: str = "llm") -> Dict:
+    """Run the investment recommendation workflow with step-by-step reasoning."""
+    for kind, payload in stream_workflow(preferences, user_id, is_trade, validation_workers,
+                                         validation_deadline, engine):
+        if kind == "result":
+            return payload
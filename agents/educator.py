@@ -1,10 +1,9 @@
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
-from utils.config import GROQ_API_KEY
+from utils.clients import get_chat_model
 
 class EducatorAgent:
     def __init__(self):
-        self.llm = ChatGroq(model_name="gemma2-9b-it", api_key=GROQ_API_KEY)  # Balanced for education
+        self.llm = get_chat_model("gemma2-9b-it")  # Balanced for education
 
     def provide_education(self, strategy):
         prompt = PromptTemplate(
@@ -1,12 +1,12 @@
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY
+from utils.clients import get_chat_model
+from utils.json_extract import extract_json
 from utils.logger import logger
 from typing import List, Dict
 import json
 
 class GroqEnhancerAgent:
     def __init__(self):
-        self.llm = ChatGroq(model_name="mixtral-8x7b-32768", api_key=GROQ_API_KEY)  
+        self.llm = get_chat_model("mixtral-8x7b-32768")  
     def enhance_recommendations(self, recommendations: List[Dict], preferences: Dict) -> List[Dict]:
         if not recommendations:
             logger.warning("No recommendations to enhance")
@@ -40,7 +40,10 @@ Each recommendation should have: Symbol, Company, Action, Quantity, Reason, Caut
 """
 
             response = self.llm.invoke(prompt)
-            enhanced_recs = json.loads(response.content)
+            enhanced_recs = extract_json(response.content, openers="[")
+            if not isinstance(enhanced_recs, list):
+                logger.error("No JSON array in enhanced recommendations response")
+                return recommendations
             logger.info("Successfully enhanced recommendations with Groq")
             
             for rec in enhanced_recs:
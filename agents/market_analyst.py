@@ -1,105 +1,324 @@
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY, NEWSAPI_KEY, FINNHUB_API_KEY
+from utils.clients import get_chat_model, get_finnhub_client, get_newsapi_client
+from utils.json_extract import extract_json
 from utils.logger import logger
-import finnhub
+from agents.sentiment import SENTIMENT_THRESHOLD, make_sentiment_backend
 import mysql.connector
-from data.mysql_db import get_db_connection
-from newsapi import NewsApiClient
+from data.mysql_db import db_connection
+from data.finnhub_quotes import finnhub_rate_limiter
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from cachetools import TTLCache
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
+import hashlib
 import json
+import re
+
+# Concurrent calls allowed per upstream, shared by every agent in the process
+UPSTREAM_LIMITS = {
+    "finnhub": 4,
+    "newsapi": 2,
+    "groq": 3,
+    "mysql": 3,  # stays below the connection pool size so trades never starve
+}
+UNIVERSE_WORKERS = 8
+FINNHUB_TOKEN_TIMEOUT = 30.0  # seconds to wait for a Finnhub rate-limit token
+
+_upstream_semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in UPSTREAM_LIMITS.items()}
+
+HEADLINES_PER_SYMBOL = 5
+HEADLINES_PER_CALL = 40        # headlines scored in one LLM request
+HEADLINE_CHARS_PER_CALL = 6000 # rough prompt budget per request
+
+# Scores survive across agent instances so an unchanged headline is never rescored
+_headline_scores = TTLCache(maxsize=5000, ttl=24 * 3600)
+_headline_scores_lock = threading.Lock()
+# Financials, news and analyses, shared by every instance so they outlive a single request.
+# TTLCache is not thread-safe and analyze_universe shares it across workers.
+_analysis_cache = TTLCache(maxsize=100, ttl=3600)
+_analysis_cache_lock = threading.Lock()
+_WHITESPACE = re.compile(r"\s+")
+
+
+def headline_key(headline: str) -> str:
+    return hashlib.sha1(_WHITESPACE.sub(" ", headline).strip().lower().encode("utf-8")).hexdigest()
+
+
+def sentiment_label(score: Optional[float]) -> str:
+    if score is None:
+        return "Neutral"
+    if score >= SENTIMENT_THRESHOLD:
+        return "Positive"
+    if score <= -SENTIMENT_THRESHOLD:
+        return "Negative"
+    return "Neutral"
+
+
+def chunk_headlines(headlines: List[str], max_count: int = HEADLINES_PER_CALL,
+                    max_chars: int = HEADLINE_CHARS_PER_CALL) -> List[List[str]]:
+    """Split headlines into request-sized chunks by count and total length."""
+    chunks, current, size = [], [], 0
+    for headline in headlines:
+        if current and (len(current) >= max_count or size + len(headline) > max_chars):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(headline)
+        size += len(headline)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@contextmanager
+def upstream_slot(name: str):
+    """Hold one of the concurrency slots for an upstream service."""
+    with _upstream_semaphores[name]:
+        yield
 
 
 class MarketAnalystAgent:
-    def __init__(self):
-        self.llm = ChatGroq(model_name="llama-3.1-8b-instant", api_key=GROQ_API_KEY)
-        self.finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
-        self.newsapi_client = NewsApiClient(api_key=NEWSAPI_KEY)
-        self.cache = TTLCache(maxsize=100, ttl=3600)
+    def __init__(self, sentiment_backend="hybrid"):
+        self.llm = get_chat_model("llama-3.1-8b-instant")
+        self.finnhub_client = get_finnhub_client()
+        self.newsapi_client = get_newsapi_client()
+        self.cache = _analysis_cache
+        self._cache_lock = _analysis_cache_lock
+        # "lexicon", "llm", "hybrid" or any object with score_headlines(headlines)
+        if isinstance(sentiment_backend, str):
+            sentiment_backend = make_sentiment_backend(sentiment_backend, self.score_headlines_llm)
+        self.sentiment_backend = sentiment_backend
+
+    def _cache_get(self, key: str):
+        with self._cache_lock:
+            return self.cache.get(key)
+
+    def _cache_set(self, key: str, value):
+        with self._cache_lock:
+            self.cache[key] = value
+
+    def _finnhub_call(self, method, *args, **kwargs):
+        """Call Finnhub within both the concurrency limit and the shared rate limiter."""
+        if not finnhub_rate_limiter.acquire(timeout=FINNHUB_TOKEN_TIMEOUT):
+            raise RuntimeError("Finnhub rate limit: no token available")
+        with upstream_slot("finnhub"):
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                if "429" in str(e):
+                    finnhub_rate_limiter.drain()
+                raise
 
     def fetch_financials(self, cik: str) -> dict:
         cache_key = f"financials_{cik}"
-        if cache_key in self.cache:
+        cached = self._cache_get(cache_key)
+        if cached is not None:
             logger.info(f"Returning cached financials for CIK {cik}")
-            return self.cache[cache_key]
+            return cached
 
         try:
             logger.info(f"Fetching MySQL financials for CIK {cik}")
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            five_years_ago = datetime.now() - timedelta(days=5*365)
-
-            cursor.execute("""
-                SELECT revenue, net_income, fiscal_date_ending
-                FROM income_statements
-                WHERE cik = %s AND fiscal_date_ending >= %s
-                ORDER BY fiscal_date_ending DESC
-            """, (cik, five_years_ago))
-            income = cursor.fetchall() or []
-            logger.info(f"Income statements for CIK {cik}: {len(income)} records")
-
-            cursor.execute("""
-                SELECT total_assets, total_liabilities, total_equity
-                FROM balance_sheets
-                WHERE cik = %s AND fiscal_date_ending >= %s
-                ORDER BY fiscal_date_ending DESC
-            """, (cik, five_years_ago))
-            balance = cursor.fetchall() or []
-            logger.info(f"Balance sheets for CIK {cik}: {len(balance)} records")
-
-            cursor.execute("""
-                SELECT operating_cash_flow, capital_expenditure
-                FROM cash_flows
-                WHERE cik = %s AND fiscal_date_ending >= %s
-                ORDER BY fiscal_date_ending DESC
-            """, (cik, five_years_ago))
-            cash_flow = cursor.fetchall() or []
-            logger.info(f"Cash flows for CIK {cik}: {len(cash_flow)} records")
-
-            cursor.close()
-            conn.close()
+            with upstream_slot("mysql"), db_connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+
+                five_years_ago = datetime.now() - timedelta(days=5*365)
+
+                cursor.execute("""
+                    SELECT revenue, net_income, fiscal_date_ending
+                    FROM income_statements
+                    WHERE cik = %s AND fiscal_date_ending >= %s
+                    ORDER BY fiscal_date_ending DESC
+                """, (cik, five_years_ago))
+                income = cursor.fetchall() or []
+                logger.info(f"Income statements for CIK {cik}: {len(income)} records")
+
+                cursor.execute("""
+                    SELECT total_assets, total_liabilities, total_equity
+                    FROM balance_sheets
+                    WHERE cik = %s AND fiscal_date_ending >= %s
+                    ORDER BY fiscal_date_ending DESC
+                """, (cik, five_years_ago))
+                balance = cursor.fetchall() or []
+                logger.info(f"Balance sheets for CIK {cik}: {len(balance)} records")
+
+                cursor.execute("""
+                    SELECT operating_cash_flow, capital_expenditure
+                    FROM cash_flows
+                    WHERE cik = %s AND fiscal_date_ending >= %s
+                    ORDER BY fiscal_date_ending DESC
+                """, (cik, five_years_ago))
+                cash_flow = cursor.fetchall() or []
+                logger.info(f"Cash flows for CIK {cik}: {len(cash_flow)} records")
+
+                cursor.close()
 
             financials = {
                 "income": income,
                 "balance": balance,
                 "cash_flow": cash_flow
             }
-            self.cache[cache_key] = financials
+            self._cache_set(cache_key, financials)
             return financials
 
         except Exception as e:
             logger.error(f"Failed to fetch financials for CIK {cik}: {str(e)}")
             return {}
 
-    def fetch_news_sentiment(self, symbols: List[str]) -> Dict[str, str]:
+    def fetch_headlines(self, symbol: str) -> List[str]:
+        """Top headlines from the last week for one symbol."""
+        to_date = datetime.now()
+        from_date = to_date - timedelta(days=7)
+        with upstream_slot("newsapi"):
+            response = self.newsapi_client.get_everything(
+                q=symbol,
+                from_param=from_date.strftime('%Y-%m-%d'),
+                to=to_date.strftime('%Y-%m-%d'),
+                language='en',
+                sort_by='relevancy'
+            )
+        return [article['title'] for article in response.get('articles', [])[:HEADLINES_PER_SYMBOL] if article.get('title')]
+
+    def _score_headline_chunk(self, headlines: List[str]) -> Dict[str, float]:
+        """Score one chunk of headlines in a single LLM call, keyed by headline."""
+        items = [{"id": i, "headline": headline} for i, headline in enumerate(headlines)]
+        prompt = f"""
+Score the sentiment of each financial news headline from -1 (negative) to 1 (positive) for the company it mentions.
+Headlines:
+{json.dumps(items, indent=1)}
+Return ONLY a JSON object with one entry per id:
+```json
+{{
+    "scores": [{{"id": 0, "score": 0.4}}]
+}}
+```
+"""
+        with upstream_slot("groq"):
+            response = self.llm.invoke(prompt)
+        result = extract_json(response.content, openers="{")
+        if result is None:
+            raise ValueError("No JSON object in headline scores response")
+        scores = {}
+        for entry in result.get("scores", []):
+            try:
+                idx = int(entry["id"])
+                scores[headlines[idx]] = max(-1.0, min(1.0, float(entry["score"])))
+            except (KeyError, TypeError, ValueError, IndexError):
+                logger.warning(f"Ignoring malformed headline score: {entry}")
+        return scores
+
+    def score_headlines(self, headlines: List[str]) -> Dict[str, float]:
+        """Scores for headlines from the configured sentiment backend."""
+        return self.sentiment_backend.score_headlines(headlines)
+
+    def score_headlines_llm(self, headlines: List[str]) -> Dict[str, float]:
+        """LLM scores for headlines, calling the LLM only for ones not scored before."""
+        scores, pending = {}, []
+        with _headline_scores_lock:
+            for headline in dict.fromkeys(headlines):
+                cached = _headline_scores.get(headline_key(headline))
+                if cached is None:
+                    pending.append(headline)
+                else:
+                    scores[headline] = cached
+        if not pending:
+            return scores
+
+        chunks = chunk_headlines(pending)
+        logger.info(f"Scoring {len(pending)} new headlines in {len(chunks)} LLM call(s) ({len(scores)} cached)")
+        for chunk in chunks:
+            try:
+                chunk_scores = self._score_headline_chunk(chunk)
+            except Exception as e:
+                logger.error(f"Batched headline scoring failed for {len(chunk)} headlines: {str(e)}")
+                continue
+            with _headline_scores_lock:
+                for headline, score in chunk_scores.items():
+                    _headline_scores[headline_key(headline)] = score
+            scores.update(chunk_scores)
+        return scores
+
+    def score_news(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        """Mean headline score per symbol.
+
+        A symbol with no recent headlines scores 0.0 (Neutral); None means its
+        news could not be fetched or scored.
+        """
+        headlines: Dict[str, List[str]] = {}
+        with ThreadPoolExecutor(max_workers=UPSTREAM_LIMITS["newsapi"], thread_name_prefix="news-fetch") as executor:
+            futures = {executor.submit(self.fetch_headlines, symbol): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    headlines[symbol] = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to fetch news for {symbol}: {str(e)}")
+
+        scores = self.score_headlines([h for symbol_headlines in headlines.values() for h in symbol_headlines])
+        results = {}
+        for symbol in symbols:
+            if symbol in headlines and not headlines[symbol]:
+                results[symbol] = 0.0
+                continue
+            symbol_scores = [scores[h] for h in headlines.get(symbol, []) if h in scores]
+            results[symbol] = sum(symbol_scores) / len(symbol_scores) if symbol_scores else None
+        return results
+
+    def fetch_news_sentiment(self, symbols: List[str], batched: bool = True) -> Dict[str, str]:
+        """Positive/Negative/Neutral per symbol.
+
+        Batched mode fetches every symbol's headlines, then scores all unseen
+        headlines together in as few LLM calls as the prompt budget allows.
+        """
+        if not batched:
+            return self._fetch_news_sentiment_per_symbol(symbols)
+
+        sentiments = {}
+        pending = []
+        for symbol in symbols:
+            cached = self._cache_get(f"news_{symbol}")
+            if cached is not None:
+                sentiments[symbol] = cached
+            else:
+                pending.append(symbol)
+        if pending:
+            for symbol, score in self.score_news(pending).items():
+                sentiments[symbol] = sentiment_label(score)
+                # No headlines is cached as Neutral; symbols we failed to fetch or score are retried next time
+                if score is not None:
+                    self._cache_set(f"news_{symbol}", sentiments[symbol])
+                logger.info(f"News sentiment for {symbol}: {sentiments[symbol]} ({score})")
+        return sentiments
+
+    def _fetch_news_sentiment_per_symbol(self, symbols: List[str]) -> Dict[str, str]:
+        """Original one-request-per-symbol path, kept for batched=False."""
         sentiments = {}
         to_date = datetime.now()
         from_date = to_date - timedelta(days=7)
 
         for symbol in symbols:
             cache_key = f"news_{symbol}"
-            if cache_key in self.cache:
+            cached = self._cache_get(cache_key)
+            if cached is not None:
                 logger.info(f"Returning cached news sentiment for {symbol}")
-                sentiments[symbol] = self.cache[cache_key]
+                sentiments[symbol] = cached
                 continue
 
             try:
                 logger.info(f"Fetching news for {symbol}")
-                response = self.newsapi_client.get_everything(
-                    q=symbol,
-                    from_param=from_date.strftime('%Y-%m-%d'),
-                    to=to_date.strftime('%Y-%m-%d'),
-                    language='en',
-                    sort_by='relevancy'
-                )
+                with upstream_slot("newsapi"):
+                    response = self.newsapi_client.get_everything(
+                        q=symbol,
+                        from_param=from_date.strftime('%Y-%m-%d'),
+                        to=to_date.strftime('%Y-%m-%d'),
+                        language='en',
+                        sort_by='relevancy'
+                    )
                 articles = response.get('articles', [])
                 if not articles:
                     logger.info(f"No news articles found for {symbol}")
                     sentiments[symbol] = "Neutral"
-                    self.cache[cache_key] = "Neutral"
+                    self._cache_set(cache_key, "Neutral")
                     continue
 
                 headlines = [article['title'] for article in articles[:5]]
@@ -114,8 +333,9 @@ Score sentiment from -1 (negative) to 1 (positive). Return a JSON object:
 }}
 Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else).
 """
-                response = self.llm.invoke(prompt)
-                result = json.loads(response.content.strip())
+                with upstream_slot("groq"):
+                    response = self.llm.invoke(prompt)
+                result = extract_json(response.content, default={}, openers="{")
                 sentiment = result.get("sentiment", "Neutral")
 
                 if sentiment not in ["Positive", "Negative", "Neutral"]:
@@ -124,14 +344,14 @@ Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else)
 
                 logger.info(f"News sentiment for {symbol}: {sentiment}")
                 sentiments[symbol] = sentiment
-                self.cache[cache_key] = sentiment
+                self._cache_set(cache_key, sentiment)
 
             except Exception as e:
                 logger.error(f"Failed to fetch news for {symbol}: {str(e)}")
                 if "429" in str(e):
                     time.sleep(10)
                 sentiments[symbol] = "Neutral"
-                self.cache[cache_key] = "Neutral"
+                self._cache_set(cache_key, "Neutral")
 
         return sentiments
 
@@ -156,18 +376,27 @@ Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else)
             logger.error(f"Failed to calculate ratios: {str(e)}")
             return {"pe_ratio": None, "debt_to_equity": None}
 
-    def analyze_stock(self, symbol: str) -> dict:
+    def analyze_stock(self, symbol: str, quote: Optional[Dict[str, float]] = None,
+                      news_sentiment: Optional[str] = None) -> dict:
+        """Research one symbol. A caller holding a price snapshot passes its quote
+        (current_price/high_price/low_price) so no live quote is fetched, and one
+        that already scored the news passes the label so it is not fetched again."""
         cache_key = f"analysis_{symbol}"
-        if cache_key in self.cache:
+        cached = self._cache_get(cache_key)
+        if cached is not None:
             logger.info(f"Returning cached analysis for {symbol}")
-            return self.cache[cache_key]
+            return cached
 
         try:
             logger.info(f"Analyzing stock {symbol}")
+            if quote is not None:
+                quote = {"c": quote.get("current_price", 0.0), "h": quote.get("high_price", 0.0),
+                         "l": quote.get("low_price", 0.0)}
             for attempt in range(2):
                 try:
-                    quote = self.finnhub_client.quote(symbol)
-                    company = self.finnhub_client.company_profile2(symbol=symbol)
+                    if quote is None:
+                        quote = self._finnhub_call(self.finnhub_client.quote, symbol)
+                    company = self._finnhub_call(self.finnhub_client.company_profile2, symbol=symbol)
                     logger.info(f"Finnhub data for {symbol}: {quote}, {company}")
                     break
                 except Exception as e:
@@ -181,7 +410,8 @@ Where sentiment is 'Positive' (>=0.3), 'Negative' (<= -0.3), or 'Neutral' (else)
             shares_outstanding = company.get("shareOutstanding", 1) * 1e6
 
             financials = self.fetch_financials(cik) if cik else {}
-            news_sentiment = self.fetch_news_sentiment([symbol]).get(symbol, "Neutral")
+            if news_sentiment is None:
+                news_sentiment = self.fetch_news_sentiment([symbol]).get(symbol, "Neutral")
             ratios = self.calculate_ratios(financials, quote.get("c", 0.0), shares_outstanding)
 
             stock_data = {
@@ -212,7 +442,8 @@ Provide a brief analysis (3-4 sentences) covering market trends, financial healt
 Return the analysis as a string.
 """
             try:
-                response = self.llm.invoke(prompt)
+                with upstream_slot("groq"):
+                    response = self.llm.invoke(prompt)
                 analysis = response.content.strip()
                 logger.info(f"LLM analysis for {symbol}: {analysis}")
             except Exception as e:
@@ -243,7 +474,7 @@ Return the analysis as a string.
                 raise ValueError(f"Invalid result format, missing: {missing_keys}")
 
             logger.debug(f"Returning analysis result for {symbol}: {result}")
-            self.cache[cache_key] = result
+            self._cache_set(cache_key, result)
             return result
 
         except Exception as e:
@@ -259,3 +490,20 @@ Return the analysis as a string.
                 "pe_ratio": None,
                 "debt_to_equity": None
             }
+
+    def analyze_universe(self, symbols: List[str], max_workers: int = UNIVERSE_WORKERS) -> Iterator[dict]:
+        """Analyze many symbols concurrently, yielding each result as soon as it finishes.
+
+        Per-upstream limits (UPSTREAM_LIMITS) and the shared Finnhub rate limiter
+        still apply, so more workers only overlap waits on different services.
+        """
+        # One batched sentiment pass up front so per-symbol pipelines hit the cache
+        self.fetch_news_sentiment(symbols)
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="market-analyst")
+        try:
+            futures = {executor.submit(self.analyze_stock, symbol): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # A consumer that stops early should not leave queued symbols running
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,8 +1,7 @@
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
 from pydantic import BaseModel, Field
-from utils.config import GROQ_API_KEY
-import json
+from utils.clients import get_chat_model
+from utils.json_extract import extract_json
 import re
 from utils.logger import logger
 from langchain_core.exceptions import LangChainException
@@ -18,7 +17,7 @@ class InvestmentPersona(BaseModel):
 class PreferenceParserAgent:
     def __init__(self):
         try:
-            self.llm = ChatGroq(model_name="llama-3.1-8b-instant", api_key=GROQ_API_KEY)
+            self.llm = get_chat_model("llama-3.1-8b-instant")
         except Exception as e:
             logger.error(f"Failed to initialize ChatGroq: {str(e)}")
             raise
@@ -94,9 +93,10 @@ Output the investment persona as a valid JSON object.
             logger.info(f"Normalized input: {text}")
 
             # Call LLM with retry
+            formatted_prompt = prompt.format(text=text)
             for attempt in range(3):
                 try:
-                    response = self.llm.invoke(prompt.format(text=text))
+                    response = self.llm.invoke(formatted_prompt)
                     raw_response = response.content
                     logger.debug(f"Raw LLM response (attempt {attempt + 1}): {raw_response}")
                     break
@@ -114,9 +114,10 @@ Output the investment persona as a valid JSON object.
                 return defaults
 
             # Extract JSON
-            json_match = re.search(r'\{[\s\S]*\}', raw_response)
-            if not json_match:
+            preferences_json = extract_json(raw_response, openers="{")
+            if preferences_json is None:
                 logger.error(f"No valid JSON found in response: {raw_response}")
+                self.llm.forget(formatted_prompt)
                 # Fallback: Manual parsing
                 preferences = defaults.copy()
                 if "safe" in text or "secure" in text or "cautious" in text:
@@ -150,16 +151,7 @@ Output the investment persona as a valid JSON object.
                 logger.info(f"Fallback preferences: {preferences}")
                 return preferences
 
-            cleaned_response = json_match.group(0)
-            logger.debug(f"Extracted JSON: {cleaned_response}")
-
-            # Parse JSON
-            try:
-                preferences_json = json.loads(cleaned_response)
-                logger.debug(f"Parsed JSON: {preferences_json}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse LLM response as JSON: {raw_response}, Error: {str(e)}")
-                return defaults
+            logger.debug(f"Parsed JSON: {preferences_json}")
 
             # Validate with Pydantic
             try:
@@ -168,6 +160,7 @@ Output the investment persona as a valid JSON object.
                 return preferences.dict()
             except ValueError as e:
                 logger.error(f"Pydantic validation error: {str(e)}, Parsed JSON: {preferences_json}")
+                self.llm.forget(formatted_prompt)
                 return defaults
 
         except Exception as e:
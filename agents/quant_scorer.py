@@ -0,0 +1,239 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import json
+import math
+
+import numpy as np
+
+from data.price_history import get_close_matrix
+from utils.json_extract import extract_json
+from utils.logger import logger
+
+FACTORS = ("valuation", "momentum", "volatility", "sentiment")
+TRADING_DAYS = 252
+MOMENTUM_DAYS = 126      # ~6 months of closes
+VOLATILITY_DAYS = 63     # ~3 months of daily returns
+MIN_RETURNS = 20         # fewer returns than this and volatility is treated as unknown
+DEFAULT_VOLATILITY = 0.30
+MAX_POSITIONS = 3
+SCORE_SCALE = 2.0        # steepness of the composite -> 0-100 score mapping
+Z_CLIP = 3.0
+
+# Base factor weights per risk appetite; higher "volatility" weight favours calmer stocks
+RISK_WEIGHTS = {
+    "low":    {"valuation": 0.35, "momentum": 0.10, "volatility": 0.40, "sentiment": 0.15},
+    "medium": {"valuation": 0.30, "momentum": 0.25, "volatility": 0.25, "sentiment": 0.20},
+    "high":   {"valuation": 0.20, "momentum": 0.45, "volatility": 0.10, "sentiment": 0.25},
+}
+RISK_ALIASES = {"conservative": "low", "moderate": "medium", "aggressive": "high"}
+STYLE_TILTS = {"value": {"valuation": 0.15}, "growth": {"momentum": 0.15}, "index": {"volatility": 0.10}}
+GOAL_TILTS = {"income": {"valuation": 0.05, "volatility": 0.10}, "retirement": {"volatility": 0.10},
+              "growth": {"momentum": 0.10}}
+HORIZON_TILTS = {"short": {"momentum": 0.05, "sentiment": 0.10}, "long": {"valuation": 0.10}}
+# Largest share of the investment amount one position may take
+MAX_POSITION_FRACTION = {"low": 0.35, "medium": 0.45, "high": 0.60}
+SENTIMENT_VALUES = {"Positive": 1.0, "Neutral": 0.0, "Negative": -1.0}
+
+
+def _zscore(values: np.ndarray) -> np.ndarray:
+    """Cross-sectional z-scores; missing values score as average (0)."""
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    z = np.zeros_like(values)
+    if valid.sum() > 1:
+        std = values[valid].std()
+        if std > 0:
+            z[valid] = (values[valid] - values[valid].mean()) / std
+    return np.clip(z, -Z_CLIP, Z_CLIP)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+@dataclass(frozen=True)
+class FactorScores:
+    symbols: List[str]
+    factors: np.ndarray      # (symbols, FACTORS) z-scores, higher is better
+    weights: np.ndarray      # (FACTORS,) preference weights, summing to 1
+    composite: np.ndarray
+    scores: np.ndarray       # 0-100 integers
+    volatility: np.ndarray   # annualized, DEFAULT_VOLATILITY where unknown
+
+
+class QuantScorer:
+    """Rank a universe by preference-weighted factors and size positions, without an LLM."""
+
+    def __init__(self, max_positions: int = MAX_POSITIONS):
+        self.max_positions = max_positions
+
+    def _risk_level(self, preferences: Dict) -> str:
+        risk = str(preferences.get("risk_appetite") or preferences.get("risk_profile") or "medium").lower()
+        risk = RISK_ALIASES.get(risk, risk)
+        return risk if risk in RISK_WEIGHTS else "medium"
+
+    def factor_weights(self, preferences: Dict) -> np.ndarray:
+        weights = dict(RISK_WEIGHTS[self._risk_level(preferences)])
+        for tilts, key in ((STYLE_TILTS, "investment_style"), (GOAL_TILTS, "investment_goals"),
+                           (HORIZON_TILTS, "time_horizon")):
+            for factor, tilt in tilts.get(str(preferences.get(key, "")).lower(), {}).items():
+                weights[factor] += tilt
+        vector = np.array([weights[factor] for factor in FACTORS])
+        return vector / vector.sum()
+
+    def load_closes(self, symbols: List[str]) -> Optional[np.ndarray]:
+        """Recent daily closes (days, symbols) from stored price history, or None if unavailable."""
+        start = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=int(MOMENTUM_DAYS * 1.6))
+        try:
+            _, closes = get_close_matrix(symbols, start=start)
+            return closes if len(closes) else None
+        except Exception as e:
+            logger.error(f"Quant scorer could not load price history: {str(e)}")
+            return None
+
+    def score(self, market_data: List[Dict], preferences: Dict,
+              closes: Optional[np.ndarray] = None) -> FactorScores:
+        """Score every symbol in `market_data` (analyze_stock-style dicts).
+
+        `closes` is a (days, symbols) matrix in the same symbol order; it is
+        loaded from price history when omitted.
+        """
+        symbols = [item["symbol"].upper() for item in market_data]
+        if closes is None:
+            closes = self.load_closes(symbols)
+
+        pe = np.array([_to_float(item.get("pe_ratio")) for item in market_data])
+        debt = np.array([_to_float(item.get("debt_to_equity")) for item in market_data])
+        # Earnings yield ranks loss makers (negative P/E) below every profitable company
+        earnings_yield = np.divide(1.0, pe, out=np.full_like(pe, np.nan), where=np.isfinite(pe) & (pe != 0))
+        leverage = -np.log1p(np.where(debt >= 0, debt, np.nan))
+        valuation = np.nanmean(np.vstack([_zscore(earnings_yield), _zscore(leverage)]), axis=0)
+
+        momentum = np.full(len(symbols), np.nan)
+        volatility = np.full(len(symbols), np.nan)
+        if closes is not None and len(closes) > 1:
+            window = closes[-(MOMENTUM_DAYS + 1):]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                momentum = np.log(window[-1] / window[0])
+                returns = np.diff(np.log(closes[-(VOLATILITY_DAYS + 1):]), axis=0)
+            counts = np.isfinite(returns).sum(axis=0)
+            with np.errstate(invalid="ignore"):
+                volatility = np.where(counts >= MIN_RETURNS, np.nanstd(returns, axis=0) * math.sqrt(TRADING_DAYS), np.nan)
+
+        sentiment = np.array([
+            _to_float(item["sentiment_score"]) if item.get("sentiment_score") is not None
+            else SENTIMENT_VALUES.get(item.get("news_sentiment"), np.nan)
+            for item in market_data
+        ])
+
+        factors = np.column_stack([_zscore(valuation), _zscore(momentum), _zscore(-volatility), _zscore(sentiment)])
+        weights = self.factor_weights(preferences)
+        composite = factors @ weights
+        scores = np.rint(100 / (1 + np.exp(-SCORE_SCALE * composite))).astype(int)
+        known = np.isfinite(volatility)
+        fallback = float(np.median(volatility[known])) if known.any() else DEFAULT_VOLATILITY
+        return FactorScores(symbols, factors, weights, composite, scores, np.where(known, volatility, fallback))
+
+    def _position_weights(self, scores: np.ndarray, volatility: np.ndarray, cap: float) -> np.ndarray:
+        """Conviction over risk, normalized and capped; whatever the caps leave over stays in cash."""
+        raw = scores / np.maximum(volatility, 1e-6)
+        weights = raw / raw.sum()
+        for _ in range(len(weights)):
+            over = weights > cap
+            if not over.any():
+                break
+            excess = (weights[over] - cap).sum()
+            weights[over] = cap
+            under = weights < cap
+            if not under.any():
+                break
+            weights[under] += excess * weights[under] / weights[under].sum()
+        return np.minimum(weights, cap)
+
+    def recommend(self, preferences: Dict, market_data: List[Dict],
+                  closes: Optional[np.ndarray] = None) -> List[Dict]:
+        """Top-ranked Buy recommendations in the usual recommendation schema."""
+        usable = [i for i, item in enumerate(market_data) if _to_float(item.get("price", item.get("current_price"))) > 0]
+        if not usable:
+            logger.error("Quant scorer received no symbols with a usable price")
+            return []
+        items = [market_data[i] for i in usable]
+        if closes is not None:
+            closes = closes[:, usable]
+        scored = self.score(items, preferences, closes)
+
+        order = np.argsort(-scored.composite, kind="stable")[:self.max_positions]
+        cap = MAX_POSITION_FRACTION[self._risk_level(preferences)]
+        weights = self._position_weights(scored.scores[order].astype(float), scored.volatility[order], cap)
+        investment_amount = _to_float(preferences.get("investment_amount")) or 0.0
+
+        recommendations = []
+        for rank, weight in zip(order, weights):
+            item = items[rank]
+            price = _to_float(item.get("price", item.get("current_price")))
+            quantity = math.floor(investment_amount * weight / price * 100) / 100  # 2 decimal places
+            if quantity <= 0:
+                continue
+            factors = {name: round(float(value), 2) for name, value in zip(FACTORS, scored.factors[rank])}
+            weakest = min(factors, key=factors.get)
+            recommendations.append({
+                "Symbol": scored.symbols[rank],
+                "Company": item.get("company") or scored.symbols[rank],
+                "Action": "Buy",
+                "Quantity": quantity,
+                "CurrentPrice": price,
+                "TotalCost": round(quantity * price, 2),
+                "Reason": (f"Ranked {len(recommendations) + 1} of {len(items)} on preference-weighted factors "
+                           f"(valuation {factors['valuation']:+.2f}, momentum {factors['momentum']:+.2f}, "
+                           f"low volatility {factors['volatility']:+.2f}, sentiment {factors['sentiment']:+.2f})."),
+                "Caution": (f"Weakest factor is {weakest} ({factors[weakest]:+.2f}); "
+                            f"annualized volatility about {scored.volatility[rank] * 100:.0f}%."),
+                "NewsSentiment": item.get("news_sentiment") if item.get("news_sentiment") in SENTIMENT_VALUES else "Neutral",
+                "Score": int(scored.scores[rank]),
+                "Factors": factors,
+                "Weight": round(float(weight), 4),
+            })
+        return recommendations
+
+
+def write_narrative(llm, recommendations: List[Dict], preferences: Dict) -> Tuple[List[Dict], str]:
+    """Have the LLM write Reason/Caution text and insights for fixed recommendations.
+
+    Symbols, quantities and scores are never taken from the response; on any
+    failure the templated text from QuantScorer is kept.
+    """
+    if not recommendations:
+        return recommendations, ""
+    summary = [{key: rec[key] for key in ("Symbol", "Company", "Quantity", "TotalCost", "Score", "Factors", "NewsSentiment")}
+               for rec in recommendations]
+    prompt = f"""You are an investment advisor explaining recommendations that were already chosen by a quantitative model.
+
+User Preferences: {json.dumps(preferences, default=str)}
+Recommendations (factor values are cross-sectional z-scores; higher is better): {json.dumps(summary, default=str)}
+
+Do not change any symbol, quantity or score. For each recommendation write a Reason (2-3 sentences tying
+the factors to the user's preferences) and a Caution (1 sentence), then a short overall insight.
+Return only JSON: {{"recommendations": [{{"Symbol": "...", "Reason": "...", "Caution": "..."}}], "insights": "..."}}
+"""
+    try:
+        narrative = extract_json(llm.invoke(prompt).content, default={}, openers="{")
+    except Exception as e:
+        logger.error(f"Failed to write recommendation narrative: {str(e)}")
+        narrative = {}
+
+    texts = {str(item.get("Symbol", "")).upper(): item for item in narrative.get("recommendations", [])
+             if isinstance(item, dict)}
+    narrated = []
+    for rec in recommendations:
+        text = texts.get(rec["Symbol"], {})
+        narrated.append({
+            **rec,
+            "Reason": text.get("Reason") or rec["Reason"],
+            "Caution": text.get("Caution") or rec["Caution"],
+        })
+    insights = narrative.get("insights") or "Recommendations ranked by valuation, momentum, volatility and news sentiment."
+    return narrated, insights
@@ -1,18 +1,52 @@
 from decimal import Decimal
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY
+from utils.clients import get_chat_model
+from utils.json_extract import ArrayItemStream, extract_json
 from utils.logger import logger
-from typing import List, Dict, Tuple
+from data.price_snapshot import PriceSnapshot
+from simulation.monte_carlo import RiskProjection, project_portfolio
+from typing import Iterator, List, Dict, Tuple, Optional
 import json
 import time
 import decimal
 import math
-import re
+
+THOUGHT_MARKER = "Inner Monologue:"
+THINKING_FALLBACK = (
+    "Inner Monologue:\n    Unable to generate detailed thinking process due to technical error.",
+    "Inner Monologue:\n    Proceeding with basic analysis based on available data."
+)
+
+REQUIRED_RECOMMENDATION_FIELDS = {
+    "Symbol": "",
+    "Company": "Unknown Company",
+    "Action": "None",
+    "Quantity": 0,
+    "CurrentPrice": 0.0,
+    "TotalCost": 0.0,
+    "Reason": "No reason provided",
+    "Caution": "No caution provided",
+    "NewsSentiment": "Neutral",
+    "Score": 0
+}
+ERROR_RECOMMENDATION = {
+    "Symbol": "ERROR",
+    "Company": "Error in Recommendation",
+    "Action": "None",
+    "Quantity": 0,
+    "CurrentPrice": 0.0,
+    "TotalCost": 0.0,
+    "Reason": "Failed to generate valid recommendation",
+    "Caution": "Please try again",
+    "NewsSentiment": "Neutral",
+    "Score": 0
+}
+
+
 
 class ReasoningAgent:
     def __init__(self):
         # Using deepseek-coder for better reasoning capabilities
-        self.llm = ChatGroq(model_name="llama-3.3-70b-versatile", api_key=GROQ_API_KEY)
+        self.llm = get_chat_model("llama-3.3-70b-versatile")
         #self.llm = ChatGroq(model_name="deepseek-r1-distill-llama-70b", api_key=GROQ_API_KEY)
         # Define allowed stocks
         self.ALLOWED_STOCKS = [
@@ -55,124 +89,39 @@ class ReasoningAgent:
             logger.error(f"Error in numeric operation: {str(e)}")
             return 0.0
 
-    def _get_current_price(self, symbol: str) -> float:
-        """Get current price for a symbol, handling different data types."""
+    def _get_current_price(self, symbol: str, snapshot: Optional[PriceSnapshot] = None) -> float:
+        """Get current price for a symbol from the run's price snapshot."""
         try:
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
-            price_data = stock_data.get(symbol, {})
-            current_price = price_data.get("current_price", 0.0)
-            return self._convert_to_float(current_price)
+            if snapshot is None:
+                snapshot = PriceSnapshot.capture()
+            return self._convert_to_float(snapshot.price(symbol))
         except Exception as e:
             logger.error(f"Error fetching price for {symbol}: {str(e)}")
             return 0.0
 
-    def _parse_json_response(self, response: str) -> Dict:
-        """Safely parse JSON response from the model."""
-        try:
-            # First try direct JSON parsing
-            return json.loads(response)
-        except json.JSONDecodeError:
-            try:
-                # Clean up common issues in the response
-                cleaned_response = response
-                
-                # Remove any markdown code block markers
-                cleaned_response = re.sub(r'```json\s*|\s*```', '', cleaned_response)
-                
-                # Try to find the first complete JSON object
-                start_idx = cleaned_response.find('{')
-                if start_idx != -1:
-                    # Track brackets to find matching end
-                    stack = []
-                    in_string = False
-                    escape_char = False
-                    
-                    for i in range(start_idx, len(cleaned_response)):
-                        char = cleaned_response[i]
-                        
-                        # Handle escape characters
-                        if char == '\\' and not escape_char:
-                            escape_char = True
-                            continue
-                        
-                        # Handle strings
-                        if char == '"' and not escape_char:
-                            in_string = not in_string
-                        
-                        # Track brackets only when not in a string
-                        if not in_string:
-                            if char == '{':
-                                stack.append(char)
-                            elif char == '}':
-                                if stack:
-                                    stack.pop()
-                                    # If we've found the matching end brace
-                                    if not stack:
-                                        try:
-                                            json_str = cleaned_response[start_idx:i+1]
-                                            parsed = json.loads(json_str)
-                                            logger.info("Successfully parsed JSON after cleanup")
-                                            return parsed
-                                        except json.JSONDecodeError:
-                                            logger.warning("Failed to parse extracted JSON object")
-                                            # Continue searching in case there are more JSON objects
-                                            continue
-                        
-                        escape_char = False
-                
-                # If we haven't found a valid JSON object yet, try a more aggressive cleanup
-                # Remove all whitespace and newlines outside of strings
-                cleaned_response = re.sub(r'\s+(?=(?:[^"]*"[^"]*")*[^"]*$)', '', cleaned_response)
-                
-                # Try one more time with the aggressively cleaned response
-                try:
-                    start_idx = cleaned_response.find('{')
-                    end_idx = cleaned_response.rfind('}')
-                    if start_idx != -1 and end_idx != -1:
-                        json_str = cleaned_response[start_idx:end_idx + 1]
-                        return json.loads(json_str)
-                except:
-                    pass
-                
-                # If all else fails, create a basic structure
-                logger.warning("Could not parse JSON response, creating basic structure")
-                return {
-                    "error": "Failed to parse response",
-                    "raw_response": response,
-                    "recommendations": [],
-                    "insights": "Analysis failed to generate valid insights.",
-                    "market_analysis": {},
-                    "investment_strategy": {}
-                }
-            except Exception as e:
-                logger.error(f"Failed to parse JSON response: {str(e)}")
-                return {
-                    "error": "Failed to parse response",
-                    "raw_response": response,
-                    "recommendations": [],
-                    "insights": "Analysis failed to generate valid insights.",
-                    "market_analysis": {},
-                    "investment_strategy": {}
-                }
-
-    def _get_thinking_process(self, preferences: Dict) -> List[str]:
-        """Capture the model's inner thought process with detailed numerical analysis."""
-        # Get current price data for calculations
-        try:
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
-        except Exception as e:
-            logger.error(f"Failed to fetch stock prices for thinking process: {str(e)}")
-            stock_data = {}
+    def _parse_json_response(self, response: str, prompt=None) -> Dict:
+        """Safely parse JSON response from the model.
 
-        # Convert and validate investment amount
-        investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
-        
-        # Handle risk profile
-        risk_profile = preferences.get('risk_profile', 'moderate').lower()
-        
-        # Convert time horizon string to years
+        If `prompt` is given and the response is unusable, its cached reply is
+        dropped so a retry asks the model again.
+        """
+        parsed = extract_json(response, openers="{")
+        if parsed is not None:
+            return parsed
+        logger.warning("Could not parse JSON response, creating basic structure")
+        if prompt is not None:
+            self.llm.forget(prompt)
+        return {
+            "error": "Failed to parse response",
+            "raw_response": response,
+            "recommendations": [],
+            "insights": "Analysis failed to generate valid insights.",
+            "market_analysis": {},
+            "investment_strategy": {}
+        }
+
+    def _parse_time_horizon(self, preferences: Dict) -> int:
+        """Convert the time horizon preference to whole years between 1 and 30."""
         time_horizon_input = str(preferences.get('time_horizon', 'medium')).lower()
         time_horizon_mapping = {
             'short': 2,
@@ -188,7 +137,49 @@ class ReasoningAgent:
             time_horizon = time_horizon_mapping.get(time_horizon_input, 5)  # Default to 5 years if not found
         
         # Validate time horizon is within reasonable bounds
-        time_horizon = max(1, min(30, time_horizon))  # Limit between 1 and 30 years
+        return max(1, min(30, time_horizon))  # Limit between 1 and 30 years
+
+    def get_risk_projection(self, preferences: Dict, snapshot: PriceSnapshot,
+                            holdings: Optional[Dict[str, float]] = None,
+                            trades: Optional[List[Dict]] = None) -> Optional[RiskProjection]:
+        """Monte Carlo projection of current dollar holdings plus new money.
+
+        With `trades` (recommendations) the new money follows them; otherwise the
+        investment amount is spread evenly over the allowed stocks as a baseline.
+        Returns None when there is not enough price history.
+        """
+        investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
+        portfolio = dict(holdings or {})
+        cash = 0.0
+        if trades:
+            spent = 0.0
+            for trade in trades:
+                symbol = trade.get("Symbol")
+                amount = self._convert_to_float(trade.get("Quantity", 0)) * (
+                    self._convert_to_float(trade.get("CurrentPrice", 0)) or snapshot.price(symbol))
+                if str(trade.get("Action", "Buy")).lower() == "sell":
+                    amount = -min(amount, portfolio.get(symbol, 0.0))
+                portfolio[symbol] = portfolio.get(symbol, 0.0) + amount
+                spent += amount
+            cash = max(investment_amount - spent, 0.0)
+        elif investment_amount > 0:
+            per_stock = investment_amount / len(self.ALLOWED_STOCKS)
+            for symbol in self.ALLOWED_STOCKS:
+                portfolio[symbol] = portfolio.get(symbol, 0.0) + per_stock
+        return project_portfolio(portfolio, self._parse_time_horizon(preferences), cash=cash)
+
+    def _build_thinking_prompt(self, preferences: Dict, snapshot: PriceSnapshot,
+                               holdings: Optional[Dict[str, float]] = None) -> str:
+        """Prompt for the inner monologue, with the numbers it should reason about filled in."""
+
+        # Convert and validate investment amount
+        investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
+        
+        # Handle risk profile
+        risk_profile = preferences.get('risk_profile', 'moderate').lower()
+        
+        time_horizon_input = str(preferences.get('time_horizon', 'medium')).lower()
+        time_horizon = self._parse_time_horizon(preferences)
         
         # Calculate risk-adjusted returns based on time horizon
         # Shorter time horizons should be more conservative
@@ -245,12 +236,38 @@ class ReasoningAgent:
         
         # Get volatility levels for the selected risk profile
         volatility_levels = base_volatility.get(risk_profile, base_volatility['moderate'])
+        drawdown_ratio = volatility_levels['yearly'] * 1.5
+
+        # Prefer simulated outcomes from price history over the fixed tables above
+        projection = self.get_risk_projection(preferences, snapshot, holdings)
+        if projection is not None and projection.annual_volatility > 0:
+            volatility_levels = {
+                'daily': projection.annual_volatility / math.sqrt(252),
+                'monthly': projection.annual_volatility / math.sqrt(12),
+                'yearly': projection.annual_volatility
+            }
+            drawdown_ratio = projection.median_max_drawdown
         
         # Calculate risk metrics
         daily_risk = investment_amount * volatility_levels['daily']
         monthly_risk = investment_amount * volatility_levels['monthly']
         yearly_risk = investment_amount * volatility_levels['yearly']
-        max_drawdown = investment_amount * volatility_levels['yearly'] * 1.5
+        max_drawdown = investment_amount * drawdown_ratio
+
+        if projection is not None:
+            bands = projection.final_bands
+            projection_section = f"""2. Risk-Return Projections ({time_horizon} years, {projection.n_paths:,} simulated paths from price history):
+   - Starting value: ${projection.initial_value:.2f}
+   - Pessimistic (5th percentile): ${bands[5]:.2f}
+   - Median: ${bands[50]:.2f}
+   - Optimistic (95th percentile): ${bands[95]:.2f}
+   - Probability of loss: {projection.prob_loss*100:.1f}%
+   - 95% Value at Risk: ${projection.value_at_risk:.2f}, expected shortfall: ${projection.expected_shortfall:.2f}"""
+        else:
+            projection_section = f"""2. Risk-Return Projections ({time_horizon} years):
+   - Conservative ({conservative_return*100:.1f}%/year): ${investment_amount:.2f} → ${conservative_fv:.2f}
+   - Moderate ({moderate_return*100:.1f}%/year): ${investment_amount:.2f} → ${moderate_fv:.2f}
+   - Aggressive ({aggressive_return*100:.1f}%/year): ${investment_amount:.2f} → ${aggressive_fv:.2f}"""
         
         # Calculate position sizing tiers
         core_position = max_single_stock_amount * 0.5     # 50% of max allocation
@@ -264,7 +281,7 @@ Available Investment Amount: ${investment_amount:.2f}
 Time Horizon: {time_horizon} years ({time_horizon_input})
 
 Current Market Data:
-{json.dumps({symbol: {"price": data.get("current_price", 0.0)} for symbol, data in stock_data.items()}, indent=2)}
+{json.dumps(snapshot.to_prompt_data(), indent=2)}
 
 I want you to think through this investment scenario in great detail, sharing your complete thought process with specific numerical calculations and practical considerations. Format your response as a detailed stream of consciousness, with each thought starting with "🤔 Inner Monologue: ".
 
@@ -275,16 +292,13 @@ Consider and explicitly state your thinking about:
    - Risk-adjusted position sizes based on {risk_profile} profile and {time_horizon} year horizon
    - Time horizon factor: {time_horizon_factor:.2f}x base allocation
 
-2. Risk-Return Projections ({time_horizon} years):
-   - Conservative ({conservative_return*100:.1f}%/year): ${investment_amount:.2f} → ${conservative_fv:.2f}
-   - Moderate ({moderate_return*100:.1f}%/year): ${investment_amount:.2f} → ${moderate_fv:.2f}
-   - Aggressive ({aggressive_return*100:.1f}%/year): ${investment_amount:.2f} → ${aggressive_fv:.2f}
+{projection_section}
 
 3. Volatility Analysis ({risk_profile} profile):
    - Daily volatility: ±${daily_risk:.2f} (±{volatility_levels['daily']*100:.1f}% of ${investment_amount:.2f})
    - Monthly volatility: ±${monthly_risk:.2f} (±{volatility_levels['monthly']*100:.1f}%)
    - Yearly volatility: ±${yearly_risk:.2f} (±{volatility_levels['yearly']*100:.1f}%)
-   - Maximum drawdown protection: -${max_drawdown:.2f} (-{volatility_levels['yearly']*100*1.5:.1f}%)
+   - Maximum drawdown protection: -${max_drawdown:.2f} (-{drawdown_ratio*100:.1f}%)
 
 4. Position Sizing and Risk Management:
    - Core position: ${core_position:.2f} (50% of max)
@@ -299,7 +313,7 @@ Inner Monologue: Risk analysis for {risk_profile} profile:
 - Daily moves: ${investment_amount:.2f} × ±{volatility_levels['daily']*100:.1f}% = ±${daily_risk:.2f}
 - Monthly swings: ${investment_amount:.2f} × ±{volatility_levels['monthly']*100:.1f}% = ±${monthly_risk:.2f}
 - Yearly volatility: ${investment_amount:.2f} × ±{volatility_levels['yearly']*100:.1f}% = ±${yearly_risk:.2f}
-- Maximum drawdown: ${investment_amount:.2f} × {volatility_levels['yearly']*100*1.5:.1f}% = ${max_drawdown:.2f}
+- Maximum drawdown: ${investment_amount:.2f} × {drawdown_ratio*100:.1f}% = ${max_drawdown:.2f}
 
 Inner Monologue: Position sizing for {risk_profile} strategy:
 - Core position: ${core_position:.2f} (50% of max)
@@ -323,66 +337,75 @@ Make each thought extremely detailed and show your mathematical reasoning. Inclu
 
 Return ONLY the list of thoughts, with each starting with "Inner Monologue: " and containing detailed numerical analysis.
 """
+        return thinking_prompt
+
+    def _format_thought(self, thought: str) -> str:
+        """Lay out one inner-monologue thought for display."""
+        # Clean up any extra whitespace and normalize line breaks
+        lines = [line.strip() for line in thought.split('\n')]
+        lines = [line for line in lines if line]  # Remove empty lines
+        
+        # Format calculations and lists with proper indentation
+        formatted_lines = []
+        for line in lines:
+            if line.startswith('-') or line.startswith('•'):
+                # Enhanced indentation for list items with better alignment
+                formatted_lines.append(f"    ➤ {line[1:].strip()}")
+            elif ':' in line and not line.startswith('http'):
+                # Enhanced formatting for key-value pairs
+                key, value = line.split(':', 1)
+                formatted_lines.append(f"{key.strip()}: {value.strip()}")
+            else:
+                formatted_lines.append(line)
+        
+        # Join lines with proper spacing and add decorative elements
+        formatted_thought = '\n'.join(formatted_lines)
+        
+        # Add the thought prefix with enhanced formatting
+        return f"Inner Monologue:\n{'='*50}\n{formatted_thought}\n{'='*50}"
+
+    def _get_thinking_process(self, preferences: Dict, snapshot: Optional[PriceSnapshot] = None,
+                              holdings: Optional[Dict[str, float]] = None) -> List[str]:
+        """Capture the model's inner thought process with detailed numerical analysis."""
+        if snapshot is None:
+            snapshot = PriceSnapshot.capture()
+        thinking_prompt = self._build_thinking_prompt(preferences, snapshot, holdings)
 
         try:
             response = self.llm.invoke(thinking_prompt)
             # Split response into individual thoughts and clean them up
-            thoughts = [t.strip() for t in response.content.split('Inner Monologue:') if t.strip()]
-            
-            # Format each thought with proper indentation and line breaks
-            formatted_thoughts = []
-            for thought in thoughts:
-                # Clean up any extra whitespace and normalize line breaks
-                lines = [line.strip() for line in thought.split('\n')]
-                lines = [line for line in lines if line]  # Remove empty lines
-                
-                # Format calculations and lists with proper indentation
-                formatted_lines = []
-                for line in lines:
-                    if line.startswith('-') or line.startswith('•'):
-                        # Enhanced indentation for list items with better alignment
-                        formatted_lines.append(f"    ➤ {line[1:].strip()}")
-                    elif ':' in line and not line.startswith('http'):
-                        # Enhanced formatting for key-value pairs
-                        key, value = line.split(':', 1)
-                        formatted_lines.append(f"{key.strip()}: {value.strip()}")
-                    else:
-                        formatted_lines.append(line)
-                
-                # Join lines with proper spacing and add decorative elements
-                formatted_thought = '\n'.join(formatted_lines)
-                
-                # Add the thought prefix with enhanced formatting
-                formatted_thoughts.append(f"Inner Monologue:\n{'='*50}\n{formatted_thought}\n{'='*50}")
-            
-            # Add extra line break between thoughts for better readability
-            return formatted_thoughts
+            thoughts = [t.strip() for t in response.content.split(THOUGHT_MARKER) if t.strip()]
+            return [self._format_thought(thought) for thought in thoughts]
         except Exception as e:
             logger.error(f"Failed to generate thinking process: {str(e)}")
-            return [
-                "Inner Monologue:\n    Unable to generate detailed thinking process due to technical error.",
-                "Inner Monologue:\n    Proceeding with basic analysis based on available data."
-            ]
+            return list(THINKING_FALLBACK)
 
-    def analyze_investment_scenario(self, preferences: Dict, is_trade: bool = False) -> Tuple[List[Dict], str, List[str], List[str]]:
-        """
-        Perform a detailed analysis of the investment scenario with step-by-step reasoning.
-        Returns: (recommendations, insights, reasoning_steps, thinking_process)
-        """
-        reasoning_steps = []
-        thinking_process = self._get_thinking_process(preferences)
-        
+    def stream_thinking_process(self, preferences: Dict, snapshot: Optional[PriceSnapshot] = None,
+                                holdings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        """Yield each formatted thought as soon as the model has finished writing it."""
+        if snapshot is None:
+            snapshot = PriceSnapshot.capture()
+        thinking_prompt = self._build_thinking_prompt(preferences, snapshot, holdings)
+
+        buffer = ""
         try:
-            # Fetch current stock data
-            from scripts.fetch_stock_prices import fetch_stock_prices
-            stock_data = fetch_stock_prices()
-            
-            # Add investment amount to prompt for better quantity calculation
-            investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
-            reasoning_steps.append(f"Investment amount specified: ${investment_amount:.2f}")
-            
-            # Combined analysis prompt that includes initial analysis, market context, and recommendations
-            comprehensive_prompt = f"""You are an expert investment advisor performing a detailed market analysis and generating recommendations.
+            for chunk in self.llm.stream(thinking_prompt):
+                buffer += chunk.content
+                # A thought is complete once the next one has started
+                *complete, buffer = buffer.split(THOUGHT_MARKER)
+                for thought in complete:
+                    if thought.strip():
+                        yield self._format_thought(thought.strip())
+            if buffer.strip():
+                yield self._format_thought(buffer.strip())
+        except Exception as e:
+            logger.error(f"Failed to stream thinking process: {str(e)}")
+            yield from THINKING_FALLBACK
+
+    def _build_analysis_prompt(self, preferences: Dict, stock_data: Dict[str, Dict],
+                               investment_amount: float, research_section: str = "") -> str:
+        """Combined prompt for market analysis, strategy and recommendations as one JSON object."""
+        return f"""You are an expert investment advisor performing a detailed market analysis and generating recommendations.
 
 IMPORTANT: You must return ONLY a valid JSON object with no additional text, comments, or explanations.
 ANY TEXT OUTSIDE THE JSON OBJECT WILL CAUSE ERRORS.
@@ -398,7 +421,7 @@ Input Parameters:
 - Investment Budget: ${investment_amount:.2f} - **ABSOLUTE MAXIMUM**
 - Current Market Data: {json.dumps({symbol: {"price": data.get("current_price", 0.0)} for symbol, data in stock_data.items()}, indent=2)}
 - Allowed Stocks: {json.dumps(self.ALLOWED_STOCKS)}
-**BUDGET ENFORCEMENT RULES:**
+{research_section}**BUDGET ENFORCEMENT RULES:**
 1. Calculate total cost for each recommendation: Quantity × CurrentPrice
 2. If total cost > ${investment_amount:.2f}, reduce quantity or exclude
 3. Never recommend more than the user can afford
@@ -571,144 +594,192 @@ REQUIREMENTS:
 The response must be a single, valid JSON object that can be parsed by json.loads().
 """
 
-            response = self.llm.invoke(comprehensive_prompt)
-            complete_analysis = self._parse_json_response(response.content)
-
-            # Extract components from the comprehensive analysis
-            recommendations = complete_analysis.get("recommendations", [])
-            insights = complete_analysis.get("insights", "Analysis failed to generate insights.")
+    def _validate_recommendation(self, rec: Dict, investment_amount: float,
+                                 snapshot: PriceSnapshot) -> Optional[Dict]:
+        """Normalize one model recommendation against the snapshot and budget, or None if unusable."""
+        try:
+            # Create a new recommendation with all required fields
+            validated_rec = {field: rec.get(field, default) for field, default in REQUIRED_RECOMMENDATION_FIELDS.items()}
             
-            # Validate recommendations
-            validated_recommendations = []
-            required_fields = {
-                "Symbol": "",
-                "Company": "Unknown Company",
-                "Action": "None",
-                "Quantity": 0,
-                "CurrentPrice": 0.0,
-                "TotalCost": 0.0,
-                "Reason": "No reason provided",
-                "Caution": "No caution provided",
-                "NewsSentiment": "Neutral",
-                "Score": 0
-            }
+            # Convert numeric fields to proper types
+            try:
+                validated_rec["Score"] = int(float(str(validated_rec["Score"]).replace(',', '')))
+                validated_rec["Quantity"] = self._convert_to_float(validated_rec["Quantity"])
+                validated_rec["CurrentPrice"] = self._convert_to_float(validated_rec["CurrentPrice"])
+                validated_rec["TotalCost"] = self._convert_to_float(validated_rec["TotalCost"])
+            except (ValueError, TypeError) as e:
+                logger.error(f"Error converting numeric fields: {str(e)}")
+                return None
             
-            for rec in recommendations:
-                try:
-                    # Create a new recommendation with all required fields
-                    validated_rec = {field: rec.get(field, default) for field, default in required_fields.items()}
-                    
-                    # Convert numeric fields to proper types
-                    try:
-                        validated_rec["Score"] = int(float(str(validated_rec["Score"]).replace(',', '')))
-                        validated_rec["Quantity"] = self._convert_to_float(validated_rec["Quantity"])
-                        validated_rec["CurrentPrice"] = self._convert_to_float(validated_rec["CurrentPrice"])
-                        validated_rec["TotalCost"] = self._convert_to_float(validated_rec["TotalCost"])
-                    except (ValueError, TypeError) as e:
-                        logger.error(f"Error converting numeric fields: {str(e)}")
-                        continue
-                    
-                    # Validate stock symbol
-                    if validated_rec["Symbol"] not in self.ALLOWED_STOCKS:
-                        logger.error(f"Model suggested invalid stock: {validated_rec['Symbol']}. Must be one of: {', '.join(self.ALLOWED_STOCKS)}")
-                        continue
-
-                    # Get current price and validate quantity
-                    current_price = self._get_current_price(validated_rec["Symbol"])
-                    quantity = validated_rec["Quantity"]
-                    total_cost = current_price * quantity
+            # Validate stock symbol
+            if validated_rec["Symbol"] not in self.ALLOWED_STOCKS:
+                logger.error(f"Model suggested invalid stock: {validated_rec['Symbol']}. Must be one of: {', '.join(self.ALLOWED_STOCKS)}")
+                return None
+
+            # Get current price and validate quantity
+            current_price = self._get_current_price(validated_rec["Symbol"], snapshot)
+            quantity = validated_rec["Quantity"]
+            total_cost = current_price * quantity
 
-                    if current_price <= 0:
-                        logger.error(f"Invalid price for {validated_rec['Symbol']}: {current_price}")
-                        continue
-
-                    if quantity <= 0:
-                        logger.error(f"Invalid quantity for {validated_rec['Symbol']}: {quantity}")
-                        continue
-
-                    if total_cost > investment_amount:
-                        # Adjust quantity to fit investment amount
-                        quantity = math.floor((investment_amount / current_price) * 100) / 100  # Round to 2 decimal places
-                        logger.info(f"Adjusted quantity for {validated_rec['Symbol']} from {validated_rec['Quantity']} to {quantity} to fit investment amount")
-
-                    # Update the recommendation with validated values
-                    validated_rec.update({
-                        "CurrentPrice": current_price,
-                        "TotalCost": total_cost,
-                        "Quantity": quantity
-                    })
-
-                    # Validate score and other fields after type conversion
-                    score = validated_rec["Score"]
-                    if not isinstance(score, (int, float)):
-                        logger.error(f"Invalid score type: {type(score)}")
-                        continue
-                        
-                    if not (0 <= score <= 100):
-                        logger.error(f"Score out of range: {score}")
-                        continue
-                        
-                    if validated_rec["Action"] not in ["Buy", "Sell"]:
-                        logger.error(f"Invalid action: {validated_rec['Action']}")
-                        continue
-                        
-                    if validated_rec["NewsSentiment"] not in ["Positive", "Negative", "Neutral"]:
-                        logger.error(f"Invalid sentiment: {validated_rec['NewsSentiment']}")
-                        continue
-                        
-                    validated_recommendations.append(validated_rec)
-                except Exception as e:
-                    logger.error(f"Error validating recommendation: {str(e)}")
-                    continue
-
-            if not validated_recommendations:
-                validated_recommendations = [{
-                    "Symbol": "ERROR",
-                    "Company": "Error in Recommendation",
-                    "Action": "None",
-                    "Quantity": 0,
-                    "CurrentPrice": 0.0,
-                    "TotalCost": 0.0,
-                    "Reason": "Failed to generate valid recommendation",
-                    "Caution": "Please try again",
-                    "NewsSentiment": "Neutral",
-                    "Score": 0
-                }]
-
-            # Update reasoning steps with enhanced formatting
-            reasoning_steps.extend([
-                "✨ Completed initial preference and risk assessment",
-                "📊 Analyzed market conditions and sector performance",
-                f"🎯 Generated {len(validated_recommendations)} validated recommendations"
-            ])
-            
-            for rec in validated_recommendations:
-                formatted_output = (
-                    f" {rec['Company']} ({rec['Symbol']})\n"
-                    f"{'='*50}\n"
-                    f"   Action: {rec['Action']}\n"
-                    f"   Current Price: ${rec['CurrentPrice']:.2f}\n"
-                    f"   Quantity: {rec['Quantity']}\n"
-                    f"   Total Cost: ${rec['TotalCost']:.2f}\n"
-                    f"   Reason: {rec['Reason']}\n"
-                    f"   Caution: {rec['Caution']}\n"
-                    f"   News Sentiment: {rec['NewsSentiment']}\n"
-                    f"   Score: {rec['Score']}/100\n"
-                    f"{'='*50}"
-                )
-                reasoning_steps.append(formatted_output)
+            if current_price <= 0:
+                logger.error(f"Invalid price for {validated_rec['Symbol']}: {current_price}")
+                return None
+
+            if quantity <= 0:
+                logger.error(f"Invalid quantity for {validated_rec['Symbol']}: {quantity}")
+                return None
+
+            if total_cost > investment_amount:
+                # Adjust quantity to fit investment amount
+                quantity = math.floor((investment_amount / current_price) * 100) / 100  # Round to 2 decimal places
+                logger.info(f"Adjusted quantity for {validated_rec['Symbol']} from {validated_rec['Quantity']} to {quantity} to fit investment amount")
+
+            # Update the recommendation with validated values
+            validated_rec.update({
+                "CurrentPrice": current_price,
+                "TotalCost": total_cost,
+                "Quantity": quantity
+            })
+
+            # Validate score and other fields after type conversion
+            score = validated_rec["Score"]
+            if not isinstance(score, (int, float)):
+                logger.error(f"Invalid score type: {type(score)}")
+                return None
+                
+            if not (0 <= score <= 100):
+                logger.error(f"Score out of range: {score}")
+                return None
+                
+            if validated_rec["Action"] not in ["Buy", "Sell"]:
+                logger.error(f"Invalid action: {validated_rec['Action']}")
+                return None
+                
+            if validated_rec["NewsSentiment"] not in ["Positive", "Negative", "Neutral"]:
+                logger.error(f"Invalid sentiment: {validated_rec['NewsSentiment']}")
+                return None
+                
+            return validated_rec
+        except Exception as e:
+            logger.error(f"Error validating recommendation: {str(e)}")
+            return None
+
+    def _format_recommendation_step(self, rec: Dict) -> str:
+        return (
+            f" {rec['Company']} ({rec['Symbol']})\n"
+            f"{'='*50}\n"
+            f"   Action: {rec['Action']}\n"
+            f"   Current Price: ${rec['CurrentPrice']:.2f}\n"
+            f"   Quantity: {rec['Quantity']}\n"
+            f"   Total Cost: ${rec['TotalCost']:.2f}\n"
+            f"   Reason: {rec['Reason']}\n"
+            f"   Caution: {rec['Caution']}\n"
+            f"   News Sentiment: {rec['NewsSentiment']}\n"
+            f"   Score: {rec['Score']}/100\n"
+            f"{'='*50}"
+        )
+
+    def _finish_analysis(self, response: str, investment_amount: float, snapshot: PriceSnapshot,
+                         reasoning_steps: List[str]) -> Tuple[List[Dict], str]:
+        """Parse the complete model response into validated recommendations and insights."""
+        complete_analysis = self._parse_json_response(response)
+
+        # Extract components from the comprehensive analysis
+        recommendations = complete_analysis.get("recommendations", [])
+        insights = complete_analysis.get("insights", "Analysis failed to generate insights.")
+
+        validated_recommendations = [
+            validated for validated in (self._validate_recommendation(rec, investment_amount, snapshot)
+                                        for rec in recommendations)
+            if validated is not None
+        ]
+        if not validated_recommendations:
+            validated_recommendations = [dict(ERROR_RECOMMENDATION)]
+
+        # Update reasoning steps with enhanced formatting
+        reasoning_steps.extend([
+            "✨ Completed initial preference and risk assessment",
+            "📊 Analyzed market conditions and sector performance",
+            f"🎯 Generated {len(validated_recommendations)} validated recommendations"
+        ])
+        reasoning_steps.extend(self._format_recommendation_step(rec) for rec in validated_recommendations)
+        reasoning_steps.extend([
+            " Validated investment amounts and share quantities",
+            " Compiled final market insights and guidance"
+        ])
+        return validated_recommendations, insights
+
+    def stream_investment_scenario(self, preferences: Dict, is_trade: bool = False,
+                                   snapshot: Optional[PriceSnapshot] = None,
+                                   holdings: Optional[Dict[str, float]] = None,
+                                   thinking_process: Optional[List[str]] = None,
+                                   market_context: Optional[Dict[str, Dict]] = None) -> Iterator[Tuple[str, object]]:
+        """
+        Streaming form of analyze_investment_scenario. Yields ("thought", text) for
+        each thought and ("recommendation", rec) for each recommendation as soon as
+        the model has written it, then ("result", <analyze_investment_scenario tuple>).
+        Streamed recommendations are previews; the result is parsed from the full response.
+        """
+        reasoning_steps = []
+        if snapshot is None:
+            snapshot = PriceSnapshot.capture()
+        if thinking_process is None:
+            thinking_process = []
+            for thought in self.stream_thinking_process(preferences, snapshot, holdings):
+                thinking_process.append(thought)
+                yield "thought", thought
+
+        try:
+            stock_data = snapshot.to_stock_data()
             
-            reasoning_steps.extend([
-                " Validated investment amounts and share quantities",
-                " Compiled final market insights and guidance"
-            ])
-            return validated_recommendations, insights, reasoning_steps, thinking_process
+            # Add investment amount to prompt for better quantity calculation
+            investment_amount = self._convert_to_float(preferences.get('investment_amount', 0.0))
+            reasoning_steps.append(f"Investment amount specified: ${investment_amount:.2f}")
+            research_section = ""
+            if market_context:
+                research_section = f"- Per-Symbol Research: {json.dumps(market_context, indent=2, default=str)}\n"
+                reasoning_steps.append(f"Using research on {len(market_context)} symbols")
+
+            prompt = self._build_analysis_prompt(preferences, stock_data, investment_amount, research_section)
+            parts = []
+            scanner = ArrayItemStream("recommendations")
+            for chunk in self.llm.stream(prompt):
+                parts.append(chunk.content)
+                for rec in scanner.feed(chunk.content):
+                    validated = self._validate_recommendation(rec, investment_amount, snapshot)
+                    if validated is not None:
+                        yield "recommendation", validated
+
+            recommendations, insights = self._finish_analysis("".join(parts), investment_amount, snapshot, reasoning_steps)
+            if recommendations == [ERROR_RECOMMENDATION]:
+                # Nothing usable; don't let the workflow's retry be served the same reply
+                self.llm.forget(prompt)
+            yield "result", (recommendations, insights, reasoning_steps, thinking_process)
 
         except Exception as e:
             logger.error(f"Reasoning analysis failed: {str(e)}")
-            return [], "Analysis failed due to technical issues.", reasoning_steps, thinking_process
+            yield "result", ([], "Analysis failed due to technical issues.", reasoning_steps, thinking_process)
+
+    def analyze_investment_scenario(self, preferences: Dict, is_trade: bool = False,
+                                    snapshot: Optional[PriceSnapshot] = None,
+                                    holdings: Optional[Dict[str, float]] = None,
+                                    thinking_process: Optional[List[str]] = None,
+                                    market_context: Optional[Dict[str, Dict]] = None) -> Tuple[List[Dict], str, List[str], List[str]]:
+        """
+        Perform a detailed analysis of the investment scenario with step-by-step reasoning.
+        All prices come from a single snapshot, captured here if the caller did not pass one.
+        `thinking_process` and `market_context` ({symbol: research}) let a caller
+        that already computed them, such as the workflow graph, pass them in.
+        Returns: (recommendations, insights, reasoning_steps, thinking_process)
+        """
+        for kind, payload in self.stream_investment_scenario(preferences, is_trade, snapshot, holdings,
+                                                             thinking_process, market_context):
+            if kind == "result":
+                return payload
+
 
-    def validate_trade(self, recommendation: Dict, preferences: Dict) -> Tuple[bool, str, List[str]]:
+    def validate_trade(self, recommendation: Dict, preferences: Dict,
+                       snapshot: Optional[PriceSnapshot] = None) -> Tuple[bool, str, List[str]]:
         """
         Validate a specific trade recommendation with detailed reasoning steps.
         Returns: (is_valid, explanation, reasoning_steps)
@@ -721,7 +792,7 @@ The response must be a single, valid JSON object that can be parsed by json.load
                 return False, f"Invalid stock symbol: {recommendation['Symbol']} is not in the allowed list", reasoning_steps
 
             # Validate trade amount
-            current_price = self._get_current_price(recommendation["Symbol"])
+            current_price = self._get_current_price(recommendation["Symbol"], snapshot)
             if current_price <= 0:
                 return False, f"Could not get valid price for {recommendation['Symbol']}", reasoning_steps
 
@@ -808,7 +879,7 @@ Important:
 Return ONLY the JSON object, no other text."""
 
             response = self.llm.invoke(validation_prompt)
-            validation_result = self._parse_json_response(response.content)
+            validation_result = self._parse_json_response(response.content, validation_prompt)
             
             # Extract validation decision
             validation = validation_result.get("validation", {}).get("validation_result", {})
@@ -915,7 +986,7 @@ Return analysis in this exact JSON format:
 Return ONLY the JSON object, no other text."""
 
             response = self.llm.invoke(market_prompt)
-            return self._parse_json_response(response.content)
+            return self._parse_json_response(response.content, market_prompt)
         except Exception as e:
             logger.error(f"Market analysis failed: {str(e)}")
             return {
@@ -0,0 +1,64 @@
+from typing import Dict, Tuple, Type, TypeVar
+import threading
+import time
+
+from utils.logger import logger
+
+T = TypeVar("T")
+
+# Agents hold no per-request state, so one instance of each serves every
+# Streamlit session and workflow run in the process.
+_agents: Dict[Tuple, object] = {}
+_agents_lock = threading.RLock()
+
+
+def get_agent(agent_cls: Type[T], **kwargs) -> T:
+    """Process-wide instance of `agent_cls`, built on first use.
+
+    Distinct keyword arguments (e.g. another sentiment backend) get their own instance.
+    """
+    key = (agent_cls, tuple(sorted(kwargs.items())))
+    with _agents_lock:
+        agent = _agents.get(key)
+        if agent is None:
+            agent = agent_cls(**kwargs)
+            _agents[key] = agent
+            logger.info(f"Built {agent_cls.__name__} for the agent registry")
+        return agent
+
+
+def reset_agents():
+    """Drop every registered agent; the next get_agent call rebuilds it."""
+    with _agents_lock:
+        _agents.clear()
+
+
+def warm_up() -> Dict[str, float]:
+    """Build the agents, clients, LLM cache and workflow graphs up front.
+
+    Returns seconds spent per step. A step that fails is logged and left to
+    be built lazily on first use.
+    """
+    from agents.Workflow import get_workflow_graph
+    from agents.market_analyst import MarketAnalystAgent
+    from agents.reasoning_agent import ReasoningAgent
+    from agents.strategist import StrategistAgent
+    from utils.llm_cache import get_llm_cache
+
+    steps = {
+        "llm_cache": get_llm_cache,
+        "ReasoningAgent": lambda: get_agent(ReasoningAgent),
+        "MarketAnalystAgent": lambda: get_agent(MarketAnalystAgent),
+        "StrategistAgent": lambda: get_agent(StrategistAgent),
+        "workflow_graph": lambda: (get_workflow_graph("llm"), get_workflow_graph("quant")),
+    }
+    timings = {}
+    for name, build in steps.items():
+        started = time.perf_counter()
+        try:
+            build()
+        except Exception as e:
+            logger.error(f"Warm-up of {name} failed: {str(e)}")
+        timings[name] = round(time.perf_counter() - started, 3)
+    logger.info(f"Agent registry warmed up: {timings}")
+    return timings
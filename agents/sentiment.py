@@ -0,0 +1,126 @@
+from typing import Callable, Dict, List
+import re
+
+import numpy as np
+
+from utils.logger import logger
+
+# Finance-specific headline lexicon; weights are in [-1, 1]
+FINANCIAL_LEXICON = {
+    # positive
+    "beat": 0.8, "beats": 0.8, "tops": 0.6, "surge": 0.8, "surges": 0.8, "soar": 0.9, "soars": 0.9,
+    "jump": 0.6, "jumps": 0.6, "rally": 0.7, "rallies": 0.7, "gain": 0.5, "gains": 0.5, "rise": 0.4,
+    "rises": 0.4, "climb": 0.5, "climbs": 0.5, "record": 0.5, "upgrade": 0.8, "upgrades": 0.8,
+    "upgraded": 0.8, "outperform": 0.7, "buy": 0.3, "bullish": 0.8, "growth": 0.4, "grows": 0.4,
+    "profit": 0.4, "profits": 0.4, "strong": 0.5, "stronger": 0.5, "boost": 0.5, "boosts": 0.5,
+    "raises": 0.5, "raised": 0.4, "expands": 0.4, "expansion": 0.3, "approval": 0.6, "approved": 0.6,
+    "wins": 0.6, "win": 0.5, "partnership": 0.3, "breakthrough": 0.7, "dividend": 0.3, "buyback": 0.5,
+    "optimistic": 0.6, "rebound": 0.5, "rebounds": 0.5, "recovery": 0.4, "exceeds": 0.7, "higher": 0.3,
+    # negative
+    "miss": -0.8, "misses": -0.8, "missed": -0.8, "plunge": -0.9, "plunges": -0.9, "plummets": -0.9,
+    "tumble": -0.8, "tumbles": -0.8, "sink": -0.7, "sinks": -0.7, "slump": -0.7, "slumps": -0.7,
+    "drop": -0.6, "drops": -0.6, "fall": -0.5, "falls": -0.5, "decline": -0.5, "declines": -0.5,
+    "slide": -0.5, "slides": -0.5, "downgrade": -0.8, "downgrades": -0.8, "downgraded": -0.8,
+    "underperform": -0.7, "sell": -0.3, "bearish": -0.8, "loss": -0.6, "losses": -0.6, "weak": -0.5,
+    "weaker": -0.5, "cut": -0.5, "cuts": -0.5, "layoffs": -0.6, "lawsuit": -0.6, "sues": -0.5,
+    "probe": -0.6, "investigation": -0.6, "recall": -0.6, "fraud": -0.9, "fine": -0.4, "fined": -0.6,
+    "warns": -0.6, "warning": -0.5, "delay": -0.4, "delays": -0.4, "halt": -0.6, "halts": -0.6,
+    "crash": -0.9, "bankruptcy": -1.0, "default": -0.7, "lower": -0.3, "concerns": -0.4, "fears": -0.5,
+    "selloff": -0.7, "antitrust": -0.5, "shortfall": -0.6, "disappointing": -0.7, "volatile": -0.2,
+}
+NEGATORS = {"not", "no", "never", "without", "fails", "failed", "despite"}
+CONFIDENT_SCORE = 0.5  # lexicon scores at least this far from zero skip the LLM in hybrid mode
+SENTIMENT_THRESHOLD = 0.3  # |mean score| at or above this is Positive/Negative
+
+_TOKEN = re.compile(r"[a-z]+")
+
+
+class LexiconSentimentBackend:
+    """Local headline scorer: no network, vectorized over a whole batch of headlines."""
+
+    name = "lexicon"
+
+    def __init__(self, lexicon: Dict[str, float] = None):
+        self.lexicon = lexicon or FINANCIAL_LEXICON
+
+    def score_array(self, headlines: List[str]):
+        """Return (scores, hits) arrays; a score is the mean weight of the lexicon words found."""
+        tokens = [_TOKEN.findall(headline.lower()) for headline in headlines]
+        lengths = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=len(tokens))
+        flat = np.array([token for headline_tokens in tokens for token in headline_tokens], dtype=object)
+        if not len(flat):
+            return np.zeros(len(headlines)), np.zeros(len(headlines), dtype=np.int64)
+        owner = np.repeat(np.arange(len(headlines)), lengths)
+
+        # Look each distinct token up once, then broadcast back to every occurrence
+        vocab, inverse = np.unique(flat.astype(str), return_inverse=True)
+        weights = np.array([self.lexicon.get(word, 0.0) for word in vocab])[inverse]
+        negator = np.isin(vocab, list(NEGATORS))[inverse]
+        # A negator flips the next word in the same headline ("not beat", "fails approval")
+        flipped = np.zeros(len(flat), dtype=bool)
+        flipped[1:] = negator[:-1] & (owner[1:] == owner[:-1])
+        weights = np.where(flipped, -weights, weights)
+
+        totals = np.bincount(owner, weights=weights, minlength=len(headlines))
+        hits = np.bincount(owner, weights=(weights != 0), minlength=len(headlines)).astype(np.int64)
+        scores = np.divide(totals, hits, out=np.zeros(len(headlines)), where=hits > 0)
+        return np.clip(scores, -1.0, 1.0), hits
+
+    def score_headlines(self, headlines: List[str]) -> Dict[str, float]:
+        scores, _ = self.score_array(headlines)
+        return dict(zip(headlines, scores.tolist()))
+
+
+class LLMSentimentBackend:
+    """Delegates to a batched LLM scorer such as MarketAnalystAgent.score_headlines_llm."""
+
+    name = "llm"
+
+    def __init__(self, scorer: Callable[[List[str]], Dict[str, float]]):
+        self.scorer = scorer
+
+    def score_headlines(self, headlines: List[str]) -> Dict[str, float]:
+        return self.scorer(headlines)
+
+
+class HybridSentimentBackend:
+    """Lexicon first; only headlines it is unsure about go to the LLM."""
+
+    name = "hybrid"
+
+    def __init__(self, lexicon: LexiconSentimentBackend, llm: LLMSentimentBackend,
+                 confident_score: float = CONFIDENT_SCORE):
+        self.lexicon = lexicon
+        self.llm = llm
+        self.confident_score = confident_score
+        self.llm_headlines = 0
+        self.local_headlines = 0
+
+    def ambiguous(self, scores: np.ndarray, hits: np.ndarray) -> np.ndarray:
+        return (hits == 0) | (np.abs(scores) < self.confident_score)
+
+    def score_headlines(self, headlines: List[str]) -> Dict[str, float]:
+        headlines = list(dict.fromkeys(headlines))
+        scores, hits = self.lexicon.score_array(headlines)
+        results = dict(zip(headlines, scores.tolist()))
+        unsure = [h for h, flag in zip(headlines, self.ambiguous(scores, hits)) if flag]
+        self.local_headlines += len(headlines) - len(unsure)
+        if unsure:
+            self.llm_headlines += len(unsure)
+            try:
+                # Anything the LLM fails to score keeps its lexicon score
+                results.update(self.llm.score_headlines(unsure))
+            except Exception as e:
+                logger.error(f"LLM sentiment fallback failed, using lexicon scores: {str(e)}")
+        return results
+
+
+def make_sentiment_backend(kind: str, llm_scorer: Callable[[List[str]], Dict[str, float]]):
+    """Build a backend by name: "lexicon", "llm" or "hybrid"."""
+    if kind == "lexicon":
+        return LexiconSentimentBackend()
+    if kind == "llm":
+        return LLMSentimentBackend(llm_scorer)
+    if kind == "hybrid":
+        return HybridSentimentBackend(LexiconSentimentBackend(), LLMSentimentBackend(llm_scorer))
+    raise ValueError(f"Unknown sentiment backend: {kind}")
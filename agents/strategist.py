@@ -1,22 +1,31 @@
-from langchain_groq import ChatGroq
-from utils.config import GROQ_API_KEY
+from utils.clients import get_chat_model
+from utils.json_extract import extract_json
 from utils.logger import logger
+from agents.quant_scorer import QuantScorer, write_narrative
 from typing import List, Dict
-import json
 import time
-import re
 
 class StrategistAgent:
     
     def __init__(self):
-        self.llm = ChatGroq(model_name="llama-3.1-8b-instant", api_key=GROQ_API_KEY)
+        self.llm = get_chat_model("llama-3.1-8b-instant")
 
-    def generate_recommendations(self, preferences: Dict, market_data: List[Dict]) -> List[Dict]:
+    def generate_recommendations(self, preferences: Dict, market_data: List[Dict], engine: str = "llm") -> List[Dict]:
         STOCK_LIST = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "JPM", "WMT", "V"]
-        """Generate stock recommendations based on preferences and market data."""
+        """Generate stock recommendations based on preferences and market data.
+
+        engine="quant" picks and sizes positions with QuantScorer and only asks
+        the LLM for the Reason/Caution narrative.
+        """
         if not market_data:
             logger.error("No market data provided for recommendations")
             return []
+
+        if engine == "quant":
+            recommendations = QuantScorer().recommend(preferences, market_data)
+            recommendations, _ = write_narrative(self.llm, recommendations, preferences)
+            logger.info(f"Quant scorer generated {len(recommendations)} recommendations")
+            return recommendations
         
         valid_symbols = {item["symbol"].upper() for item in market_data if "symbol" in item}
         if not valid_symbols:
@@ -74,30 +83,21 @@ Example:
 ```
 **Important**: Always use 'Symbol' (uppercase 'S'), wrap in ```json```, ensure valid JSON, and ensure Quantity * price <= investment_amount.
 """
-                response = self.llm.invoke(prompt)
+                # Retries go to the model; the rejected reply must not be served again
+                response = self.llm.invoke(prompt, refresh=attempt > 0)
                 raw_response = response.content.strip()
                 logger.debug(f"Raw LLM response: {raw_response}")
 
-                # Try extracting JSON with delimiters
-                json_match = re.search(r'```json\n(.*?)\n```', raw_response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1).strip()
-                else:
-                    # Fallback: Extract raw JSON
-                    json_start = raw_response.find('[')
-                    json_end = raw_response.rfind(']') + 1
-                    if json_start != -1 and json_end != 0:
-                        json_str = raw_response[json_start:json_end].strip()
-                        logger.warning(f"Attempt {attempt + 1}: No JSON delimiters, extracted raw JSON: {json_str}")
-                    else:
-                        logger.error(f"Attempt {attempt + 1}: No JSON block found")
-                        if attempt < 2:
-                            time.sleep(5 * (2 ** attempt))
-                            continue
-                        return []
+                rec_list = extract_json(raw_response, openers="[")
+                if rec_list is None:
+                    logger.error(f"Attempt {attempt + 1}: No JSON block found")
+                    self.llm.forget(prompt)
+                    if attempt < 2:
+                        time.sleep(5 * (2 ** attempt))
+                        continue
+                    return []
 
                 try:
-                    rec_list = json.loads(json_str)
                     if not isinstance(rec_list, list):
                         raise ValueError("Response is not a list")
                     for rec in rec_list:
@@ -116,14 +116,9 @@ Example:
                     rec_list = sorted(rec_list, key=lambda x: x["Score"], reverse=True)[:3]
                     logger.info(f"Successfully generated {len(rec_list)} recommendations")
                     return rec_list
-                except json.JSONDecodeError as e:
-                    logger.error(f"Attempt {attempt + 1}: Failed to parse JSON: {str(e)}")
-                    if attempt < 2:
-                        time.sleep(5 * (2 ** attempt))
-                        continue
-                    return []
                 except ValueError as e:
                     logger.error(f"Attempt {attempt + 1}: Invalid format: {str(e)}")
+                    self.llm.forget(prompt)
                     if attempt < 2:
                         time.sleep(5 * (2 ** attempt))
                         continue
@@ -196,34 +191,20 @@ Example:
     ```
     **Important**: Return only valid JSON wrapped in ```json``` delimiters. Do not include additional text outside the JSON. Verify total cost for 'Buy' actions and ensure the selected recommendation is copied exactly from the provided list.
     """
-                response = self.llm.invoke(prompt)
+                response = self.llm.invoke(prompt, refresh=attempt > 0)
                 raw_response = response.content.strip()
                 logger.debug(f"Raw LLM response for selection (attempt {attempt + 1}): {raw_response}")
 
-                # Extract JSON
-                json_match = re.search(r'```json\s*(.*?)\s*```', raw_response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1).strip()
-                else:
-                    # Try finding JSON object or array
-                    json_start = min(raw_response.find('{'), raw_response.find('['))
-                    json_end = max(raw_response.rfind('}') + 1, raw_response.rfind(']') + 1)
-                    if json_start != -1 and json_end != 0 and json_start < json_end:
-                        json_str = raw_response[json_start:json_end].strip()
-                        logger.warning(f"Attempt {attempt + 1}: No JSON delimiters, extracted raw JSON: {json_str}")
-                    else:
-                        # Try to find any JSON-like content
-                        json_str = raw_response.strip()
-                        if not (json_str.startswith('{') or json_str.startswith('[')):
-                            json_str = '{' + json_str + '}' if 'SelectedRecommendation' in json_str else json_str
-                        logger.error(f"Attempt {attempt + 1}: No JSON block found, attempting to parse: {json_str}")
-                        if attempt < 2:
-                            time.sleep(5 * (2 ** attempt))
-                            continue
-                        return {}
+                result = extract_json(raw_response, openers="{")
+                if result is None:
+                    logger.error(f"Attempt {attempt + 1}: No JSON block found, raw response: {raw_response}")
+                    self.llm.forget(prompt)
+                    if attempt < 2:
+                        time.sleep(5 * (2 ** attempt))
+                        continue
+                    return {}
 
                 try:
-                    result = json.loads(json_str)
                     if not isinstance(result, dict) or "SelectedRecommendation" not in result or "SelectionReason" not in result:
                         raise ValueError("Invalid response format")
                     
@@ -246,14 +227,9 @@ Example:
 
                     logger.info(f"Successfully selected recommendation: {selected_rec['Symbol']}")
                     return selected_rec
-                except json.JSONDecodeError as e:
-                    logger.error(f"Attempt {attempt + 1}: Failed to parse JSON: {str(e)}, raw response: {raw_response}")
-                    if attempt < 2:
-                        time.sleep(5 * (2 ** attempt))
-                        continue
-                    return {}
                 except ValueError as e:
                     logger.error(f"Attempt {attempt + 1}: Invalid format: {str(e)}, raw response: {raw_response}")
+                    self.llm.forget(prompt)
                     if attempt < 2:
                         time.sleep(5 * (2 ** attempt))
                         continue
@@ -2,25 +2,25 @@ import streamlit as st
 import os
 import sys
 from pathlib import Path
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import pandas as pd
-import finnhub
-import pytz
-from decimal import Decimal
-from cachetools import TTLCache
 import time
 import mysql.connector
-from scripts.fetch_stock_prices import fetch_stock_prices
+from scripts.fetch_stock_prices import read_stock_prices, get_last_refresh_age, update_stock_price_in_db
+from utils.llm_cache import get_llm_cache
+from utils.clients import get_finnhub_client
 # from utils.config import FINNHUB_API_KEY, GNEWS_API_KEY
 from utils.logger import logger
-from agents import EducatorAgent, StrategistAgent, MarketAnalystAgent, ExecutorAgent, MonitorGuardrailAgent, run_workflow
+from agents import EducatorAgent, StrategistAgent, MarketAnalystAgent, ExecutorAgent, MonitorGuardrailAgent, run_workflow, stream_workflow
+from agents.registry import warm_up
 from auth.auth import sign_up, sign_in, get_user
-from gamification.leaderboard import update_leaderboard, get_leaderboard
-from gamification.virtual_currency import get_balance, add_trade, get_portfolio
-from data.mysql_db import get_db_connection
+from gamification.leaderboard import update_leaderboard, get_leaderboard, get_user_rank
+from gamification.virtual_currency import get_balance, add_trade, get_portfolio, get_positions
+from portfolio.accounting import book_from_trades, trade_quantity
+from portfolio.valuation import value_holdings
+from data.price_snapshot import PriceSnapshot
 import requests
 import json
-import decimal
 # Project setup
 project_root = str(Path(__file__).parent)
 if project_root not in sys.path:
@@ -272,77 +272,47 @@ STOCK_LIST = ["UNH", "TSLA", "QCOM", "ORCL", "NVDA", "NFLX", "MSFT", "META", "LL
 
 # Initialize Finnhub client
 try:
-    finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
+    finnhub_client = get_finnhub_client()
 except Exception as e:
     logger.error(f"Failed to initialize Finnhub client: {str(e)}")
     st.error(f"Finnhub initialization failed: {str(e)}")
     raise
 
-# Cache for stock prices (1-hour TTL)
-price_cache = TTLCache(maxsize=100, ttl=3600)
+# Build agents, clients and workflow graphs once per process rather than on every rerun
+@st.cache_resource(show_spinner="Warming up agents...")
+def warm_up_agents():
+    return warm_up()
 
-def get_stock_price_from_db(symbol: str) -> dict:
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT open_price, close_price, high_price, low_price, current_price, last_updated
-            FROM stock_prices
-            WHERE symbol = %s
-        """, (symbol,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+warm_up_agents()
 
-        if result:
-            last_updated = result["last_updated"]
-            if last_updated:
-                # If last_updated is naive, assume it's in UTC and make it offset-aware
-                if last_updated.tzinfo is None:
-                    last_updated = pytz.timezone("UTC").localize(last_updated)
-                # Compare with current UTC time minus 1 hour
-                if last_updated >= datetime.now(timezone.utc) - timedelta(hours=1):
-                    logger.info(f"Fetched recent price for {symbol} from DB")
-                    return {
-                        "o": result["open_price"],
-                        "c": result["current_price"],
-                        "h": result["high_price"],
-                        "l": result["low_price"],
-                        "pc": result["close_price"]
-                    }
-            logger.info(f"No recent or valid price for {symbol} in DB")
-        else:
-            logger.info(f"No price data found for {symbol} in DB")
-        return None
-    except Exception as e:
-        logger.error(f"Failed to fetch price from DB for {symbol}: {str(e)}")
-        return None
+# Prices are kept warm by scripts/price_refresher.py; pages only read them
+def show_price_staleness():
+    age = get_last_refresh_age()
+    if age is None:
+        st.caption("Price refresher is not running; showing the last stored prices.")
+    elif age < 120:
+        st.caption(f"Prices updated {age:.0f}s ago")
+    else:
+        st.caption(f"Prices updated {age / 60:.0f} min ago")
 
-def update_stock_price_in_db(symbol: str, quote: dict):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO stock_prices (symbol, open_price, close_price, high_price, low_price, current_price, timestamp, last_updated)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                open_price = %s,
-                close_price = %s,
-                high_price = %s,
-                low_price = %s,
-                current_price = %s,
-                timestamp = %s,
-                last_updated = %s
-        """, (
-            symbol, quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc),
-            quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc)
-        ))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        logger.info(f"Updated price for {symbol} in DB")
-    except Exception as e:
-        logger.error(f"Failed to update price in DB for {symbol}: {str(e)}")
+def show_risk_projection(projection):
+    """Render the workflow's Monte Carlo projection (percentile bands and tail risk)."""
+    if not projection:
+        return
+    with st.expander("📈 Simulated Portfolio Outcomes", expanded=True):
+        final = {p: values[-1] for p, values in projection["bands"].items()}
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Median Value", f"${final['50']:,.2f}")
+        col2.metric("Probability of Loss", f"{projection['prob_loss'] * 100:.1f}%")
+        col3.metric("95% VaR", f"${projection['value_at_risk']:,.2f}")
+        col4.metric("Expected Shortfall", f"${projection['expected_shortfall']:,.2f}")
+        bands = pd.DataFrame(
+            {f"{p}th percentile": values for p, values in projection["bands"].items()},
+            index=pd.Index(projection["checkpoints"], name="Years")
+        )
+        st.line_chart(bands)
+        st.caption(f"{projection['n_paths']:,} correlated paths over {projection['horizon_years']:.0f} years, "
+                   f"estimated from {projection['observations']} days of price history.")
 
 # News fetching function for server-side API
 def fetch_news(symbol: str):
@@ -481,13 +451,21 @@ else:
                 logger.error(f"Failed to display balance: {str(e)}")
                 st.error(f"Failed to display balance: {str(e)}")
 
+            try:
+                cache_stats = get_llm_cache().stats()
+                st.caption(f"LLM cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                           f"({cache_stats['hit_rate'] * 100:.0f}%), {cache_stats['entries']} entries")
+            except Exception as e:
+                logger.error(f"Failed to read LLM cache stats: {str(e)}")
+
         # Page content
         if page == "Home":
             st.markdown("<h2 class='subheader'>Stock Market Overview</h2>", unsafe_allow_html=True)
             try:
-                logger.info("Fetching stock prices for Home page")
+                logger.info("Reading stock prices for Home page")
                 with st.spinner("Loading stock prices..."):
-                    stock_data = fetch_stock_prices()
+                    stock_data = read_stock_prices()
+                    show_price_staleness()
                     if not stock_data:
                         st.error("Failed to load stock prices.")
                     else:
@@ -603,6 +581,12 @@ else:
                     placeholder="Enter any additional details about your investment preferences, goals, or constraints...",
                     help="Provide more context about your investment strategy, specific sectors you're interested in, or any other relevant information."
                 )
+                engine = st.radio(
+                    "Recommendation Engine",
+                    ["AI analyst", "Quantitative model"],
+                    horizontal=True,
+                    help="The quantitative model ranks stocks on valuation, momentum, volatility and sentiment in milliseconds; the AI only writes the explanation."
+                )
                 
                 submit_button = st.form_submit_button("Get Recommendations")
 
@@ -637,24 +621,43 @@ else:
                     st.info("Starting investment analysis...")
                     logger.info("Starting recommendation workflow")
                     
-                    with st.spinner("Analyzing investment scenario..."):
-                        result = run_workflow(preferences, st.session_state.user_id)
+                    # Show the agent's thoughts and draft picks as soon as they are streamed
+                    status = st.empty()
+                    status.info("Analyzing investment scenario...")
+                    with st.expander("Agent's Thought Process", expanded=True):
+                        st.markdown("<h4 style='color: #ffffff;'>Inner Monologue</h4>", unsafe_allow_html=True)
+                        thoughts_area = st.container()
+                    drafts = st.empty()
+                    draft_lines = []
+                    streamed_thoughts = 0
+                    result = None
+                    for kind, payload in stream_workflow(preferences, st.session_state.user_id,
+                                                         engine="quant" if engine == "Quantitative model" else "llm"):
+                        if kind == "thought":
+                            streamed_thoughts += 1
+                            thoughts_area.markdown(f"<div class='thought-bubble'>{payload}</div>", unsafe_allow_html=True)
+                        elif kind == "recommendation":
+                            draft_lines.append(f"- {payload['Action']} {payload['Quantity']:.2f} shares of {payload['Symbol']} (score {payload['Score']})")
+                            drafts.info("Draft recommendations (still being analyzed):\n" + "\n".join(draft_lines))
+                        elif kind == "result":
+                            result = payload
+                    status.empty()
+                    drafts.empty()
+                    if not streamed_thoughts:
+                        for thought in result.get("thinking_process", []):
+                            thoughts_area.markdown(f"<div class='thought-bubble'>{thought}</div>", unsafe_allow_html=True)
                     
                     if result["recommendations"]:
                         st.success("Analysis complete!")
                         
-                        # Display the agent's thinking process first
-                        with st.expander("Agent's Thought Process", expanded=True):
-                            st.markdown("<h4 style='color: #ffffff;'>Inner Monologue</h4>", unsafe_allow_html=True)
-                            for thought in result.get("thinking_process", []):
-                                st.markdown(f"<div class='thought-bubble'>{thought}</div>", unsafe_allow_html=True)
-                        
                         # Display market insights and analysis process in a collapsible section
                         with st.expander("🔍 Analysis Process", expanded=True):
                             st.markdown("<h4 style='color: #ffffff;'>Market Analysis & Insights</h4>", unsafe_allow_html=True)
                             insights_text = result["market_insights"].replace("\n", "<br>")
                             st.markdown(f"<div class='analysis-box'>{insights_text}</div>", unsafe_allow_html=True)
                         
+                        show_risk_projection(result.get("risk_projection"))
+                        
                         # Display analysis steps in a separate collapsible section
                         with st.expander("Analysis Steps", expanded=True):
                             st.markdown("<h4 style='color: #ffffff;'>Step-by-Step Analysis</h4>", unsafe_allow_html=True)
@@ -761,7 +764,8 @@ else:
                                                 "c": quote["c"],
                                                 "h": quote["h"],
                                                 "l": quote["l"],
-                                                "pc": quote["pc"]
+                                                "pc": quote["pc"],
+                                                "t": quote.get("t")
                                             })
                                             logger.info(f"Updated stock price in DB for {trade['symbol']}")
                                             break
@@ -820,7 +824,7 @@ else:
                                 st.error(f"Invalid stock symbol: {symbol}")
                                 logger.error(f"Invalid stock symbol: {symbol}")
                             else:
-                                stock_data = fetch_stock_prices()
+                                stock_data = read_stock_prices()
                                 price = stock_data.get(symbol, {"current_price": 0.0})["current_price"]
                                 if price <= 0:
                                     st.error(f"No valid price available for {symbol}")
@@ -956,6 +960,8 @@ else:
                                     insights_text = result["market_insights"].replace("\n", "<br>")
                                     st.markdown(f"<div class='analysis-box'>{insights_text}</div>", unsafe_allow_html=True)
                                 
+                                show_risk_projection(result.get("risk_projection"))
+                                
                                 # Display analysis steps in a separate collapsible section
                                 with st.expander("📊 Analysis Steps", expanded=True):
                                     st.markdown("<h4 style='color: #ffffff;'>Step-by-Step Analysis</h4>", unsafe_allow_html=True)
@@ -991,120 +997,125 @@ else:
                                     - Remaining Budget: ${preferences['investment_amount'] - recommendation['TotalCost']:.2f}
                                     """)
                                 
-                                # Automatically execute the trade
-                                try:
-                                    logger.info(f"Starting automated trade execution for {recommendation['Symbol']}")
+                                if recommendation.get("ValidationStatus") == "unvalidated":
+                                    st.warning("Validation of this trade did not finish in time, so it was not executed automatically. "
+                                               "Review it and use Manual Trade if you want to proceed.")
+                                else:
+                                    # Automatically execute the trade
+                                    try:
+                                        logger.info(f"Starting automated trade execution for {recommendation['Symbol']}")
                                     
-                                    # Get current price
-                                    quote = finnhub_client.quote(recommendation["Symbol"])
-                                    price = float(quote["c"])
-                                    quantity = float(recommendation["Quantity"])
-                                    amount = price * quantity
+                                        # Get current price
+                                        quote = finnhub_client.quote(recommendation["Symbol"])
+                                        price = float(quote["c"])
+                                        quantity = float(recommendation["Quantity"])
+                                        amount = price * quantity
                                     
-                                    logger.info(f"Trade details - Symbol: {recommendation['Symbol']}, Price: {price}, Quantity: {quantity}, Amount: {amount}")
+                                        logger.info(f"Trade details - Symbol: {recommendation['Symbol']}, Price: {price}, Quantity: {quantity}, Amount: {amount}")
                                     
-                                    if amount <= st.session_state.balance or recommendation["Action"].lower() == "sell":
-                                        # Create trade record
-                                        trade_id = f"trade_{st.session_state.user_id}_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
-                                        trade = {
-                                            "id": trade_id,
-                                            "symbol": recommendation["Symbol"],
-                                            "quantity": quantity,
-                                            "price": price,
-                                            "trade_type": recommendation["Action"].lower(),
-                                            "amount": amount,
-                                            "user_id": st.session_state.user_id,
-                                            "timestamp": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-                                        }
+                                        if amount <= st.session_state.balance or recommendation["Action"].lower() == "sell":
+                                            # Create trade record
+                                            trade_id = f"trade_{st.session_state.user_id}_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
+                                            trade = {
+                                                "id": trade_id,
+                                                "symbol": recommendation["Symbol"],
+                                                "quantity": quantity,
+                                                "price": price,
+                                                "trade_type": recommendation["Action"].lower(),
+                                                "amount": amount,
+                                                "user_id": st.session_state.user_id,
+                                                "timestamp": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                                            }
                                         
-                                        logger.info(f"Attempting to add trade to database: {trade}")
+                                            logger.info(f"Attempting to add trade to database: {trade}")
                                         
-                                        # Try to execute trade up to 3 times
-                                        success = False
-                                        for attempt in range(3):
-                                            try:
-                                                if add_trade(st.session_state.user_id, trade):
-                                                    success = True
-                                                    logger.info(f"Trade successfully added to database: {trade_id}")
+                                            # Try to execute trade up to 3 times
+                                            success = False
+                                            for attempt in range(3):
+                                                try:
+                                                    if add_trade(st.session_state.user_id, trade):
+                                                        success = True
+                                                        logger.info(f"Trade successfully added to database: {trade_id}")
                                                     
-                                                    # Update session balance
-                                                    if trade["trade_type"] == "buy":
-                                                        st.session_state.balance = float(st.session_state.balance - amount)
-                                                    else:
-                                                        st.session_state.balance = float(st.session_state.balance + amount)
+                                                        # Update session balance
+                                                        if trade["trade_type"] == "buy":
+                                                            st.session_state.balance = float(st.session_state.balance - amount)
+                                                        else:
+                                                            st.session_state.balance = float(st.session_state.balance + amount)
                                                     
-                                                    # Update leaderboard
-                                                    update_leaderboard(st.session_state.user_id, st.session_state.username, st.session_state.balance)
-                                                    logger.info(f"Updated leaderboard for user {st.session_state.user_id}")
+                                                        # Update leaderboard
+                                                        update_leaderboard(st.session_state.user_id, st.session_state.username, st.session_state.balance)
+                                                        logger.info(f"Updated leaderboard for user {st.session_state.user_id}")
                                                     
-                                                    # Show success message with next steps
-                                                    total_value = float(trade['quantity']) * float(trade['price'])
-                                                    st.success(f"""
-                                                    🎯 **Trade Successfully Executed!**
+                                                        # Show success message with next steps
+                                                        total_value = float(trade['quantity']) * float(trade['price'])
+                                                        st.success(f"""
+                                                        🎯 **Trade Successfully Executed!**
                                                     
-                                                    **Trade Details:**
-                                                    - Action: {trade['trade_type'].upper()}
-                                                    - Stock: {trade['symbol']}
-                                                    - Shares: {trade['quantity']:.2f}
-                                                    - Price per Share: ${trade['price']:.2f}
-                                                    - Total Value: ${total_value:.2f}
-                                                    - New Balance: ${st.session_state.balance:.2f}
+                                                        **Trade Details:**
+                                                        - Action: {trade['trade_type'].upper()}
+                                                        - Stock: {trade['symbol']}
+                                                        - Shares: {trade['quantity']:.2f}
+                                                        - Price per Share: ${trade['price']:.2f}
+                                                        - Total Value: ${total_value:.2f}
+                                                        - New Balance: ${st.session_state.balance:.2f}
                                                     
-                                                    **Next Steps:**
-                                                    1. Click on the "Portfolio" tab in the navigation menu to view your updated holdings
-                                                    2. You can track the performance of this trade in your portfolio
-                                                    3. The trade has been recorded and will be reflected in your account history
-                                                    """)
+                                                        **Next Steps:**
+                                                        1. Click on the "Portfolio" tab in the navigation menu to view your updated holdings
+                                                        2. You can track the performance of this trade in your portfolio
+                                                        3. The trade has been recorded and will be reflected in your account history
+                                                        """)
                                                     
-                                                    # Update stock price in DB
-                                                    update_stock_price_in_db(trade['symbol'], {
-                                                        "o": quote["o"],
-                                                        "c": quote["c"],
-                                                        "h": quote["h"],
-                                                        "l": quote["l"],
-                                                        "pc": quote["pc"]
-                                                    })
-                                                    logger.info(f"Updated stock price in DB for {trade['symbol']}")
-                                                    break
-                                                else:
-                                                    logger.warning(f"add_trade returned False on attempt {attempt + 1}")
+                                                        # Update stock price in DB
+                                                        update_stock_price_in_db(trade['symbol'], {
+                                                            "o": quote["o"],
+                                                            "c": quote["c"],
+                                                            "h": quote["h"],
+                                                            "l": quote["l"],
+                                                            "pc": quote["pc"],
+                                                            "t": quote.get("t")
+                                                        })
+                                                        logger.info(f"Updated stock price in DB for {trade['symbol']}")
+                                                        break
+                                                    else:
+                                                        logger.warning(f"add_trade returned False on attempt {attempt + 1}")
+                                                        if attempt == 2:
+                                                            st.error("Agent was unable to execute the trade after multiple attempts. Please try again or use manual trading.")
+                                                            logger.error(f"Failed to save trade for {trade['symbol']}: add_trade returned False after 3 attempts")
+                                                except mysql.connector.errors.IntegrityError as e:
+                                                    logger.error(f"IntegrityError in add_trade (attempt {attempt + 1}): {str(e)}")
+                                                    if attempt == 2:
+                                                        st.error("Database error occurred while executing the trade. Please try again.")
+                                                except mysql.connector.errors.DatabaseError as e:
+                                                    logger.error(f"DatabaseError in add_trade (attempt {attempt + 1}): {str(e)}")
                                                     if attempt == 2:
-                                                        st.error("Agent was unable to execute the trade after multiple attempts. Please try again or use manual trading.")
-                                                        logger.error(f"Failed to save trade for {trade['symbol']}: add_trade returned False after 3 attempts")
-                                            except mysql.connector.errors.IntegrityError as e:
-                                                logger.error(f"IntegrityError in add_trade (attempt {attempt + 1}): {str(e)}")
-                                                if attempt == 2:
-                                                    st.error("Database error occurred while executing the trade. Please try again.")
-                                            except mysql.connector.errors.DatabaseError as e:
-                                                logger.error(f"DatabaseError in add_trade (attempt {attempt + 1}): {str(e)}")
-                                                if attempt == 2:
-                                                    st.error("Database error occurred while executing the trade. Please try again.")
-                                            except Exception as e:
-                                                logger.error(f"Unexpected error in add_trade (attempt {attempt + 1}): {str(e)}")
-                                                if attempt == 2:
-                                                    st.error("An unexpected error occurred while executing the trade. Please try again.")
+                                                        st.error("Database error occurred while executing the trade. Please try again.")
+                                                except Exception as e:
+                                                    logger.error(f"Unexpected error in add_trade (attempt {attempt + 1}): {str(e)}")
+                                                    if attempt == 2:
+                                                        st.error("An unexpected error occurred while executing the trade. Please try again.")
                                             
-                                            if not success and attempt < 2:
-                                                time.sleep(1)
-                                                logger.info(f"Retrying trade execution, attempt {attempt + 2}")
-                                    else:
-                                        st.error(f"""
-                                        ❌ **Insufficient Balance**
+                                                if not success and attempt < 2:
+                                                    time.sleep(1)
+                                                    logger.info(f"Retrying trade execution, attempt {attempt + 2}")
+                                        else:
+                                            st.error(f"""
+                                            ❌ **Insufficient Balance**
                                         
-                                        Required Amount: ${amount:.2f}
-                                        Your Balance: ${st.session_state.balance:.2f}
+                                            Required Amount: ${amount:.2f}
+                                            Your Balance: ${st.session_state.balance:.2f}
                                         
-                                        Please adjust the trade amount or add funds to your account.
-                                        """)
-                                        logger.error(f"Insufficient balance: {amount} > {st.session_state.balance}")
-                                except Exception as e:
-                                    logger.error(f"Failed to execute trade: {str(e)}")
-                                    st.error(f"""
-                                    **Trade Execution Failed**
+                                            Please adjust the trade amount or add funds to your account.
+                                            """)
+                                            logger.error(f"Insufficient balance: {amount} > {st.session_state.balance}")
+                                    except Exception as e:
+                                        logger.error(f"Failed to execute trade: {str(e)}")
+                                        st.error(f"""
+                                        **Trade Execution Failed**
                                     
-                                    An error occurred while executing the trade: {str(e)}
-                                    Please try again or use manual trading if the issue persists.
-                                    """)
+                                        An error occurred while executing the trade: {str(e)}
+                                        Please try again or use manual trading if the issue persists.
+                                        """)
                             else:
                                 st.warning("No valid trade recommendations generated. Please try again.")
                     except Exception as e:
@@ -1133,134 +1144,67 @@ else:
                         st.session_state.last_portfolio_refresh = current_time
                         st.rerun()
 
+                cost_method = st.selectbox("Cost basis", ["Average cost", "FIFO", "LIFO"], index=0)
+
                 with st.spinner("Loading portfolio data..."):
-                    try:
-                        trades = get_portfolio(st.session_state.user_id)
-                    except Exception as e:
-                        logger.error(f"Failed to fetch portfolio from database: {str(e)}")
-                        st.error(f"Failed to fetch portfolio: {str(e)}")
-                        trades = None
+                    if cost_method == "Average cost":
+                        # Maintained by add_trade, so no trade history is read
+                        positions = get_positions(st.session_state.user_id, include_closed=True)
+                    else:
+                        book = book_from_trades(get_portfolio(st.session_state.user_id), method=cost_method.lower())
+                        positions = [{"symbol": p.symbol, "quantity": p.quantity, "cost_basis": p.cost_basis,
+                                      "realized_pnl": p.realized_pnl} for p in book.positions.values()]
 
-                    if not trades:
+                    if not positions:
                         st.info("No trades in your portfolio yet.")
-                        logger.info(f"No trades found for user {st.session_state.user_id}")
+                        logger.info(f"No positions found for user {st.session_state.user_id}")
                     else:
-                        holdings = {}
-                        transaction_history = {}
-                        for trade in trades:
-                            symbol = trade["symbol"]
-                            try:
-                                # Convert Decimal to float for calculations
-                                trade_amount = float(trade["amount"]) if isinstance(trade["amount"], (Decimal, float, int)) else 0.0
-                                trade_price = float(trade["price"]) if isinstance(trade["price"], (Decimal, float, int)) else 0.0
-                                
-                                if trade_amount <= 0 or trade_price <= 0:
-                                    logger.warning(f"Skipping invalid trade for {symbol}: amount={trade_amount}, price={trade_price}")
-                                    continue
-                                
-                                quantity = trade_amount / trade_price
-                                
-                                if symbol not in holdings:
-                                    holdings[symbol] = {"quantity": 0.0, "total_cost": 0.0, "buy_trades": 0, "realized_profit": 0.0}
-                                    transaction_history[symbol] = []
-                                
-                                if trade["trade_type"] == "buy":
-                                    holdings[symbol]["quantity"] += quantity
-                                    holdings[symbol]["total_cost"] += trade_amount
-                                    holdings[symbol]["buy_trades"] += 1
-                                else:  # sell
-                                    if holdings[symbol]["quantity"] >= quantity:
-                                        avg_buy_price = holdings[symbol]["total_cost"] / holdings[symbol]["quantity"] if holdings[symbol]["quantity"] > 0 else trade_price
-                                        holdings[symbol]["quantity"] -= quantity
-                                        holdings[symbol]["total_cost"] -= avg_buy_price * quantity
-                                        holdings[symbol]["buy_trades"] = max(0, holdings[symbol]["buy_trades"] - 1)
-                                        realized_profit = (trade_price - avg_buy_price) * quantity
-                                        holdings[symbol]["realized_profit"] += realized_profit
-                                    else:
-                                        logger.warning(f"Cannot sell {quantity} shares of {symbol}: only {holdings[symbol]['quantity']} available")
-                                        continue
-                                
-                                transaction_history[symbol].append({
-                                    "trade_type": trade["trade_type"].capitalize(),
-                                    "Quantity": float(quantity),
-                                    "Price ($)": float(trade_price),
-                                    "Amount ($)": float(trade_amount),
-                                    "Timestamp": trade["timestamp"]
-                                })
-                            except (TypeError, ValueError, decimal.InvalidOperation) as e:
-                                logger.error(f"Error processing trade for {symbol}: {str(e)}")
-                                continue
+                        # One snapshot of stored prices marks every holding; no per-symbol lookups
+                        snapshot = PriceSnapshot.from_stock_data(read_stock_prices())
+                        show_price_staleness()
+                        valuation = value_holdings(positions, snapshot)
+                        totals = valuation.totals
 
-                        stock_data = fetch_stock_prices()
-                        portfolio_data = []
-                        for symbol, data in holdings.items():
-                            if data["quantity"] > 0:
-                                try:
-                                    cache_key = f"price_{symbol}"
-                                    if cache_key in price_cache:
-                                        current_price = price_cache[cache_key]["current_price"]
-                                    else:
-                                        db_quote = get_stock_price_from_db(symbol)
-                                        if db_quote:
-                                            current_price = db_quote["c"]
-                                        else:
-                                            for attempt in range(3):
-                                                try:
-                                                    quote = finnhub_client.quote(symbol)
-                                                    current_price = quote.get("c", stock_data.get(symbol, {"current_price": 0.0})["current_price"])
-                                                    price_cache[cache_key] = {"current_price": current_price}
-                                                    update_stock_price_in_db(symbol, quote)
-                                                    break
-                                                except Exception as e:
-                                                    if "429" in str(e):
-                                                        logger.warning(f"Rate limit for {symbol}, retrying in {10 * (2 ** attempt)}s")
-                                                        time.sleep(10 * (2 ** attempt))
-                                                        if attempt == 2:
-                                                            logger.error(f"Rate limit exceeded for {symbol}, falling back to DB")
-                                                            db_quote = get_stock_price_from_db(symbol)
-                                                            if db_quote:
-                                                                current_price = db_quote["c"]
-                                                            else:
-                                                                current_price = stock_data.get(symbol, {"current_price": 0.0})["current_price"]
-                                                            break
-                                                    else:
-                                                        current_price = stock_data.get(symbol, {"current_price": 0.0})["current_price"]
-                                                        break
-                                    
-                                    avg_buy_price = float(data["total_cost"]) / float(data["quantity"]) if data["quantity"] > 0 else 0
-                                    unrealized_profit = (float(current_price) - avg_buy_price) * float(data["quantity"])
-                                    portfolio_data.append({
-                                        "Symbol": symbol,
-                                        "Quantity": float(data["quantity"]),
-                                        "Avg Buy Price ($)": float(avg_buy_price),
-                                        "Current Price ($)": float(current_price),
-                                        "Unrealized Profit ($)": float(unrealized_profit),
-                                        "Realized Profit ($)": float(data["realized_profit"])
-                                    })
-                                except Exception as e:
-                                    logger.error(f"Failed to fetch price for {symbol}: {str(e)}")
-                                    portfolio_data.append({
-                                        "Symbol": symbol,
-                                        "Quantity": float(data["quantity"]),
-                                        "Avg Buy Price ($)": float(data["total_cost"]) / float(data["quantity"]) if data["quantity"] > 0 else 0,
-                                        "Current Price ($)": float(stock_data.get(symbol, {"current_price": 0.0})["current_price"]),
-                                        "Unrealized Profit ($)": 0.0,
-                                        "Realized Profit ($)": float(data["realized_profit"])
-                                    })
+                        m1, m2, m3, m4 = st.columns(4)
+                        m1.metric("Market Value", f"${totals['market_value']:,.2f}")
+                        m2.metric("Day Change", f"${totals['day_change']:,.2f}", f"{totals['day_change_pct']:.2%}")
+                        m3.metric("Unrealized P&L", f"${totals['unrealized_pnl']:,.2f}")
+                        m4.metric("Realized P&L", f"${totals['realized_pnl']:,.2f}")
+                        if valuation.unpriced:
+                            st.caption(f"No price for {', '.join(valuation.unpriced)}; shown at cost.")
 
-                        if portfolio_data:
+                        if valuation.holdings:
+                            df = pd.DataFrame(valuation.holdings).rename(columns={
+                                "symbol": "Symbol", "quantity": "Quantity", "avg_cost": "Avg Buy Price ($)",
+                                "price": "Current Price ($)", "market_value": "Market Value ($)",
+                                "day_change": "Day Change ($)", "unrealized_pnl": "Unrealized Profit ($)",
+                                "realized_pnl": "Realized Profit ($)"
+                            })
+                            columns = ["Symbol", "Quantity", "Avg Buy Price ($)", "Current Price ($)", "Market Value ($)",
+                                       "Day Change ($)", "Unrealized Profit ($)", "Realized Profit ($)"]
+                            df = df[columns]
                             # Format the numeric columns
-                            df = pd.DataFrame(portfolio_data)
-                            for col in ["Quantity", "Avg Buy Price ($)", "Current Price ($)", "Unrealized Profit ($)", "Realized Profit ($)"]:
+                            for col in columns[1:]:
                                 df[col] = df[col].apply(lambda x: f"{float(x):,.2f}")
                             st.table(df)
                         else:
                             st.info("No active holdings in your portfolio.")
 
-                        st.markdown("<h3 style='color: #ffffff;'>Transaction History</h3>", unsafe_allow_html=True)
-                        for symbol, transactions in transaction_history.items():
-                            with st.expander(f"Transactions for {symbol}"):
-                                st.table(pd.DataFrame(transactions))
+                        # The full ledger is only read when asked for
+                        if st.checkbox("Show transaction history", value=False):
+                            st.markdown("<h3 style='color: #ffffff;'>Transaction History</h3>", unsafe_allow_html=True)
+                            transaction_history = {}
+                            for trade in get_portfolio(st.session_state.user_id):
+                                transaction_history.setdefault(trade["symbol"], []).append({
+                                    "trade_type": trade["trade_type"].capitalize(),
+                                    "Quantity": trade_quantity(trade),
+                                    "Price ($)": float(trade["price"]),
+                                    "Amount ($)": float(trade["amount"]),
+                                    "Timestamp": trade["timestamp"]
+                                })
+                            for symbol, transactions in transaction_history.items():
+                                with st.expander(f"Transactions for {symbol}"):
+                                    st.table(pd.DataFrame(transactions))
             except Exception as e:
                 logger.error(f"Failed to load portfolio: {str(e)}")
                 st.error(f"Failed to load portfolio: {str(e)}")
@@ -1270,13 +1214,25 @@ else:
             try:
                 logger.info("Fetching leaderboard")
                 leaderboard = get_leaderboard()
+                my_rank = get_user_rank(st.session_state.user_id)
+                if my_rank:
+                    r1, r2, r3 = st.columns(3)
+                    r1.metric("Your Rank", f"#{my_rank['rank']:,} of {my_rank['total']:,}")
+                    r2.metric("Percentile", f"{my_rank['percentile']:.1f}%")
+                    r3.metric("Your Equity", f"${my_rank['equity']:,.2f}")
+                else:
+                    st.caption("Make a trade to join the leaderboard.")
                 if leaderboard:
                     top_user = leaderboard[0]
-                    st.markdown(f"<div class='top-user'>Top Investor: {top_user['username']} with ${float(top_user['balance']):,.2f}</div>", unsafe_allow_html=True)
-                    
-                    df = pd.DataFrame(leaderboard, columns=["username", "balance"]).rename(columns={"balance": "Masked Balance","username":"Username"})
+                    st.markdown(f"<div class='top-user'>Top Investor: {top_user['username']} with ${float(top_user['equity']):,.2f}</div>", unsafe_allow_html=True)
+                    st.caption("Ranked by equity: cash plus holdings at current prices.")
+
+                    df = pd.DataFrame(leaderboard, columns=["rank", "username", "equity", "holdings_value", "cash"]).rename(
+                        columns={"rank": "Rank", "username": "Username", "equity": "Equity",
+                                 "holdings_value": "Holdings", "cash": "Cash"})
                     df.reset_index(drop=True, inplace=True)
-                    df["Masked Balance"] = df["Masked Balance"].apply(lambda x: f"${float(x):,.2f}")
+                    for col in ["Equity", "Holdings", "Cash"]:
+                        df[col] = df[col].apply(lambda x: f"${float(x):,.2f}")
 
                     # Use st.write with .to_html and unsafe_allow_html=True to hide index
                     st.write(df.to_html(index=False, classes='table table-striped', justify='center'), unsafe_allow_html=True)
@@ -0,0 +1 @@
+# Lets the tests import the top-level packages (agents, data, portfolio, ...) when run with plain `pytest`.
@@ -0,0 +1,137 @@
+from typing import Callable, List, Optional, Tuple
+import threading
+import time
+
+from mysql.connector.errors import PoolError
+
+from utils.logger import logger
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection could be checked out before the timeout."""
+
+
+class PooledConnection:
+    """Proxy around a pooled connection; close() hands it back instead of closing it."""
+
+    def __init__(self, pool: "ConnectionPool", conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise AttributeError(f"Connection already returned to the pool (accessing {name})")
+        return getattr(conn, name)
+
+    def is_connected(self) -> bool:
+        return self._conn is not None and self._conn.is_connected()
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Safety net for callers that skip close() on an error path
+        if getattr(self, "_conn", None) is not None:
+            logger.warning("Pooled connection was garbage collected without close(); returning it to the pool")
+            self.close()
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of MySQL connections with idle health checks."""
+
+    def __init__(self, connect: Callable, max_size: int = 5, checkout_timeout: float = 10.0,
+                 health_check_interval: float = 30.0):
+        self._connect = connect
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self._idle: List[Tuple[object, float]] = []
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def get(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Borrow a connection, opening a new one if the pool has room."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            conn, last_used = self._checkout(deadline)
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._discard(None)
+                    raise
+                logger.debug(f"Opened pooled MySQL connection ({self._size}/{self.max_size})")
+                return PooledConnection(self, conn)
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(conn):
+                return PooledConnection(self, conn)
+            logger.warning("Discarding unhealthy pooled MySQL connection")
+            self._discard(conn)
+
+    def _checkout(self, deadline: float):
+        """Return an idle (conn, last_used) pair, or (None, 0) after reserving a slot for a new one."""
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, 0.0
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No MySQL connection available within {self.checkout_timeout}s "
+                                      f"(pool size {self.max_size})")
+                self._cond.wait(remaining)
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            conn.ping(reconnect=True, attempts=1, delay=0)
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled MySQL connection failed health check: {str(e)}")
+            return False
+
+    def _discard(self, conn):
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left uncommitted."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception as e:
+            logger.warning(f"Dropping pooled MySQL connection that could not be reset: {str(e)}")
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown)."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
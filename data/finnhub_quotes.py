@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+import heapq
+import threading
+import time
+
+from utils.logger import logger
+
+# Finnhub's free tier allows 60 calls per minute per API key
+FINNHUB_CALLS_PER_MINUTE = 60
+QUOTE_WORKERS = 8
+DEFAULT_LATENCY_BUDGET = 5.0  # seconds a caller is willing to wait for quotes
+RETRY_DELAYS = (10, 20, 40, 60)  # background backoff for throttled symbols
+
+
+class RateLimited(Exception):
+    """Raised when a quote could not be fetched because of the rate limit."""
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    return isinstance(e, RateLimited) or "429" in str(e)
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every caller of one upstream API."""
+
+    def __init__(self, calls_per_minute: int, capacity: Optional[int] = None):
+        self.rate = calls_per_minute / 60.0
+        # A smaller burst than the per-minute quota keeps the rolling window under the limit
+        self.capacity = float(capacity or max(1, calls_per_minute // 4))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take one token, waiting at most `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_for = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_for = min(wait_for, remaining)
+            time.sleep(wait_for)
+
+    def drain(self):
+        """Empty the bucket after the upstream returned 429 so all callers back off."""
+        with self._lock:
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+
+# One limiter per process, shared by every Finnhub caller
+finnhub_rate_limiter = TokenBucket(FINNHUB_CALLS_PER_MINUTE)
+
+
+class QuoteFetcher:
+    """Fetch Finnhub quotes concurrently behind a shared rate limiter.
+
+    Calls return whatever arrived within the latency budget. Throttled symbols are
+    retried on a background thread and, like quotes that arrive after the budget,
+    are handed to `on_late_quote` instead of being waited on.
+    """
+
+    def __init__(self, client, bucket: Optional[TokenBucket] = None, max_workers: int = QUOTE_WORKERS,
+                 on_late_quote: Optional[Callable[[str, Dict], None]] = None):
+        self.client = client
+        self.bucket = bucket or finnhub_rate_limiter
+        self.on_late_quote = on_late_quote
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="finnhub-quote")
+        self._retry_heap: List[Tuple[float, str, int]] = []
+        self._deferred = set()
+        self._retry_cond = threading.Condition()
+        self._retry_thread = threading.Thread(target=self._retry_loop, name="finnhub-quote-retry", daemon=True)
+        self._retry_thread.start()
+
+    def _fetch_one(self, symbol: str, deadline: Optional[float]) -> Dict:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not self.bucket.acquire(timeout=timeout):
+            raise RateLimited(f"No Finnhub token available for {symbol} within budget")
+        try:
+            quote = self.client.quote(symbol)
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                self.bucket.drain()
+                raise RateLimited(str(e))
+            raise
+        if not isinstance(quote.get("c"), (int, float)) or quote["c"] <= 0:
+            raise ValueError(f"Invalid price data for {symbol}: {quote}")
+        return quote
+
+    def fetch(self, symbols: List[str], budget: float = DEFAULT_LATENCY_BUDGET) -> Tuple[Dict[str, Dict], List[str]]:
+        """Fetch quotes for `symbols`, returning (quotes, unresolved_symbols) within `budget` seconds."""
+        if not symbols:
+            return {}, []
+        deadline = time.monotonic() + budget
+        futures = {self._executor.submit(self._fetch_one, symbol, deadline): symbol for symbol in symbols}
+        done, not_done = wait(futures, timeout=budget)
+
+        quotes = {}
+        unresolved = []
+        for future in done:
+            symbol = futures[future]
+            try:
+                quotes[symbol] = future.result()
+            except Exception as e:
+                unresolved.append(symbol)
+                if _is_rate_limit_error(e):
+                    logger.warning(f"Rate limit for {symbol}, deferring to background retry")
+                    self.defer(symbol)
+                else:
+                    logger.error(f"Failed to fetch Finnhub price for {symbol}: {str(e)}")
+        for future in not_done:
+            symbol = futures[future]
+            unresolved.append(symbol)
+            logger.info(f"Quote for {symbol} missed the {budget:.1f}s budget, delivering in background")
+            future.add_done_callback(lambda f, s=symbol: self._deliver_late(s, f))
+
+        logger.info(f"Fetched {len(quotes)}/{len(symbols)} Finnhub quotes within budget")
+        return quotes, unresolved
+
+    def _deliver_late(self, symbol: str, future):
+        try:
+            quote = future.result()
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                self.defer(symbol)
+            else:
+                logger.error(f"Late Finnhub fetch failed for {symbol}: {str(e)}")
+            return
+        self._notify(symbol, quote)
+
+    def _notify(self, symbol: str, quote: Dict):
+        if self.on_late_quote is None:
+            return
+        try:
+            self.on_late_quote(symbol, quote)
+        except Exception as e:
+            logger.error(f"Late quote handler failed for {symbol}: {str(e)}")
+
+    def defer(self, symbol: str, attempt: int = 0):
+        """Schedule a background retry for a throttled symbol."""
+        if attempt >= len(RETRY_DELAYS):
+            logger.error(f"Rate limit exceeded for {symbol}, giving up after {attempt} retries")
+            return
+        with self._retry_cond:
+            if attempt == 0 and symbol in self._deferred:
+                return
+            self._deferred.add(symbol)
+            heapq.heappush(self._retry_heap, (time.monotonic() + RETRY_DELAYS[attempt], symbol, attempt))
+            self._retry_cond.notify()
+
+    def pending(self) -> List[str]:
+        """Symbols currently waiting for a background retry."""
+        with self._retry_cond:
+            return sorted(self._deferred)
+
+    def _retry_loop(self):
+        while True:
+            with self._retry_cond:
+                while not self._retry_heap:
+                    self._retry_cond.wait()
+                due, symbol, attempt = self._retry_heap[0]
+                now = time.monotonic()
+                if due > now:
+                    self._retry_cond.wait(timeout=due - now)
+                    continue
+                heapq.heappop(self._retry_heap)
+            self._executor.submit(self._retry_one, symbol, attempt)
+
+    def _retry_one(self, symbol: str, attempt: int):
+        try:
+            quote = self._fetch_one(symbol, deadline=None)
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                logger.warning(f"Rate limit for {symbol} again, retry {attempt + 1}/{len(RETRY_DELAYS)}")
+                with self._retry_cond:
+                    self._deferred.discard(symbol)
+                self.defer(symbol, attempt + 1)
+            else:
+                logger.error(f"Background retry failed for {symbol}: {str(e)}")
+                with self._retry_cond:
+                    self._deferred.discard(symbol)
+            return
+        with self._retry_cond:
+            self._deferred.discard(symbol)
+        logger.info(f"Background retry fetched {symbol}: ${quote['c']:.2f}")
+        self._notify(symbol, quote)
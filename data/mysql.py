@@ -2,29 +2,55 @@ import mysql.connector
 # from utils.config import MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
 from utils.config import AZURE_USER, AZURE_PASSWORD, AZURE_HOSTNAME, AZURE_PORT, AZURE_DATABASE, AZURE_SSL_CA
 from utils.logger import logger
+from data.db_pool import ConnectionPool
+from contextlib import contextmanager
 import json
 import uuid
 
+# Pool settings: every module shares these connections instead of paying a TLS handshake per query
+POOL_MAX_SIZE = 5
+POOL_CHECKOUT_TIMEOUT = 10  # seconds
+POOL_HEALTH_CHECK_INTERVAL = 30  # seconds a connection may sit idle before it is pinged
+
+def _connect():
+    # connection = mysql.connector.connect(
+    #     host=MYSQL_HOST,
+    #     user=MYSQL_USER,
+    #     password=MYSQL_PASSWORD,
+    #     database=MYSQL_DATABASE
+    # )
+    return mysql.connector.connect(
+        user=AZURE_USER, 
+        password=AZURE_PASSWORD,
+        host=AZURE_HOSTNAME,
+        port=AZURE_PORT, 
+        database=AZURE_DATABASE, 
+        ssl_ca=AZURE_SSL_CA,ssl_verify_cert=True)
+
+_pool = ConnectionPool(
+    _connect,
+    max_size=POOL_MAX_SIZE,
+    checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+    health_check_interval=POOL_HEALTH_CHECK_INTERVAL
+)
+
 def get_db_connection():
+    """Borrow a pooled connection; close() returns it to the pool."""
     try:
-        # connection = mysql.connector.connect(
-        #     host=MYSQL_HOST,
-        #     user=MYSQL_USER,
-        #     password=MYSQL_PASSWORD,
-        #     database=MYSQL_DATABASE
-        # )
-        connection =  mysql.connector.connect(
-            user=AZURE_USER, 
-            password=AZURE_PASSWORD,
-            host=AZURE_HOSTNAME,
-            port=AZURE_PORT, 
-            database=AZURE_DATABASE, 
-            ssl_ca=AZURE_SSL_CA,ssl_verify_cert=True)
-        return connection
+        return _pool.get()
     except Exception as e:
         logger.error(f"MySQL connection failed: {str(e)}")
         raise
 
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection for the duration of a with-block."""
+    connection = get_db_connection()
+    try:
+        yield connection
+    finally:
+        connection.close()
+
 def initialize_db():
     connection = get_db_connection()
     cursor = connection.cursor()
@@ -83,6 +109,60 @@ def initialize_db():
                 FOREIGN KEY (user_id) REFERENCES users(id)
             )
         """)
+        # Migrate trades table: add_trade records the share quantity
+        cursor.execute("SHOW COLUMNS FROM trades LIKE 'quantity'")
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE trades ADD COLUMN quantity FLOAT")
+        cursor.execute("SHOW INDEX FROM trades WHERE Key_name = 'idx_trades_user_ts'")
+        if not cursor.fetchall():
+            cursor.execute("CREATE INDEX idx_trades_user_ts ON trades (user_id, timestamp)")
+        # Create positions table if not exists; maintained by add_trade. Users who traded before
+        # it existed are filled in from the ledger by virtual_currency.migrate_positions on first use
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS positions (
+                user_id VARCHAR(36) NOT NULL,
+                symbol VARCHAR(10) NOT NULL,
+                quantity DOUBLE NOT NULL DEFAULT 0,
+                cost_basis DOUBLE NOT NULL DEFAULT 0,
+                realized_pnl DOUBLE NOT NULL DEFAULT 0,
+                updated_at DATETIME NOT NULL,
+                PRIMARY KEY (user_id, symbol),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        # Create leaderboard_snapshots table if not exists; periodic copies of the in-memory equity ranking
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leaderboard_snapshots (
+                taken_at DATETIME NOT NULL,
+                user_rank INT NOT NULL,
+                user_id VARCHAR(36) NOT NULL,
+                username VARCHAR(100) NOT NULL,
+                equity DOUBLE NOT NULL,
+                cash DOUBLE NOT NULL,
+                PRIMARY KEY (taken_at, user_rank)
+            )
+        """)
+        # Create price_history table if not exists; append-only ticks, partitioned by year
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS price_history (
+                symbol VARCHAR(10) NOT NULL,
+                ts DATETIME NOT NULL,
+                open_price DOUBLE NOT NULL,
+                high_price DOUBLE NOT NULL,
+                low_price DOUBLE NOT NULL,
+                close_price DOUBLE NOT NULL,
+                volume DOUBLE NOT NULL DEFAULT 0,
+                PRIMARY KEY (symbol, ts),
+                KEY idx_price_history_ts (ts)
+            )
+            PARTITION BY RANGE COLUMNS(ts) (
+                PARTITION p2024 VALUES LESS THAN ('2025-01-01'),
+                PARTITION p2025 VALUES LESS THAN ('2026-01-01'),
+                PARTITION p2026 VALUES LESS THAN ('2027-01-01'),
+                PARTITION p2027 VALUES LESS THAN ('2028-01-01'),
+                PARTITION pmax VALUES LESS THAN (MAXVALUE)
+            )
+        """)
         connection.commit()
         logger.info("MySQL tables initialized and migrated")
     except Exception as e:
@@ -0,0 +1,195 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from data.mysql_db import db_connection
+from data.price_store import COLUMNS, price_store
+from utils.logger import logger
+
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    return {name: np.empty(0, dtype=np.int64 if name == "ts" else np.float64) for name in COLUMNS}
+
+
+def _to_epoch(value) -> int:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
+def quotes_to_rows(quotes: Dict[str, dict], ts: Optional[datetime] = None) -> List[Tuple]:
+    """Turn Finnhub quotes into (symbol, ts, open, high, low, close, volume) rows."""
+    fallback = ts or datetime.now(timezone.utc)
+    rows = []
+    for symbol, quote in quotes.items():
+        # Finnhub's "t" is the time of the last trade, so repeated polls of a closed market dedupe
+        quote_ts = datetime.fromtimestamp(quote["t"], timezone.utc) if quote.get("t") else fallback
+        rows.append((
+            symbol, quote_ts.replace(tzinfo=None),
+            float(quote["o"]), float(quote["h"]), float(quote["l"]), float(quote["c"]),
+            float(quote.get("v", 0.0) or 0.0)
+        ))
+    return rows
+
+
+def record_rows(rows: List[Tuple], conn=None) -> List[Tuple]:
+    """Append history rows to MySQL in one batch; returns the rows written, or [] on failure.
+
+    Without `conn` the rows are committed and then mirrored to the local
+    memmap store. A caller that passes its own connection owns the
+    transaction and mirrors the returned rows with append_to_cache once it
+    has committed.
+    """
+    if not rows:
+        return []
+    try:
+        if conn is None:
+            with db_connection() as pooled:
+                _insert_rows(pooled, rows)
+                pooled.commit()
+        else:
+            _insert_rows(conn, rows)
+    except Exception as e:
+        logger.error(f"Failed to record {len(rows)} price history rows: {str(e)}")
+        return []
+    if conn is None:
+        append_to_cache(rows)
+    return rows
+
+
+def record_quotes(quotes: Dict[str, dict], ts: Optional[datetime] = None, conn=None) -> List[Tuple]:
+    return record_rows(quotes_to_rows(quotes, ts), conn)
+
+
+def _insert_rows(conn, rows: List[Tuple]):
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT IGNORE INTO price_history (symbol, ts, open_price, high_price, low_price, close_price, volume)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, rows)
+    cursor.close()
+    logger.info(f"Recorded {len(rows)} price history rows")
+
+
+def rows_to_columns(rows: List[Tuple]) -> Dict[str, np.ndarray]:
+    """Convert (ts, open, high, low, close, volume) tuples into NumPy columns in one pass per column."""
+    if not rows:
+        return _empty_columns()
+    ts, o, h, l, c, v = zip(*rows)
+    return {
+        # Naive DATETIME values are UTC, so datetime64[s] gives epoch seconds directly
+        "ts": np.array(ts, dtype="datetime64[s]").astype(np.int64),
+        "open": np.array(o, dtype=np.float64),
+        "high": np.array(h, dtype=np.float64),
+        "low": np.array(l, dtype=np.float64),
+        "close": np.array(c, dtype=np.float64),
+        "volume": np.array(v, dtype=np.float64),
+    }
+
+
+def append_to_cache(rows: List[Tuple]):
+    """Append (symbol, ts, ...) rows to the per-symbol memmap files."""
+    by_symbol: Dict[str, List[Tuple]] = {}
+    for row in rows:
+        by_symbol.setdefault(row[0], []).append(row[1:])
+    for symbol, symbol_rows in by_symbol.items():
+        try:
+            price_store.append(symbol, rows_to_columns(symbol_rows))
+        except Exception as e:
+            logger.error(f"Failed to update local price history for {symbol}: {str(e)}")
+
+
+HISTORY_QUERY = """
+    SELECT ts, open_price, high_price, low_price, close_price, volume
+    FROM price_history
+    WHERE symbol = %s AND ts > %s AND ts < %s
+    ORDER BY ts
+"""
+
+
+def iter_history_from_db(symbol: str, after: Optional[datetime] = None, before: Optional[datetime] = None,
+                         chunk_size: int = 50000):
+    """Yield column chunks for after < ts < before straight from MySQL, oldest first."""
+    after = after or datetime(1970, 1, 1)
+    before = before or datetime(9999, 1, 1)
+    with db_connection() as conn:
+        # A plain tuple cursor avoids building a dict per row
+        cursor = conn.cursor()
+        cursor.execute(HISTORY_QUERY, (symbol, after.replace(tzinfo=None), before.replace(tzinfo=None)))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows_to_columns(rows)
+        cursor.close()
+
+
+def load_history_from_db(symbol: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """Range-query MySQL for one symbol and return columns as NumPy arrays."""
+    try:
+        chunks = list(iter_history_from_db(symbol, start - timedelta(seconds=1) if start else None, end))
+    except Exception as e:
+        logger.error(f"Failed to load price history for {symbol}: {str(e)}")
+        return _empty_columns()
+    if not chunks:
+        return _empty_columns()
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMNS}
+
+
+def get_history(symbol: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """Return {column: array} for symbol in [start, end).
+
+    Reads are zero-copy slices of the memmap store. The first read of a symbol
+    merges its MySQL history into the store, including rows older than live
+    ticks that reached the store first.
+    """
+    history = price_store.open(symbol)
+    if history is None or not history.backfilled:
+        try:
+            chunks = list(iter_history_from_db(symbol))
+        except Exception as e:
+            # Leave the symbol unmarked so the next read tries again
+            logger.error(f"Failed to load price history for {symbol}: {str(e)}")
+            chunks = None
+        if chunks is not None:
+            columns = ({name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMNS}
+                       if chunks else _empty_columns())
+            price_store.backfill(symbol, columns)
+        history = price_store.open(symbol)
+        if history is None:
+            return _empty_columns()
+    return history.slice(_to_epoch(start) if start else None, _to_epoch(end) if end else None)
+
+
+def get_close_matrix(symbols: List[str], start: Optional[datetime] = None,
+                     end: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Daily closes aligned across symbols: (day_timestamps, closes[days, symbols]).
+
+    Each day keeps the last close seen; days where a symbol has no data carry the
+    previous close forward, and leading gaps stay NaN.
+    """
+    per_symbol = []
+    for symbol in symbols:
+        history = get_history(symbol, start, end)
+        days = history["ts"] // 86400
+        # Last observation per day: unique on the reversed array picks the final index
+        unique_days, last_rev = np.unique(days[::-1], return_index=True)
+        last = len(days) - 1 - last_rev
+        per_symbol.append((unique_days, history["close"][last]))
+
+    all_days = np.unique(np.concatenate([d for d, _ in per_symbol])) if per_symbol else np.empty(0, dtype=np.int64)
+    closes = np.full((len(all_days), len(symbols)), np.nan)
+    for j, (days, values) in enumerate(per_symbol):
+        if not len(days):
+            continue
+        idx = np.searchsorted(all_days, days)
+        closes[idx, j] = values
+        # Forward-fill gaps using the index of the last valid row
+        valid = np.where(~np.isnan(closes[:, j]), np.arange(len(all_days)), -1)
+        np.maximum.accumulate(valid, out=valid)
+        filled = valid >= 0
+        closes[filled, j] = closes[valid[filled], j]
+    return all_days * 86400, closes
@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
+import hashlib
+import json
+
+from utils.logger import logger
+
+QUOTE_FIELDS = ("current_price", "high_price", "low_price", "previous_close")
+EMPTY_QUOTE = MappingProxyType({field: 0.0 for field in QUOTE_FIELDS})
+# Use the price refresher's shared cache instead of the network when it is at most this old
+SNAPSHOT_MAX_CACHE_AGE = 300  # seconds
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """Immutable set of quotes captured once and shared by every agent in a run."""
+    prices: Mapping[str, Mapping[str, float]]
+    taken_at: datetime
+    version: str
+
+    @classmethod
+    def from_stock_data(cls, stock_data: Dict[str, Dict], taken_at: Optional[datetime] = None) -> "PriceSnapshot":
+        """Freeze a fetch_stock_prices() style dict into a snapshot."""
+        frozen = {
+            symbol: MappingProxyType({field: _to_float(data.get(field)) for field in QUOTE_FIELDS})
+            for symbol, data in (stock_data or {}).items()
+        }
+        # The version only depends on the quotes, so two runs that saw the same
+        # prices share a version (and any cache keyed on it).
+        payload = json.dumps({symbol: dict(quote) for symbol, quote in frozen.items()}, sort_keys=True)
+        version = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+        return cls(
+            prices=MappingProxyType(frozen),
+            taken_at=taken_at or datetime.now(timezone.utc),
+            version=version
+        )
+
+    @classmethod
+    def capture(cls, max_cache_age: float = SNAPSHOT_MAX_CACHE_AGE) -> "PriceSnapshot":
+        """Freeze current prices, preferring the refresher's shared cache over the network."""
+        taken_at = None
+        try:
+            from scripts.fetch_stock_prices import fetch_stock_prices, read_shared_prices
+            stock_data, refreshed_at = read_shared_prices()
+            if refreshed_at is not None and (datetime.now(timezone.utc) - refreshed_at).total_seconds() <= max_cache_age:
+                taken_at = refreshed_at
+            else:
+                stock_data = fetch_stock_prices()
+        except Exception as e:
+            logger.error(f"Failed to capture price snapshot: {str(e)}")
+            stock_data = {}
+        snapshot = cls.from_stock_data(stock_data, taken_at)
+        logger.info(f"Captured price snapshot {snapshot.version} with {len(snapshot)} symbols")
+        return snapshot
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PriceSnapshot":
+        """Rebuild a snapshot from to_dict() output, keeping its version."""
+        return cls(
+            prices=MappingProxyType({
+                symbol: MappingProxyType({field: _to_float(quote.get(field)) for field in QUOTE_FIELDS})
+                for symbol, quote in data.get("prices", {}).items()
+            }),
+            taken_at=datetime.fromisoformat(data["taken_at"]),
+            version=data["version"]
+        )
+
+    def to_dict(self) -> Dict:
+        """Plain, serializable form (e.g. for workflow state checkpoints)."""
+        return {
+            "prices": self.to_stock_data(),
+            "taken_at": self.taken_at.isoformat(),
+            "version": self.version
+        }
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.prices
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self.prices.keys())
+
+    def quote(self, symbol: str) -> Mapping[str, float]:
+        return self.prices.get(symbol, EMPTY_QUOTE)
+
+    def price(self, symbol: str) -> float:
+        return self.quote(symbol)["current_price"]
+
+    def to_stock_data(self) -> Dict[str, Dict[str, float]]:
+        """Return a mutable copy in the fetch_stock_prices() format."""
+        return {symbol: dict(quote) for symbol, quote in self.prices.items()}
+
+    def to_prompt_data(self) -> Dict[str, Dict[str, float]]:
+        """Return the compact {symbol: {"price": ...}} view used in LLM prompts."""
+        return {symbol: {"price": quote["current_price"]} for symbol, quote in self.prices.items()}
@@ -0,0 +1,248 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: only writers inside one process are serialized
+    fcntl = None
+
+import numpy as np
+
+from utils.logger import logger
+
+STORE_DIR = Path("finance_simulator/history")
+STORE_MAGIC = b"PXHIST01"
+STORE_VERSION = 1
+COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+COLUMN_DTYPES = {name: np.dtype("<i8") if name == "ts" else np.dtype("<f8") for name in COLUMNS}
+INITIAL_CAPACITY = 4096  # rows; files double when full
+FLAG_BACKFILLED = 1      # header flag: the symbol's MySQL history has been merged in
+
+# Fixed 64-byte header: the index readers need without touching the columns
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("ncols", "<u4"),
+    ("rows", "<u8"),
+    ("capacity", "<u8"),
+    ("first_ts", "<i8"),
+    ("last_ts", "<i8"),
+    ("flags", "<u8"),
+    ("reserved", "S8"),
+])
+HEADER_SIZE = HEADER_DTYPE.itemsize
+
+
+class PriceStoreError(Exception):
+    """Raised when a history file is missing its header or has an unknown format."""
+
+
+class SymbolHistory:
+    """Read-only memmap view of one symbol's columns.
+
+    Columns live back to back after the header, each `capacity` rows long, so
+    every column is one contiguous array and slices are views into the file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header["magic"][0] != STORE_MAGIC:
+            raise PriceStoreError(f"{path} is not a price history file")
+        if header["version"][0] != STORE_VERSION or header["ncols"][0] != len(COLUMNS):
+            raise PriceStoreError(f"{path} has unsupported format version {header['version'][0]}")
+        self.rows = int(header["rows"][0])
+        self.capacity = int(header["capacity"][0])
+        self.first_ts = int(header["first_ts"][0])
+        self.last_ts = int(header["last_ts"][0])
+        self.flags = int(header["flags"][0])
+        self.columns: Dict[str, np.ndarray] = {}
+        for i, name in enumerate(COLUMNS):
+            if self.rows == 0:
+                self.columns[name] = np.empty(0, dtype=COLUMN_DTYPES[name])
+                continue
+            self.columns[name] = np.memmap(path, dtype=COLUMN_DTYPES[name], mode="r",
+                                           offset=HEADER_SIZE + i * self.capacity * 8, shape=(self.rows,))
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def backfilled(self) -> bool:
+        return bool(self.flags & FLAG_BACKFILLED)
+
+    @property
+    def ts(self) -> np.ndarray:
+        return self.columns["ts"]
+
+    def slice(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Zero-copy views of every column for start_ts <= ts < end_ts (epoch seconds)."""
+        lo = int(np.searchsorted(self.ts, start_ts)) if start_ts is not None else 0
+        hi = int(np.searchsorted(self.ts, end_ts)) if end_ts is not None else self.rows
+        return {name: column[lo:hi] for name, column in self.columns.items()}
+
+
+class PriceStore:
+    """Directory of per-symbol memmap history files, appended in time order.
+
+    The refresher and the app both write, so every write holds an exclusive
+    flock on the symbol's lock file; readers never take it.
+    """
+
+    def __init__(self, root: Path = STORE_DIR):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def path(self, symbol: str) -> Path:
+        return self.root / f"{symbol}.bin"
+
+    @contextmanager
+    def _write_lock(self, symbol: str):
+        """Serialize writers to one symbol across threads and processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            # A separate lock file, because resizing replaces the .bin file
+            with open(self.root / f"{symbol}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def exists(self, symbol: str) -> bool:
+        return self.path(symbol).exists()
+
+    def open(self, symbol: str) -> Optional[SymbolHistory]:
+        path = self.path(symbol)
+        if not path.exists():
+            return None
+        try:
+            return SymbolHistory(path)
+        except (PriceStoreError, ValueError, OSError) as e:
+            logger.error(f"Failed to open price history for {symbol}: {str(e)}")
+            return None
+
+    def last_ts(self, symbol: str) -> Optional[int]:
+        """Newest stored timestamp, read from the header only."""
+        history = self.open(symbol)
+        return history.last_ts if history is not None and len(history) else None
+
+    def append(self, symbol: str, columns: Dict[str, np.ndarray]) -> int:
+        """Append rows newer than the last stored timestamp; returns how many were written."""
+        ts = np.asarray(columns["ts"], dtype=np.int64)
+        order = np.argsort(ts, kind="stable")
+        ts = ts[order]
+        with self._write_lock(symbol):
+            history = self.open(symbol)
+            rows = len(history) if history is not None else 0
+            if rows:
+                keep = ts > history.last_ts
+                order, ts = order[keep], ts[keep]
+            # Drop duplicate timestamps inside the batch, keeping the first like INSERT IGNORE
+            if len(ts) > 1:
+                first = np.concatenate(([True], ts[1:] != ts[:-1]))
+                order, ts = order[first], ts[first]
+            if not len(ts):
+                return 0
+
+            capacity = history.capacity if history is not None else 0
+            if rows + len(ts) > capacity:
+                capacity = max(INITIAL_CAPACITY, capacity)
+                while capacity < rows + len(ts):
+                    capacity *= 2
+                self._rewrite(symbol, history.columns if history is not None else None, capacity,
+                              history.flags if history is not None else 0)
+
+            path = self.path(symbol)
+            for i, name in enumerate(COLUMNS):
+                values = ts if name == "ts" else np.asarray(columns[name], dtype=np.float64)[order]
+                target = np.memmap(path, dtype=COLUMN_DTYPES[name], mode="r+",
+                                   offset=HEADER_SIZE + i * capacity * 8, shape=(capacity,))
+                target[rows:rows + len(ts)] = values
+                target.flush()
+                del target
+            # The header is written last so readers never see rows that are not on disk yet
+            first_ts = history.first_ts if rows else int(ts[0])
+            flags = history.flags if history is not None else 0
+            self._write_header(path, rows + len(ts), capacity, first_ts, int(ts[-1]), flags)
+            return len(ts)
+
+    def backfill(self, symbol: str, columns: Dict[str, np.ndarray]) -> int:
+        """Merge in rows at any timestamp not yet stored and mark the symbol backfilled.
+
+        Unlike append this rewrites the file, so it is meant for the one-off
+        import of older history; returns how many rows were added.
+        """
+        ts = np.asarray(columns["ts"], dtype=np.int64)
+        order = np.argsort(ts, kind="stable")
+        ts = ts[order]
+        with self._write_lock(symbol):
+            history = self.open(symbol)
+            rows = len(history) if history is not None else 0
+            if len(ts) > 1:
+                first = np.concatenate(([True], ts[1:] != ts[:-1]))
+                order, ts = order[first], ts[first]
+            if rows:
+                missing = ~np.isin(ts, history.ts)
+                order, ts = order[missing], ts[missing]
+            merged = {name: np.concatenate((history.columns[name] if rows else np.empty(0, COLUMN_DTYPES[name]),
+                                            ts if name == "ts" else np.asarray(columns[name], np.float64)[order]))
+                      for name in COLUMNS}
+            by_time = np.argsort(merged["ts"], kind="stable")
+            merged = {name: column[by_time] for name, column in merged.items()}
+            capacity = max(INITIAL_CAPACITY, history.capacity if history is not None else 0)
+            while capacity < len(by_time):
+                capacity *= 2
+            flags = (history.flags if history is not None else 0) | FLAG_BACKFILLED
+            self._rewrite(symbol, merged, capacity, flags)
+            return len(ts)
+
+    def _write_header(self, path: Path, rows: int, capacity: int, first_ts: int, last_ts: int, flags: int = 0):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = STORE_MAGIC
+        header["version"] = STORE_VERSION
+        header["ncols"] = len(COLUMNS)
+        header["rows"] = rows
+        header["capacity"] = capacity
+        header["first_ts"] = first_ts
+        header["last_ts"] = last_ts
+        header["flags"] = flags
+        with open(path, "r+b") as f:
+            f.write(header.tobytes())
+
+    def _rewrite(self, symbol: str, columns: Optional[Dict[str, np.ndarray]], capacity: int, flags: int):
+        """Write `columns` (time ordered) to a fresh file with room for `capacity` rows per column."""
+        path = self.path(symbol)
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.truncate(HEADER_SIZE + len(COLUMNS) * capacity * 8)
+        rows = len(columns["ts"]) if columns is not None else 0
+        for i, name in enumerate(COLUMNS):
+            if not rows:
+                break
+            target = np.memmap(tmp, dtype=COLUMN_DTYPES[name], mode="r+",
+                               offset=HEADER_SIZE + i * capacity * 8, shape=(capacity,))
+            target[:rows] = columns[name]
+            target.flush()
+            del target
+        if rows:
+            self._write_header(tmp, rows, capacity, int(columns["ts"][0]), int(columns["ts"][-1]), flags)
+        else:
+            self._write_header(tmp, 0, capacity, 0, 0, flags)
+        os.replace(tmp, path)
+        logger.info(f"Rewrote price history for {symbol} with room for {capacity} rows")
+
+    def remove(self, symbol: str):
+        with self._write_lock(symbol):
+            self.path(symbol).unlink(missing_ok=True)
+
+
+# Shared by the history writers and the exporter
+price_store = PriceStore()
@@ -1,6 +1,16 @@
-from data.mysql_db import get_db_connection
+from data.mysql_db import db_connection
+from gamification.rank_index import EquityRankIndex
 from utils.logger import logger
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 import mysql.connector
+import threading
+import time
+
+LEADERBOARD_SIZE = 10
+SNAPSHOT_INTERVAL = 300  # seconds between persisted leaderboard snapshots
+SNAPSHOT_TOP_N = 100     # ranks kept per persisted snapshot
+RESYNC_INTERVAL = 900    # seconds between full reloads, which pick up trades made by other processes
 
 def mask_balance(balance: float) -> str:
     """Mask the balance to obscure the exact amount (e.g., $123,456.78 -> $12X,XXX.XX)."""
@@ -19,16 +29,15 @@ def mask_balance(balance: float) -> str:
 
 def update_leaderboard(user_id: str, username: str, balance: float):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE users 
-            SET balance = %s
-            WHERE id = %s
-        """, (balance, user_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE users 
+                SET balance = %s
+                WHERE id = %s
+            """, (balance, user_id))
+            conn.commit()
+            cursor.close()
         logger.info(f"Leaderboard updated for user {user_id}: Balance ${balance}")
     except mysql.connector.Error as e:
         logger.error(f"Failed to update leaderboard for user {user_id}: SQL Error: {str(e)}")
@@ -36,36 +45,212 @@ def update_leaderboard(user_id: str, username: str, balance: float):
     except Exception as e:
         logger.error(f"Unexpected error updating leaderboard for user {user_id}: {str(e)}")
         raise
-    finally:
-        if 'conn' in locals() and conn.is_connected():
+
+class EquityLeaderboard:
+    """Users ranked by equity (cash plus holdings at current prices), kept sorted in memory.
+
+    A trade re-marks only the trading user and a price tick only the holders
+    of the symbols that moved, so reading the top N is a slice of the ranking.
+    Holdings without a price count at cost.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users: Dict[str, Dict] = {}
+        self._holders: Dict[str, set] = {}            # symbol -> user ids holding it
+        self._index = EquityRankIndex()
+        self._prices: Dict[str, float] = {}
+        self._prices_at: Optional[datetime] = None
+        self._loaded_at: Optional[float] = None
+        self._persisted_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _holdings_value(self, holdings: Dict[str, Tuple[float, float]]) -> float:
+        value = 0.0
+        for symbol, (quantity, cost_basis) in holdings.items():
+            price = self._prices.get(symbol, 0.0)
+            value += quantity * price if price > 0 else cost_basis
+        return value
+
+    def _remove(self, user_id: str):
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return
+        self._index.remove(user["equity"], user_id)
+        for symbol in user["holdings"]:
+            self._holders[symbol].discard(user_id)
+
+    def _insert(self, user_id: str, username: str, cash: float, holdings: Dict[str, Tuple[float, float]]):
+        self._remove(user_id)
+        holdings_value = self._holdings_value(holdings)
+        equity = cash + holdings_value
+        self._users[user_id] = {"username": username, "cash": cash, "holdings": holdings,
+                                "holdings_value": holdings_value, "equity": equity}
+        for symbol in holdings:
+            self._holders.setdefault(symbol, set()).add(user_id)
+        self._index.add(equity, user_id)
+
+    def _reprice(self, user_id: str):
+        user = self._users[user_id]
+        self._insert(user_id, user["username"], user["cash"], user["holdings"])
+
+    def apply_prices(self, prices: Dict[str, float], as_of: Optional[datetime] = None) -> int:
+        """Apply a price tick; returns how many users were re-ranked."""
+        with self._lock:
+            moved = [symbol for symbol, price in prices.items() if price > 0 and self._prices.get(symbol) != price]
+            self._prices.update({symbol: prices[symbol] for symbol in moved})
+            if as_of is not None:
+                self._prices_at = as_of
+            affected = set().union(*(self._holders.get(symbol, ()) for symbol in moved))
+            for user_id in affected:
+                self._reprice(user_id)
+            return len(affected)
+
+    def _fetch_users(self, cursor, user_id: Optional[str] = None) -> Dict[str, Dict]:
+        where, params = ("WHERE user_id = %s", (user_id,)) if user_id else ("", ())
+        cursor.execute(f"SELECT user_id, symbol, quantity, cost_basis FROM positions {where}", params)
+        holdings: Dict[str, Dict[str, Tuple[float, float]]] = {}
+        for row in cursor.fetchall():
+            holdings.setdefault(row["user_id"], {})
+            if float(row["quantity"]) > 0:
+                holdings[row["user_id"]][row["symbol"]] = (float(row["quantity"]), float(row["cost_basis"]))
+        if not holdings:
+            return {}
+        # Only users who have traded appear on the leaderboard
+        placeholders = ", ".join(["%s"] * len(holdings))
+        cursor.execute(f"SELECT id, username, balance FROM users WHERE id IN ({placeholders})", tuple(holdings))
+        return {row["id"]: {"username": row["username"], "cash": float(row["balance"]),
+                            "holdings": holdings[row["id"]]} for row in cursor.fetchall()}
+
+    def load(self):
+        """Rebuild the whole ranking from the users and positions tables and stored prices."""
+        from gamification.virtual_currency import migrate_positions
+        from scripts.fetch_stock_prices import read_shared_prices, read_stock_prices
+        migrate_positions()
+        _, prices_at = read_shared_prices()
+        prices = {symbol: float(data.get("current_price") or 0.0) for symbol, data in read_stock_prices().items()}
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            users = self._fetch_users(cursor)
             cursor.close()
-            conn.close()
+        with self._lock:
+            self._users, self._holders, self._index = {}, {}, EquityRankIndex()
+            self._prices = {symbol: price for symbol, price in prices.items() if price > 0}
+            self._prices_at = prices_at
+            for user_id, user in users.items():
+                self._insert(user_id, user["username"], user["cash"], user["holdings"])
+            self._loaded_at = time.monotonic()
+        logger.info(f"Loaded equity leaderboard with {len(users)} users")
 
-def get_leaderboard():
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
+    def refresh_user(self, user_id: str):
+        """Re-read one user's cash and positions, e.g. right after their trade commits."""
+        if self._loaded_at is None:
+            return  # built lazily; the first load will include this trade
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            user = self._fetch_users(cursor, user_id).get(user_id)
+            cursor.close()
+        with self._lock:
+            if user is None:
+                self._remove(user_id)
+            else:
+                self._insert(user_id, user["username"], user["cash"], user["holdings"])
 
-        cursor.execute("""
-            SELECT u.username, u.balance
-            FROM users u
-            WHERE EXISTS (
-                SELECT 1 FROM trades t WHERE t.user_id = u.id
-            )
-            ORDER BY u.balance DESC
-            LIMIT 10
-        """)
+    def sync(self):
+        """Load on first use or when due for a full reload; otherwise apply any new price tick."""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= RESYNC_INTERVAL:
+            self.load()
+            return
+        from scripts.fetch_stock_prices import read_shared_prices
+        stock_data, refreshed_at = read_shared_prices()
+        if refreshed_at is not None and refreshed_at != self._prices_at:
+            self.apply_prices({symbol: float(data.get("current_price") or 0.0) for symbol, data in stock_data.items()},
+                              as_of=refreshed_at)
 
-        leaderboard = cursor.fetchall()
+    def _row(self, user_id: str, rank: int) -> Dict:
+        user = self._users[user_id]
+        return {
+            "rank": rank,
+            "user_id": user_id,
+            "username": user["username"],
+            "equity": user["equity"],
+            "cash": user["cash"],
+            "holdings_value": user["holdings_value"],
+        }
 
-        for user in leaderboard:
-            user["masked_balance"] = mask_balance(user["balance"])
+    def top(self, n: int = LEADERBOARD_SIZE) -> List[Dict]:
+        with self._lock:
+            return [self._row(user_id, rank) for rank, (_, user_id) in enumerate(self._index.top(n), start=1)]
+
+    def rank_of(self, user_id: str) -> Optional[Dict]:
+        """Rank, board size and percentile (share of other users ranked below) of one user."""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return None
+            rank, total = self._index.rank(user["equity"], user_id), len(self._index)
+            row = self._row(user_id, rank)
+            row["total"] = total
+            row["percentile"] = self._index.percentile(rank)
+            return row
+
+    def maybe_persist(self, interval: float = SNAPSHOT_INTERVAL, top_n: int = SNAPSHOT_TOP_N) -> bool:
+        """Store the current top ranks in leaderboard_snapshots if the last snapshot is old enough."""
+        with self._lock:
+            if time.monotonic() - self._persisted_at < interval or not len(self._index):
+                return False
+            self._persisted_at = time.monotonic()
+            rows = self.top(top_n)
+        taken_at = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        try:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    INSERT INTO leaderboard_snapshots (taken_at, user_rank, user_id, username, equity, cash)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, [(taken_at, row["rank"], row["user_id"], row["username"], row["equity"], row["cash"])
+                      for row in rows])
+                conn.commit()
+                cursor.close()
+            logger.info(f"Persisted leaderboard snapshot of {len(rows)} users")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to persist leaderboard snapshot: {str(e)}")
+            return False
+
+_equity_leaderboard: Optional[EquityLeaderboard] = None
+_equity_leaderboard_lock = threading.Lock()
+
+def get_equity_leaderboard() -> EquityLeaderboard:
+    """Process-wide leaderboard shared by every session."""
+    global _equity_leaderboard
+    with _equity_leaderboard_lock:
+        if _equity_leaderboard is None:
+            _equity_leaderboard = EquityLeaderboard()
+        return _equity_leaderboard
 
+def get_leaderboard(limit: int = LEADERBOARD_SIZE) -> List[Dict]:
+    """Top users by equity: cash plus holdings marked at current prices."""
+    try:
+        board = get_equity_leaderboard()
+        board.sync()
+        leaderboard = board.top(limit)
+        board.maybe_persist()
+        for user in leaderboard:
+            user["masked_equity"] = mask_balance(user["equity"])
         return leaderboard
     except Exception as e:
-        logging.error("Error getting leaderboard: %s", e)
+        logger.error(f"Error getting leaderboard: {str(e)}")
         return []
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+
+def get_user_rank(user_id: str) -> Optional[Dict]:
+    """Where one user stands on the equity leaderboard, or None if they have not traded."""
+    try:
+        board = get_equity_leaderboard()
+        board.sync()
+        return board.rank_of(user_id)
+    except Exception as e:
+        logger.error(f"Error getting leaderboard rank for user {user_id}: {str(e)}")
+        return None
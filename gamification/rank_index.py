@@ -0,0 +1,107 @@
+from bisect import bisect_left, insort
+from typing import List, Tuple
+
+SUBLIST_LOAD = 256  # keys per sublist; a sublist is split once it holds twice this many
+
+Key = Tuple[float, str]  # (-equity, user_id), so ascending order is best first
+
+
+class EquityRankIndex:
+    """Order statistics over equity for rank and percentile lookups in O(log N).
+
+    Keys are kept in sorted sublists of at most 2 * load entries, found by
+    bisecting each sublist's last key, with a Fenwick tree over the sublist
+    lengths. An update shifts at most one sublist however tightly equities
+    cluster, and a rank sums the lengths of the sublists before it.
+    """
+
+    def __init__(self, load: int = SUBLIST_LOAD):
+        self._load = load
+        self._lists: List[List[Key]] = []
+        self._maxes: List[Key] = []
+        self._tree: List[int] = [0]
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _rebuild(self):
+        """Recompute the Fenwick tree after sublists were split or dropped."""
+        size = len(self._lists)
+        tree = [0] * (size + 1)
+        for i, members in enumerate(self._lists, 1):
+            tree[i] += len(members)
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _update(self, pos: int, delta: int):
+        i = pos + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, pos: int) -> int:
+        """Keys in the sublists before `pos`."""
+        total, i = 0, pos
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def add(self, equity: float, user_id: str):
+        key = (-equity, user_id)
+        self._count += 1
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            self._rebuild()
+            return
+        pos = min(bisect_left(self._maxes, key), len(self._lists) - 1)
+        members = self._lists[pos]
+        insort(members, key)
+        self._maxes[pos] = members[-1]
+        if len(members) > 2 * self._load:
+            self._lists[pos:pos + 1] = [members[:self._load], members[self._load:]]
+            self._maxes[pos:pos + 1] = [members[self._load - 1], members[-1]]
+            self._rebuild()
+        else:
+            self._update(pos, 1)
+
+    def remove(self, equity: float, user_id: str):
+        key = (-equity, user_id)
+        pos = bisect_left(self._maxes, key)
+        members = self._lists[pos]
+        del members[bisect_left(members, key)]
+        self._count -= 1
+        if members:
+            self._maxes[pos] = members[-1]
+            self._update(pos, -1)
+        else:
+            del self._lists[pos]
+            del self._maxes[pos]
+            self._rebuild()
+
+    def rank(self, equity: float, user_id: str) -> int:
+        """1-based rank of a user in the index; 1 is the highest equity."""
+        key = (-equity, user_id)
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._lists):
+            return self._count + 1
+        return self._prefix(pos) + bisect_left(self._lists[pos], key) + 1
+
+    def percentile(self, rank: int) -> float:
+        """Share of the other users ranked below `rank`, 0-100."""
+        total = self._count
+        return 100.0 * (total - rank) / (total - 1) if total > 1 else 100.0
+
+    def top(self, n: int) -> List[Tuple[float, str]]:
+        """(equity, user_id) of the n highest, best first."""
+        result = []
+        for members in self._lists:
+            for neg_equity, user_id in members:
+                if len(result) >= n:
+                    return result
+                result.append((-neg_equity, user_id))
+        return result
@@ -1,17 +1,57 @@
-from data.mysql_db import get_db_connection
+from data.mysql_db import get_db_connection, db_connection
+from gamification.leaderboard import get_equity_leaderboard
+from portfolio.accounting import QUANTITY_EPSILON, book_from_trades
 from utils.logger import logger
 import mysql.connector
 from datetime import datetime
+from typing import Dict, List, Optional
 import decimal
+import threading
+
+POSITION_FIELDS = ("quantity", "cost_basis", "realized_pnl")
+# Set once this process has made sure every user with trades has positions rows
+_positions_migrated = False
+_positions_migrated_lock = threading.Lock()
+
+def empty_position() -> Dict[str, float]:
+    return {field: 0.0 for field in POSITION_FIELDS}
+
+def apply_trade(position: Dict[str, float], trade_type: str, quantity: float, price: float,
+                amount: Optional[float] = None) -> Dict[str, float]:
+    """Position after one trade, at average cost. Raises ValueError for a sell larger than the holding."""
+    held, cost_basis, realized = position["quantity"], position["cost_basis"], position["realized_pnl"]
+    if trade_type == "buy":
+        return {"quantity": held + quantity,
+                "cost_basis": cost_basis + (amount if amount is not None else quantity * price),
+                "realized_pnl": realized}
+    if quantity > held + QUANTITY_EPSILON:
+        raise ValueError(f"cannot sell {quantity} shares, only {held} held")
+    quantity = min(quantity, held)
+    avg_cost = cost_basis / held if held > 0 else price
+    remaining = held - quantity
+    if remaining <= QUANTITY_EPSILON:
+        remaining, cost_basis = 0.0, 0.0
+    else:
+        cost_basis -= avg_cost * quantity
+    return {"quantity": remaining, "cost_basis": cost_basis,
+            "realized_pnl": realized + (price - avg_cost) * quantity}
+
+def _write_position(cursor, user_id: str, symbol: str, position: Dict[str, float]):
+    cursor.execute("""
+        INSERT INTO positions (user_id, symbol, quantity, cost_basis, realized_pnl, updated_at)
+        VALUES (%s, %s, %s, %s, %s, NOW())
+        ON DUPLICATE KEY UPDATE
+            quantity = VALUES(quantity), cost_basis = VALUES(cost_basis),
+            realized_pnl = VALUES(realized_pnl), updated_at = VALUES(updated_at)
+    """, (user_id, symbol, position["quantity"], position["cost_basis"], position["realized_pnl"]))
 
 def get_balance(user_id: str) -> float:
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT balance FROM users WHERE id = %s", (user_id,))
+            result = cursor.fetchone()
+            cursor.close()
         return float(result["balance"]) if result else 100000.0
     except Exception as e:
         logger.error(f"Failed to get balance for user {user_id}: {str(e)}")
@@ -57,15 +97,33 @@ def add_trade(user_id: str, trade: dict) -> bool:
             logger.error(f"Invalid timestamp format: {trade['timestamp']}")
             return False
 
+        # Before this transaction: rebuilding takes the same users row lock
+        migrate_positions()
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Check balance for buy trades
-        current_balance = get_balance(user_id)
+        # Check balance for buy trades on the same connection, locking the row until commit
+        cursor.execute("SELECT balance FROM users WHERE id = %s FOR UPDATE", (user_id,))
+        row = cursor.fetchone()
+        current_balance = float(row[0]) if row else 100000.0
         if trade["trade_type"] == "buy" and trade["amount"] > current_balance:
             logger.error(f"Insufficient balance for user {user_id}: {trade['amount']} > {current_balance}")
             return False
 
+        # Apply the trade to the user's position; the row lock keeps concurrent trades in order
+        cursor.execute("""
+            SELECT quantity, cost_basis, realized_pnl FROM positions
+            WHERE user_id = %s AND symbol = %s FOR UPDATE
+        """, (user_id, trade["symbol"]))
+        row = cursor.fetchone()
+        position = dict(zip(POSITION_FIELDS, map(float, row))) if row else empty_position()
+        try:
+            position = apply_trade(position, trade["trade_type"], trade["quantity"], trade["price"], trade["amount"])
+        except ValueError as e:
+            logger.error(f"Rejected trade for user {user_id}: {trade['symbol']}: {str(e)}")
+            conn.rollback()
+            return False
+
         # Insert trade
         cursor.execute("""
             INSERT INTO trades (id, user_id, symbol, amount, price, trade_type, timestamp, quantity)
@@ -88,9 +146,17 @@ def add_trade(user_id: str, trade: dict) -> bool:
             SET balance = balance + %s 
             WHERE id = %s
         """, (balance_change, user_id))
+        _write_position(cursor, user_id, trade["symbol"], position)
 
         conn.commit()
         logger.info(f"Trade added for user {user_id}: {trade['symbol']}, ${trade['amount']}, Type: {trade['trade_type']}, Quantity: {trade['quantity']}")
+        # Hand the connection back before refresh_user checks out its own, so a busy pool can't time out
+        cursor.close()
+        conn.close()
+        try:
+            get_equity_leaderboard().refresh_user(user_id)
+        except Exception as e:
+            logger.error(f"Failed to update leaderboard after trade for user {user_id}: {str(e)}")
         return True
     except mysql.connector.Error as e:
         logger.error(f"Failed to add trade for user {user_id}: SQL Error: {str(e)}, Trade: {trade}")
@@ -109,14 +175,106 @@ def add_trade(user_id: str, trade: dict) -> bool:
 
 def get_portfolio(user_id: str) -> list:
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM trades WHERE user_id = %s", (user_id,))
-        trades = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM trades WHERE user_id = %s ORDER BY timestamp, id", (user_id,))
+            trades = cursor.fetchall()
+            cursor.close()
         logger.info(f"Retrieved portfolio for user {user_id}: {len(trades)} trades")
         return trades
     except Exception as e:
         logger.error(f"Failed to get portfolio for user {user_id}: {str(e)}")
         return []
+
+def get_positions(user_id: str, include_closed: bool = False) -> List[Dict]:
+    """Current holdings per symbol from the positions table, one row per symbol."""
+    migrate_positions()
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            query = "SELECT symbol, quantity, cost_basis, realized_pnl, updated_at FROM positions WHERE user_id = %s"
+            if not include_closed:
+                query += " AND quantity > %s"
+            cursor.execute(query + " ORDER BY symbol", (user_id,) if include_closed else (user_id, QUANTITY_EPSILON))
+            positions = cursor.fetchall()
+            cursor.close()
+        for position in positions:
+            for field in POSITION_FIELDS:
+                position[field] = float(position[field])
+        return positions
+    except Exception as e:
+        logger.error(f"Failed to get positions for user {user_id}: {str(e)}")
+        return []
+
+def positions_from_trades(trades: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """Replay trades (in time order) into average-cost positions, as add_trade would have kept them."""
+    book = book_from_trades(trades, method="average")
+    return {symbol: {"quantity": position.quantity, "cost_basis": position.cost_basis,
+                     "realized_pnl": position.realized_pnl}
+            for symbol, position in book.positions.items()}
+
+def rebuild_positions(user_id: Optional[str] = None) -> int:
+    """Recompute the positions table from the trade ledger, for one user or everyone.
+
+    Each user is rebuilt in one transaction holding their users row lock, the
+    same lock add_trade takes first, so trades placed meanwhile are not lost.
+    Returns the number of users rebuilt.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            if user_id is not None:
+                user_ids = [user_id]
+            else:
+                cursor.execute("SELECT DISTINCT user_id FROM trades UNION SELECT DISTINCT user_id FROM positions")
+                user_ids = [row["user_id"] for row in cursor.fetchall()]
+            for uid in user_ids:
+                cursor.execute("SELECT id FROM users WHERE id = %s FOR UPDATE", (uid,))
+                cursor.fetchall()
+                cursor.execute("SELECT * FROM trades WHERE user_id = %s ORDER BY timestamp, id", (uid,))
+                positions = positions_from_trades(cursor.fetchall())
+                cursor.execute("DELETE FROM positions WHERE user_id = %s", (uid,))
+                for symbol, position in positions.items():
+                    _write_position(cursor, uid, symbol, position)
+                conn.commit()
+                logger.info(f"Rebuilt {len(positions)} positions for user {uid}")
+            return len(user_ids)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to rebuild positions: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+def migrate_positions() -> int:
+    """Build positions for users who have trades but no positions rows, once per process.
+
+    The positions table was added after the trade ledger. Without this,
+    existing users' sells are rejected and their holdings look empty until
+    scripts/rebuild_positions.py is run. Returns the number of users rebuilt.
+    """
+    global _positions_migrated
+    with _positions_migrated_lock:
+        if _positions_migrated:
+            return 0
+        try:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT DISTINCT t.user_id FROM trades t
+                    LEFT JOIN positions p ON p.user_id = t.user_id
+                    WHERE p.user_id IS NULL
+                """)
+                user_ids = [row[0] for row in cursor.fetchall()]
+                cursor.close()
+            for user_id in user_ids:
+                rebuild_positions(user_id)
+        except Exception as e:
+            # Left unset so the next call tries again
+            logger.error(f"Failed to migrate positions from the trade ledger: {str(e)}")
+            return 0
+        _positions_migrated = True
+        if user_ids:
+            logger.info(f"Built positions from the trade ledger for {len(user_ids)} users")
+        return len(user_ids)
+
@@ -0,0 +1,222 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from utils.logger import logger
+
+METHODS = ("fifo", "lifo", "average")
+QUANTITY_EPSILON = 1e-6  # shares; holdings this small are treated as closed
+
+
+def trade_quantity(trade: Dict) -> float:
+    """Shares in a stored trade; older rows without a quantity fall back to amount / price."""
+    quantity = float(trade.get("quantity") or 0.0)
+    if not quantity and float(trade.get("price") or 0.0) > 0:
+        quantity = float(trade["amount"]) / float(trade["price"])
+    return quantity
+
+
+def _epoch(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+@dataclass(frozen=True)
+class Lots:
+    """Open lots of one symbol as parallel arrays, oldest first."""
+    quantity: np.ndarray
+    cost: np.ndarray       # per share
+    timestamp: np.ndarray  # epoch seconds of the buy
+
+
+@dataclass(frozen=True)
+class Position:
+    symbol: str
+    quantity: float
+    cost_basis: float
+    realized_pnl: float
+    unmatched_quantity: float  # sold beyond the holding; clipped, not shorted
+    lots: Lots
+
+    @property
+    def avg_cost(self) -> float:
+        return self.cost_basis / self.quantity if self.quantity > 0 else 0.0
+
+
+@dataclass(frozen=True)
+class Book:
+    method: str
+    positions: Dict[str, Position]
+    realized: np.ndarray  # realized P&L of each input trade, in input order
+    executed: np.ndarray  # signed quantity of each input trade after clipping oversells
+
+    def open_positions(self) -> List[Position]:
+        return [position for position in self.positions.values() if position.quantity > 0]
+
+    def unrealized_pnl(self, prices: Dict[str, float]) -> Dict[str, float]:
+        """Unrealized P&L per open symbol; symbols without a price are left out."""
+        open_positions = [p for p in self.open_positions() if prices.get(p.symbol, 0) > 0]
+        if not open_positions:
+            return {}
+        quantity = np.array([p.quantity for p in open_positions])
+        cost = np.array([p.cost_basis for p in open_positions])
+        marks = np.array([float(prices[p.symbol]) for p in open_positions])
+        return dict(zip((p.symbol for p in open_positions), (quantity * marks - cost).tolist()))
+
+    def totals(self, prices: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        unrealized = self.unrealized_pnl(prices or {})
+        return {
+            "realized_pnl": float(self.realized.sum()),
+            "unrealized_pnl": float(sum(unrealized.values())),
+            "cost_basis": float(sum(p.cost_basis for p in self.open_positions())),
+        }
+
+
+def _clip_oversells(signed: np.ndarray):
+    """Executed quantities and holdings when sells are capped at what is held.
+
+    Holdings are the running sum reflected at zero, so this needs no loop.
+    """
+    cumulative = np.cumsum(signed)
+    held = cumulative - np.minimum.accumulate(np.minimum(cumulative, 0.0))
+    held = np.where(held > QUANTITY_EPSILON, held, 0.0)
+    return np.diff(held, prepend=0.0), held
+
+
+def _fifo(executed: np.ndarray, prices: np.ndarray, timestamps: np.ndarray):
+    """FIFO cost of every sell from cumulative-quantity interpolation over the buy lots."""
+    buys, sells = executed > 0, executed < 0
+    bought = np.concatenate(([0.0], np.cumsum(executed[buys])))
+    spent = np.concatenate(([0.0], np.cumsum(executed[buys] * prices[buys])))
+    sold_after = np.cumsum(-executed[sells])
+    sold_before = sold_after + executed[sells]
+    cost = np.interp(sold_after, bought, spent) - np.interp(sold_before, bought, spent)
+    realized = np.zeros(len(executed))
+    realized[sells] = -executed[sells] * prices[sells] - cost
+
+    total_sold = sold_after[-1] if len(sold_after) else 0.0
+    remaining = np.clip(bought[1:] - np.maximum(total_sold, bought[:-1]), 0.0, None)
+    keep = remaining > QUANTITY_EPSILON
+    return realized, Lots(remaining[keep], prices[buys][keep], timestamps[buys][keep])
+
+
+def _lifo(executed: np.ndarray, prices: np.ndarray, timestamps: np.ndarray):
+    """LIFO depends on the order buys and sells interleave, so lots live on an array-backed stack."""
+    size = int((executed > 0).sum())
+    lot_quantity, lot_cost, lot_time = np.empty(size), np.empty(size), np.empty(size, dtype=np.int64)
+    top = 0
+    realized = np.zeros(len(executed))
+    for i in np.flatnonzero(executed):
+        quantity = executed[i]
+        if quantity > 0:
+            lot_quantity[top], lot_cost[top], lot_time[top] = quantity, prices[i], timestamps[i]
+            top += 1
+            continue
+        needed, cost = -quantity, 0.0
+        while needed > QUANTITY_EPSILON and top:
+            take = min(lot_quantity[top - 1], needed)
+            cost += take * lot_cost[top - 1]
+            lot_quantity[top - 1] -= take
+            needed -= take
+            if lot_quantity[top - 1] <= QUANTITY_EPSILON:
+                top -= 1
+        realized[i] = -quantity * prices[i] - cost
+    return realized, Lots(lot_quantity[:top].copy(), lot_cost[:top].copy(), lot_time[:top].copy())
+
+
+def _average(executed: np.ndarray, held: np.ndarray, prices: np.ndarray, timestamps: np.ndarray):
+    """Average cost with a running cost and quantity; sells keep the average and reduce the cost pro rata."""
+    n = len(executed)
+    realized = np.zeros(n)
+    cost = np.zeros(n)
+    running_cost = 0.0
+    for i in range(n):
+        quantity = executed[i]
+        held_before = held[i - 1] if i else 0.0
+        if quantity > 0:
+            running_cost += quantity * prices[i]
+        elif quantity < 0:
+            avg_cost = running_cost / held_before if held_before > 0 else prices[i]
+            realized[i] = -quantity * (prices[i] - avg_cost)
+            running_cost = avg_cost * held[i] if held[i] > 0 else 0.0
+        cost[i] = running_cost
+    if n and held[-1] > 0:
+        last_buy = timestamps[executed > 0][-1]
+        lots = Lots(np.array([held[-1]]), np.array([cost[-1] / held[-1]]), np.array([last_buy], dtype=np.int64))
+    else:
+        lots = Lots(np.empty(0), np.empty(0), np.empty(0, dtype=np.int64))
+    return realized, lots
+
+
+def build_book(symbols: Sequence[str], quantities: Sequence[float], prices: Sequence[float],
+               timestamps: Optional[Sequence[int]] = None, method: str = "fifo") -> Book:
+    """Account for trades given as parallel arrays, in time order.
+
+    `quantities` are signed (buys positive, sells negative). A sell larger
+    than the holding is clipped to it and the excess reported as
+    unmatched_quantity. FIFO is computed with array operations per symbol;
+    LIFO and average cost walk the trades once.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown accounting method {method!r}; expected one of {METHODS}")
+    symbols = np.asarray(symbols, dtype=object)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    timestamps = (np.zeros(len(quantities), dtype=np.int64) if timestamps is None
+                  else np.asarray(timestamps, dtype=np.int64))
+    realized = np.zeros(len(quantities))
+    executed_all = np.zeros(len(quantities))
+    positions = {}
+
+    codes, inverse = np.unique(symbols.astype(str), return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(codes) + 1))
+    for code, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        rows = order[lo:hi]
+        executed, held = _clip_oversells(quantities[rows])
+        if method == "fifo":
+            symbol_realized, lots = _fifo(executed, prices[rows], timestamps[rows])
+        elif method == "lifo":
+            symbol_realized, lots = _lifo(executed, prices[rows], timestamps[rows])
+        else:
+            symbol_realized, lots = _average(executed, held, prices[rows], timestamps[rows])
+        realized[rows] = symbol_realized
+        executed_all[rows] = executed
+        positions[str(codes[code])] = Position(
+            symbol=str(codes[code]),
+            quantity=float(lots.quantity.sum()),
+            cost_basis=float((lots.quantity * lots.cost).sum()),
+            realized_pnl=float(symbol_realized.sum()),
+            unmatched_quantity=float((executed - quantities[rows]).sum()),
+            lots=lots,
+        )
+    return Book(method, positions, realized, executed_all)
+
+
+def book_from_trades(trades: Iterable[Dict], method: str = "fifo") -> Book:
+    """Account for rows of the trades table, in time order; invalid rows are skipped."""
+    symbols, quantities, prices, timestamps = [], [], [], []
+    for trade in trades:
+        quantity, price = trade_quantity(trade), float(trade.get("price") or 0.0)
+        if quantity <= 0 or price <= 0 or trade.get("trade_type") not in ("buy", "sell"):
+            logger.warning(f"Skipping invalid trade {trade.get('id')} for {trade.get('symbol')}")
+            continue
+        symbols.append(trade["symbol"])
+        quantities.append(quantity if trade["trade_type"] == "buy" else -quantity)
+        prices.append(price)
+        timestamps.append(_epoch(trade.get("timestamp")))
+    book = build_book(symbols, quantities, prices, timestamps, method)
+    for position in book.positions.values():
+        if position.unmatched_quantity > QUANTITY_EPSILON:
+            logger.warning(f"{position.unmatched_quantity:.4f} shares of {position.symbol} were sold "
+                           f"beyond the holding and ignored")
+    return book
@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from data.price_snapshot import PriceSnapshot
+
+HOLDING_FIELDS = ("quantity", "cost_basis", "realized_pnl")
+
+
+@dataclass(frozen=True)
+class Valuation:
+    holdings: List[Dict]      # one row per open position
+    totals: Dict[str, float]
+    unpriced: List[str]       # open symbols the snapshot has no price for; marked at cost
+    snapshot_version: str
+
+
+def value_holdings(positions: Iterable[Dict], snapshot: PriceSnapshot) -> Valuation:
+    """Mark positions (get_positions-style dicts) to market against one price snapshot.
+
+    All holdings are valued in one set of array operations; nothing here
+    touches the network. Closed positions only contribute realized P&L.
+    """
+    positions = list(positions)
+    realized_total = float(sum(float(p.get("realized_pnl") or 0.0) for p in positions))
+    open_positions = [p for p in positions if float(p.get("quantity") or 0.0) > 0]
+    symbols = [p["symbol"] for p in open_positions]
+    quantity, cost_basis, realized = (np.array([float(p.get(field) or 0.0) for p in open_positions])
+                                      for field in HOLDING_FIELDS)
+    price = np.array([snapshot.quote(symbol)["current_price"] for symbol in symbols])
+    previous_close = np.array([snapshot.quote(symbol)["previous_close"] for symbol in symbols])
+
+    priced = price > 0
+    avg_cost = np.divide(cost_basis, quantity, out=np.zeros_like(quantity), where=quantity > 0)
+    market_value = np.where(priced, quantity * price, cost_basis)
+    has_close = priced & (previous_close > 0)
+    day_change = np.where(has_close, quantity * (price - previous_close), 0.0)
+    unrealized = market_value - cost_basis
+    total_value = market_value.sum()
+    weight = market_value / total_value if total_value > 0 else np.zeros_like(market_value)
+
+    holdings = [{
+        "symbol": symbol,
+        "quantity": float(quantity[i]),
+        "avg_cost": float(avg_cost[i]),
+        "price": float(price[i]),
+        "previous_close": float(previous_close[i]),
+        "market_value": float(market_value[i]),
+        "day_change": float(day_change[i]),
+        "day_change_pct": float(price[i] / previous_close[i] - 1) if has_close[i] else 0.0,
+        "unrealized_pnl": float(unrealized[i]),
+        "unrealized_pnl_pct": float(unrealized[i] / cost_basis[i]) if cost_basis[i] > 0 else 0.0,
+        "realized_pnl": float(realized[i]),
+        "weight": float(weight[i]),
+        "priced": bool(priced[i]),
+    } for i, symbol in enumerate(symbols)]
+
+    opening_value = (market_value - day_change)[has_close].sum()
+    totals = {
+        "market_value": float(total_value),
+        "cost_basis": float(cost_basis.sum()),
+        "day_change": float(day_change.sum()),
+        "day_change_pct": float(day_change.sum() / opening_value) if opening_value > 0 else 0.0,
+        "unrealized_pnl": float(unrealized.sum()),
+        "realized_pnl": realized_total,
+    }
+    return Valuation(holdings, totals, [s for s, ok in zip(symbols, priced) if not ok], snapshot.version)
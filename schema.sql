@@ -65,3 +65,24 @@ INSERT INTO cash_flows (cik, fiscal_date_ending, operating_cash_flow, capital_ex
 ('0000320193', '2024-09-30', 122151000000.00, -10429000000.00),
 ('0001018724', '2024-12-31', 75747000000.00, -48805000000.00),
 ('0001652044', '2024-12-31', 101490000000.00, -31142000000.00);
+
+-- Append-only tick/bar history (stock_prices keeps only the latest row per symbol).
+-- initialize_db in data/mysql.py creates this too; keep the two definitions in sync.
+CREATE TABLE IF NOT EXISTS price_history (
+    symbol VARCHAR(10) NOT NULL,
+    ts DATETIME NOT NULL,
+    open_price DOUBLE NOT NULL,
+    high_price DOUBLE NOT NULL,
+    low_price DOUBLE NOT NULL,
+    close_price DOUBLE NOT NULL,
+    volume DOUBLE NOT NULL DEFAULT 0,
+    PRIMARY KEY (symbol, ts),
+    KEY idx_price_history_ts (ts)
+)
+PARTITION BY RANGE COLUMNS(ts) (
+    PARTITION p2024 VALUES LESS THAN ('2025-01-01'),
+    PARTITION p2025 VALUES LESS THAN ('2026-01-01'),
+    PARTITION p2026 VALUES LESS THAN ('2027-01-01'),
+    PARTITION p2027 VALUES LESS THAN ('2028-01-01'),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
@@ -0,0 +1,45 @@
+import argparse
+from typing import Dict, List
+
+from simulation.backtest import (
+    DEFAULT_FEE_BPS,
+    DEFAULT_INITIAL_CASH,
+    DEFAULT_SLIPPAGE_BPS,
+    load_trades,
+    orders_from_trades,
+    run_backtest,
+)
+
+
+def trades_by_user(trades: List[Dict]) -> Dict[str, List[Dict]]:
+    """Split time-ordered trades into one time-ordered list per user."""
+    grouped: Dict[str, List[Dict]] = {}
+    for trade in trades:
+        grouped.setdefault(trade["user_id"], []).append(trade)
+    return grouped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded trades against stored price history.")
+    parser.add_argument("--user-id", help="Only replay this user's trades (default: every user, each separately)")
+    parser.add_argument("--initial-cash", type=float, default=DEFAULT_INITIAL_CASH,
+                        help="Starting cash of each user's portfolio")
+    parser.add_argument("--slippage-bps", type=float, default=DEFAULT_SLIPPAGE_BPS)
+    parser.add_argument("--fee-bps", type=float, default=DEFAULT_FEE_BPS)
+    args = parser.parse_args()
+
+    trades = load_trades(args.user_id)
+    if not trades:
+        raise SystemExit("No trades to backtest")
+    # Every user has their own cash, so their trades are never pooled into one portfolio
+    for user_id, user_trades in trades_by_user(trades).items():
+        orders = orders_from_trades(user_trades)
+        result = run_backtest(orders, initial_cash=args.initial_cash,
+                              slippage_bps=args.slippage_bps, fee_bps=args.fee_bps)
+        print(f"User {user_id}: {len(orders)} orders over {len(result.days)} days, {len(result.symbols)} symbols")
+        for name, value in result.stats.items():
+            print(f"{name:>18}: {value:,.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import json
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List
+
+from utils.json_extract import ArrayItemStream, JSONExtractor, extract_json
+
+CHUNK_SIZE = 16           # characters per simulated stream token batch
+LEGACY_CLEANUP_LIMIT = 20_000  # the legacy whitespace regex is quadratic; skip it beyond this size
+
+
+def legacy_parse(response: str) -> Any:
+    """The bracket-matching parser ReasoningAgent used before utils.json_extract."""
+    try:
+        return json.loads(response)
+    except json.JSONDecodeError:
+        pass
+    cleaned = re.sub(r'```json\s*|\s*```', '', response)
+    start = cleaned.find('{')
+    if start != -1:
+        stack, in_string, escape = [], False, False
+        for i in range(start, len(cleaned)):
+            char = cleaned[i]
+            if char == '\\' and not escape:
+                escape = True
+                continue
+            if char == '"' and not escape:
+                in_string = not in_string
+            if not in_string:
+                if char == '{':
+                    stack.append(char)
+                elif char == '}' and stack:
+                    stack.pop()
+                    if not stack:
+                        try:
+                            return json.loads(cleaned[start:i + 1])
+                        except json.JSONDecodeError:
+                            continue
+            escape = False
+    if len(cleaned) <= LEGACY_CLEANUP_LIMIT:
+        cleaned = re.sub(r'\s+(?=(?:[^"]*"[^"]*")*[^"]*$)', '', cleaned)
+        try:
+            return json.loads(cleaned)
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def _recommendation(rng: random.Random) -> Dict:
+    symbol = rng.choice(["AAPL", "MSFT", "GOOGL", "AMZN", "META", "NVDA", "TSLA", "JPM"])
+    return {
+        "Symbol": symbol,
+        "Action": "Buy",
+        "Quantity": round(rng.uniform(1, 50), 2),
+        "Reason": f"{symbol} shows {{strong}} margins and a \"fair\" valuation [see notes].",
+        "Caution": "Guidance may be revised.",
+        "Score": rng.randint(40, 95),
+    }
+
+
+def make_responses(size: int, rng: random.Random) -> Dict[str, str]:
+    """Malformed LLM-style responses of roughly `size` characters each."""
+    count = max(1, size // 250)
+    document = json.dumps({"recommendations": [_recommendation(rng) for _ in range(count)],
+                           "insights": "Balanced exposure."}, indent=2)
+    prose = ("Here is my analysis {see below} of the market; values like {x} and [y] are placeholders. " *
+             (size // 90 + 1))[:size]
+    return {
+        "fenced": f"Sure! Here you go:\n```json\n{document}\n```\nLet me know if you need more.",
+        "prose_then_json": prose + "\n" + document,
+        "trailing_commas": re.sub(r'("Score": \d+)', r'\1,', document).replace('"\n}', '",\n}'),
+        "truncated": document[:int(len(document) * 0.9)],
+        "broken_fragments": "".join("{\"Symbol\": \"X\", oops } " for _ in range(size // 25)) + document,
+    }
+
+
+def _time(fn: Callable[[str], Any], text: str, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - started) / repeat
+
+
+def _stream(text: str) -> Any:
+    extractor = JSONExtractor("{")
+    for i in range(0, len(text), CHUNK_SIZE):
+        if extractor.feed(text[i:i + CHUNK_SIZE]) is not None:
+            return extractor.value
+    return extractor.finish()
+
+
+def _stream_items(text: str) -> List[Any]:
+    stream = ArrayItemStream("recommendations")
+    items = []
+    for i in range(0, len(text), CHUNK_SIZE):
+        items.extend(stream.feed(text[i:i + CHUNK_SIZE]))
+    return items
+
+
+def run(sizes: List[int], repeat: int, seed: int):
+    rng = random.Random(seed)
+    print(f"{'case':<18}{'chars':>9}{'legacy ms':>12}{'extract ms':>12}{'stream ms':>12}"
+          f"{'legacy ok':>11}{'extract ok':>12}{'items':>7}")
+    for size in sizes:
+        for case, text in make_responses(size, rng).items():
+            legacy_ok = isinstance(legacy_parse(text), dict)
+            extract_ok = isinstance(extract_json(text, openers="{"), dict)
+            legacy_ms = _time(legacy_parse, text, repeat) * 1e3
+            extract_ms = _time(lambda t: extract_json(t, openers="{"), text, repeat) * 1e3
+            stream_ms = _time(_stream, text, repeat) * 1e3
+            items = len(_stream_items(text))
+            print(f"{case:<18}{len(text):>9}{legacy_ms:>12.2f}{extract_ms:>12.2f}{stream_ms:>12.2f}"
+                  f"{str(legacy_ok):>11}{str(extract_ok):>12}{items:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON extractor against the legacy LLM response parser.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[2_000, 20_000, 200_000],
+                        help="Approximate response sizes in characters")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from simulation.monte_carlo import MarketModel, TRADING_DAYS, simulate_portfolio
+from simulation.paths import BATCH_PATHS
+
+DEFAULT_SYMBOLS = 20
+
+
+def synthetic_model(n_symbols: int, seed: int = 0) -> MarketModel:
+    """Random one-factor market model with realistic daily drift and volatility."""
+    rng = np.random.default_rng(seed)
+    beta = rng.uniform(0.6, 1.6, n_symbols)
+    market_var = (0.18 ** 2) / TRADING_DAYS
+    idio_var = rng.uniform(0.15, 0.35, n_symbols) ** 2 / TRADING_DAYS
+    cov = np.outer(beta, beta) * market_var + np.diag(idio_var)
+    returns = rng.multivariate_normal(np.full(n_symbols, 0.08 / TRADING_DAYS), cov, size=3 * TRADING_DAYS)
+    return MarketModel.from_returns([f"SYM{i}" for i in range(n_symbols)], returns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the Monte Carlo simulator across worker counts.")
+    parser.add_argument("--paths", type=int, default=200000)
+    parser.add_argument("--years", type=float, default=10)
+    parser.add_argument("--symbols", type=int, default=DEFAULT_SYMBOLS)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--from-history", action="store_true",
+                        help="Estimate the model from stored price history instead of a synthetic one")
+    args = parser.parse_args()
+
+    if args.from_history:
+        from scripts.fetch_stock_prices import STOCK_LIST
+        model = MarketModel.from_history(STOCK_LIST[:args.symbols])
+        if model is None:
+            raise SystemExit("Not enough stored price history; run scripts.export_price_history first")
+    else:
+        model = synthetic_model(args.symbols, args.seed)
+    holdings = {symbol: 10000.0 for symbol in model.symbols}
+
+    worker_counts = sorted({1, *[2 ** k for k in range(1, args.max_workers.bit_length())], args.max_workers})
+
+    print(f"{args.paths:,} paths x {len(model.symbols)} symbols, {args.years:g} years")
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}  median")
+    baseline = None
+    reference = None
+    for workers in worker_counts:
+        if workers > 1:
+            # The shared pool is rebuilt whenever its size changes, so warm it right before
+            # timing; one batch per worker makes every process start and import NumPy
+            simulate_portfolio(holdings, model, 1, n_paths=workers * BATCH_PATHS, seed=0, workers=workers)
+        started = time.perf_counter()
+        projection = simulate_portfolio(holdings, model, args.years, n_paths=args.paths,
+                                        seed=args.seed, workers=workers)
+        elapsed = time.perf_counter() - started
+        baseline = baseline or elapsed
+        median = projection.final_bands[50]
+        # The same seed must give bit-identical results at every worker count
+        if reference is None:
+            reference = projection
+        elif not all(np.array_equal(reference.bands[p], projection.bands[p]) for p in reference.bands):
+            raise SystemExit(f"Results with {workers} workers differ from 1 worker")
+        print(f"{workers:>8} {elapsed:>9.3f} {baseline / elapsed:>7.2f}x  ${median:,.2f}")
+
+
+if __name__ == "__main__":
+    main()
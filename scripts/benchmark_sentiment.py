@@ -0,0 +1,105 @@
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from agents.sentiment import CONFIDENT_SCORE, SENTIMENT_THRESHOLD, LexiconSentimentBackend
+
+RECORDED_HEADLINES = Path("finance_simulator/sentiment/headlines.jsonl")
+LABELS = ("Negative", "Neutral", "Positive")
+
+
+def labels(scores: np.ndarray) -> np.ndarray:
+    return np.where(scores >= SENTIMENT_THRESHOLD, 2, np.where(scores <= -SENTIMENT_THRESHOLD, 0, 1))
+
+
+def record(path: Path, symbols: List[str]):
+    """Fetch live headlines and store them with their LLM scores."""
+    from agents.market_analyst import MarketAnalystAgent
+
+    agent = MarketAnalystAgent(sentiment_backend="llm")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    recorded_at = datetime.now(timezone.utc).isoformat()
+    written = 0
+    with open(path, "a", encoding="utf-8") as f:
+        for symbol in symbols:
+            headlines = agent.fetch_headlines(symbol)
+            scores = agent.score_headlines_llm(headlines)
+            for headline in headlines:
+                if headline in scores:
+                    f.write(json.dumps({"symbol": symbol, "headline": headline,
+                                        "llm_score": scores[headline], "recorded_at": recorded_at}) + "\n")
+                    written += 1
+    print(f"Recorded {written} headlines to {path}")
+
+
+def load(path: Path) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    # Keep the latest LLM score for each distinct headline
+    return list({row["headline"]: row for row in rows}.values())
+
+
+def report(path: Path, repeat: int, confident_score: float):
+    if not path.exists():
+        raise SystemExit(f"No recorded headlines at {path}; run with --record first")
+    rows = load(path)
+    if not rows:
+        raise SystemExit(f"{path} is empty")
+    headlines = [row["headline"] for row in rows]
+    llm_scores = np.array([row["llm_score"] for row in rows], dtype=float)
+
+    backend = LexiconSentimentBackend()
+    backend.score_array(headlines)  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        scores, hits = backend.score_array(headlines)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    llm_labels = labels(llm_scores)
+    lexicon_labels = labels(scores)
+    ambiguous = (hits == 0) | (np.abs(scores) < confident_score)
+    hybrid_labels = np.where(ambiguous, llm_labels, lexicon_labels)
+
+    print(f"{len(rows)} recorded headlines from {path}")
+    print(f"Lexicon: {elapsed * 1e3:.2f} ms per batch, {elapsed / len(rows) * 1e6:.1f} us per headline")
+    print(f"Lexicon vs LLM label agreement: {(lexicon_labels == llm_labels).mean() * 100:.1f}%")
+    print(f"Lexicon vs LLM score correlation: {np.corrcoef(scores, llm_scores)[0, 1]:.3f}" if scores.std() and llm_scores.std() else
+          "Lexicon vs LLM score correlation: n/a")
+    confident = ~ambiguous
+    if confident.any():
+        print(f"Agreement where lexicon is confident (|score| >= {confident_score}): "
+              f"{(lexicon_labels[confident] == llm_labels[confident]).mean() * 100:.1f}% of {int(confident.sum())}")
+    print(f"Hybrid: {ambiguous.mean() * 100:.1f}% of headlines sent to the LLM, "
+          f"{(hybrid_labels == llm_labels).mean() * 100:.1f}% agreement with LLM-only")
+
+    confusion = np.zeros((3, 3), dtype=int)
+    np.add.at(confusion, (llm_labels, lexicon_labels), 1)
+    print("\nConfusion (rows: LLM, columns: lexicon)")
+    print(f"{'':>10}" + "".join(f"{label:>10}" for label in LABELS))
+    for i, label in enumerate(LABELS):
+        print(f"{label:>10}" + "".join(f"{n:>10}" for n in confusion[i]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lexicon sentiment against recorded LLM scores.")
+    parser.add_argument("--file", type=Path, default=RECORDED_HEADLINES)
+    parser.add_argument("--record", action="store_true", help="Fetch live headlines and record LLM scores")
+    parser.add_argument("--symbols", nargs="*", help="Symbols to record (default: every tracked symbol)")
+    parser.add_argument("--repeat", type=int, default=100, help="Timing repetitions")
+    parser.add_argument("--confident-score", type=float, default=CONFIDENT_SCORE)
+    args = parser.parse_args()
+
+    if args.record:
+        from scripts.fetch_stock_prices import STOCK_LIST
+        record(args.file, args.symbols or STOCK_LIST)
+    else:
+        report(args.file, args.repeat, args.confident_score)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from data.price_history import iter_history_from_db
+from data.price_store import COLUMN_DTYPES, COLUMNS, price_store
+from scripts.fetch_stock_prices import STOCK_LIST
+from utils.logger import logger
+
+EXPORT_CHUNK = 50000  # rows fetched from MySQL per round trip
+
+
+def _backfill_older(symbol: str, last_ts: Optional[int], chunk_size: int) -> int:
+    """Merge MySQL rows up to the file's last timestamp, which append would skip, and mark it backfilled."""
+    if last_ts is None:
+        # Nothing stored yet: append streams the whole history, so only the flag is needed
+        chunks = []
+    else:
+        before = datetime.fromtimestamp(last_ts + 1, timezone.utc)
+        chunks = list(iter_history_from_db(symbol, before=before, chunk_size=chunk_size))
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks
+               else np.empty(0, COLUMN_DTYPES[name]) for name in COLUMNS}
+    return price_store.backfill(symbol, columns)
+
+
+def export_symbol(symbol: str, full: bool = False, chunk_size: int = EXPORT_CHUNK) -> int:
+    """Bring the file up to date with MySQL; returns rows written.
+
+    A file not yet backfilled (live ticks may have reached it first) gets the
+    older history merged in; newer rows are appended in chunks.
+    """
+    if full:
+        price_store.remove(symbol)
+    history = price_store.open(symbol)
+    last_ts = history.last_ts if history is not None and len(history) else None
+    written = 0
+    if history is None or not history.backfilled:
+        written += _backfill_older(symbol, last_ts, chunk_size)
+    after = datetime.fromtimestamp(last_ts, timezone.utc) if last_ts is not None else None
+    for columns in iter_history_from_db(symbol, after=after, chunk_size=chunk_size):
+        written += price_store.append(symbol, columns)
+    return written
+
+
+def export_all(symbols=None, full: bool = False, chunk_size: int = EXPORT_CHUNK) -> dict:
+    results = {}
+    for symbol in symbols or STOCK_LIST:
+        started = time.perf_counter()
+        try:
+            results[symbol] = export_symbol(symbol, full, chunk_size)
+            logger.info(f"Exported {results[symbol]} rows for {symbol} in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Failed to export price history for {symbol}: {str(e)}")
+            results[symbol] = 0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memmap price history files from MySQL.")
+    parser.add_argument("--symbols", nargs="*", help="Symbols to export (default: every tracked symbol)")
+    parser.add_argument("--full", action="store_true", help="Rebuild files from scratch instead of appending")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK, help="Rows per MySQL fetch")
+    args = parser.parse_args()
+
+    results = export_all(args.symbols, args.full, args.chunk_size)
+    for symbol, written in results.items():
+        history = price_store.open(symbol)
+        print(f"{symbol}: +{written} rows ({len(history) if history is not None else 0} total)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,20 @@
 import finnhub
-import mysql.connector
 from mysql.connector import Error
 from datetime import datetime, timezone, timedelta
 import time
+import threading
 import logging
 from logging.handlers import RotatingFileHandler
 import os
 from dotenv import load_dotenv
 from cachetools import TTLCache
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import json
 
-from utils.config import AZURE_USER, AZURE_PASSWORD, AZURE_HOSTNAME, AZURE_PORT, AZURE_DATABASE, AZURE_SSL_CA
+from data.finnhub_quotes import QuoteFetcher
+from data.mysql_db import get_db_connection as get_pooled_connection
+from data.price_history import append_to_cache, record_quotes
 
 # Ensure logs directory exists
 LOG_DIR = Path("finance_simulator/logs")
@@ -47,23 +51,16 @@ STOCK_LIST = [
 # Cache for stock prices (24-hour TTL)
 price_cache = TTLCache(maxsize=100, ttl=86400)
 
+# Prices written by scripts/price_refresher.py and read by every page render
+SHARED_CACHE_DIR = Path("finance_simulator/cache")
+SHARED_CACHE_FILE = SHARED_CACHE_DIR / "stock_prices.json"
+
 def get_db_connection(attempts=3, delay=5):
     for attempt in range(attempts):
         try:
-            # conn = mysql.connector.connect(
-            #     host=MYSQL_HOST,
-            #     user=MYSQL_USER,
-            #     password=MYSQL_PASSWORD,
-            #     database=MYSQL_DATABASE
-            # )
-            conn =  mysql.connector.connect(
-                user=AZURE_USER, 
-                password=AZURE_PASSWORD,
-                host=AZURE_HOSTNAME,
-                port=AZURE_PORT, 
-                database=AZURE_DATABASE, 
-                ssl_ca=AZURE_SSL_CA, ssl_verify_cert=True)
-            logger.debug("Database connection established")
+            # Borrow from the process-wide pool shared with the rest of the app
+            conn = get_pooled_connection()
+            logger.debug("Database connection checked out from pool")
             return conn
         except Error as e:
             logger.error(f"Attempt {attempt + 1}/{attempts} - Failed to connect to database: {str(e)}")
@@ -72,160 +69,221 @@ def get_db_connection(attempts=3, delay=5):
     logger.error("Failed to connect to database after all attempts")
     return None
 
-def get_stock_price_from_db(symbol: str) -> dict:
+def get_stock_prices_from_db(symbols: List[str], max_age: Optional[timedelta] = timedelta(hours=1)) -> Dict[str, dict]:
+    """Read quotes for many symbols in one round trip, skipping rows older than max_age."""
+    if not symbols:
+        return {}
+    conn = get_db_connection()
+    if not conn:
+        return {}
     try:
-        conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT open_price, close_price, high_price, low_price, current_price, last_updated
+        placeholders = ", ".join(["%s"] * len(symbols))
+        cursor.execute(f"""
+            SELECT symbol, open_price, close_price, high_price, low_price, current_price, last_updated
             FROM stock_prices
-            WHERE symbol = %s
-        """, (symbol,))
-        result = cursor.fetchone()
+            WHERE symbol IN ({placeholders})
+        """, tuple(symbols))
+        rows = cursor.fetchall()
         cursor.close()
-        conn.close()
-        if result:
-            last_updated = result["last_updated"]
-            if last_updated.tzinfo is None:
-                last_updated = last_updated.replace(tzinfo=timezone.utc)
-            if last_updated >= datetime.now(timezone.utc) - timedelta(hours=1):
-                logger.info(f"Fetched recent price for {symbol} from DB")
-                return {
-                    "o": float(result["open_price"]),
-                    "c": float(result["current_price"]),
-                    "h": float(result["high_price"]),
-                    "l": float(result["low_price"]),
-                    "pc": float(result["close_price"])
+
+        cutoff = datetime.now(timezone.utc) - max_age if max_age is not None else None
+        quotes = {}
+        for row in rows:
+            last_updated = row["last_updated"]
+            if cutoff is not None:
+                if last_updated is None:
+                    continue
+                if last_updated.tzinfo is None:
+                    last_updated = last_updated.replace(tzinfo=timezone.utc)
+                if last_updated < cutoff:
+                    continue
+            try:
+                quotes[row["symbol"]] = {
+                    "o": float(row["open_price"]),
+                    "c": float(row["current_price"]),
+                    "h": float(row["high_price"]),
+                    "l": float(row["low_price"]),
+                    "pc": float(row["close_price"])
                 }
-        logger.info(f"No recent price for {symbol} in DB")
-        return None
+            except (TypeError, ValueError) as e:
+                # A NULL or malformed column costs only this symbol
+                logger.warning(f"Skipping stored price for {row['symbol']}: {str(e)}")
     except Exception as e:
-        logger.error(f"Failed to fetch price from DB for {symbol}: {str(e)}")
-        return None
+        logger.error(f"Failed to fetch prices from DB for {len(symbols)} symbols: {str(e)}")
+        return {}
+    finally:
+        conn.close()
 
-def update_stock_price_in_db(symbol: str, quote: dict):
+    logger.info(f"Fetched recent prices for {len(quotes)}/{len(symbols)} symbols from DB")
+    return quotes
+
+def get_stock_price_from_db(symbol: str) -> dict:
+    return get_stock_prices_from_db([symbol]).get(symbol)
+
+def update_stock_prices_in_db(quotes: Dict[str, dict]):
+    """Upsert quotes for many symbols with a single multi-row INSERT and append them to price_history."""
+    if not quotes:
+        return
     conn = get_db_connection()
     if not conn:
         return
+    now = datetime.now(timezone.utc)
+    rows = [
+        (symbol, quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], now, now)
+        for symbol, quote in quotes.items()
+    ]
     try:
         cursor = conn.cursor()
-        cursor.execute("""
+        cursor.executemany("""
             INSERT INTO stock_prices (symbol, open_price, close_price, high_price, low_price, current_price, timestamp, last_updated)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             ON DUPLICATE KEY UPDATE
-                open_price = %s,
-                close_price = %s,
-                high_price = %s,
-                low_price = %s,
-                current_price = %s,
-                timestamp = %s,
-                last_updated = %s
-        """, (
-            symbol, quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc),
-            quote["o"], quote["pc"], quote["h"], quote["l"], quote["c"], datetime.now(timezone.utc), datetime.now(timezone.utc)
-        ))
+                open_price = VALUES(open_price),
+                close_price = VALUES(close_price),
+                high_price = VALUES(high_price),
+                low_price = VALUES(low_price),
+                current_price = VALUES(current_price),
+                timestamp = VALUES(timestamp),
+                last_updated = VALUES(last_updated)
+        """, rows)
+        # Every tick also lands in the append-only history, committed with the upsert
+        history_rows = record_quotes(quotes, ts=now, conn=conn)
         conn.commit()
-        logger.info(f"Updated price for {symbol} in DB: ${quote['c']:.2f}")
+        cursor.close()
+        # Mirror to the local store only once the rows are durable in MySQL
+        append_to_cache(history_rows)
+        logger.info(f"Updated prices for {len(rows)} symbols in DB")
     except Error as e:
-        logger.error(f"Failed to update price in DB for {symbol}: {str(e)}")
+        logger.error(f"Failed to update prices in DB for {len(rows)} symbols: {str(e)}")
     finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+        conn.close()
+
+def update_stock_price_in_db(symbol: str, quote: dict):
+    update_stock_prices_in_db({symbol: quote})
+
+EMPTY_STOCK_DATA = {
+    "current_price": 0.0,
+    "high_price": 0.0,
+    "low_price": 0.0,
+    "previous_close": 0.0
+}
+
+# Seconds a page render waits for Finnhub before returning partial results
+QUOTE_LATENCY_BUDGET = 5.0
+
+_quote_fetcher = None
+_quote_fetcher_lock = threading.Lock()
 
-def fetch_stock_prices():
+def quote_to_stock_data(quote: dict) -> dict:
+    return {
+        "current_price": float(quote["c"]),
+        "high_price": float(quote["h"]),
+        "low_price": float(quote["l"]),
+        "previous_close": float(quote["pc"])
+    }
+
+def _store_late_quote(symbol: str, quote: dict):
+    """Warm the cache and DB with quotes that arrived after the caller's budget."""
+    price_cache[f"price_{symbol}"] = quote_to_stock_data(quote)
+    update_stock_price_in_db(symbol, quote)
+    logger.info(f"Stored late price for {symbol}: ${quote['c']:.2f}")
+
+def get_quote_fetcher() -> QuoteFetcher:
+    global _quote_fetcher
+    with _quote_fetcher_lock:
+        if _quote_fetcher is None:
+            finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
+            logger.info("Initialized Finnhub client")
+            _quote_fetcher = QuoteFetcher(finnhub_client, on_late_quote=_store_late_quote)
+        return _quote_fetcher
+
+def fetch_stock_prices(budget: float = QUOTE_LATENCY_BUDGET):
     stock_data = {}
+    missing = []
+
+    uncached = []
+    for symbol in STOCK_LIST:
+        cache_key = f"price_{symbol}"
+        if cache_key in price_cache:
+            logger.debug(f"Using cached price for {symbol}: ${price_cache[cache_key]['current_price']:.2f}")
+            stock_data[symbol] = price_cache[cache_key]
+        else:
+            uncached.append(symbol)
+
+    db_quotes = get_stock_prices_from_db(uncached)
+    for symbol in uncached:
+        if symbol in db_quotes:
+            stock_data[symbol] = quote_to_stock_data(db_quotes[symbol])
+            price_cache[f"price_{symbol}"] = stock_data[symbol]
+        else:
+            missing.append(symbol)
+
+    if not missing:
+        return stock_data
+
     try:
-        finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
-        logger.info("Initialized Finnhub client")
+        quote_fetcher = get_quote_fetcher()
     except Exception as e:
         logger.error(f"Failed to initialize Finnhub client: {str(e)}")
         print(f"Error: Failed to initialize Finnhub client: {str(e)}")
-        return stock_data
+        quote_fetcher = None
 
-    for symbol in STOCK_LIST:
-        try:
-            cache_key = f"price_{symbol}"
-            if cache_key in price_cache:
-                logger.debug(f"Using cached price for {symbol}: ${price_cache[cache_key]['current_price']:.2f}")
-                stock_data[symbol] = price_cache[cache_key]
-                continue
-
-            db_quote = get_stock_price_from_db(symbol)
-            if db_quote:
-                stock_data[symbol] = {
-                    "current_price": db_quote["c"],
-                    "high_price": db_quote["h"],
-                    "low_price": db_quote["l"],
-                    "previous_close": db_quote["pc"]
-                }
-                price_cache[cache_key] = stock_data[symbol]
-                continue
-
-            for attempt in range(5):
-                try:
-                    quote = finnhub_client.quote(symbol)
-                    if not isinstance(quote.get("c"), (int, float)) or quote["c"] <= 0:
-                        logger.warning(f"Invalid price data for {symbol}: {quote}")
-                        quote = {"o": 0.0, "c": 0.0, "h": 0.0, "l": 0.0, "pc": 0.0}
-                    stock_data[symbol] = {
-                        "current_price": float(quote["c"]),
-                        "high_price": float(quote["h"]),
-                        "low_price": float(quote["l"]),
-                        "previous_close": float(quote["pc"])
-                    }
-                    price_cache[cache_key] = stock_data[symbol]
-                    update_stock_price_in_db(symbol, quote)
-                    logger.info(f"Fetched and stored price for {symbol}: ${quote['c']:.2f}")
-                    break
-                except Exception as e:
-                    if "429" in str(e):
-                        delay = min(60, 10 * (2 ** attempt))
-                        logger.warning(f"Rate limit for {symbol}, retrying in {delay}s (attempt {attempt + 1}/5)")
-                        time.sleep(delay)
-                        if attempt == 4:
-                            logger.error(f"Rate limit exceeded for {symbol}, falling back to DB")
-                            db_quote = get_stock_price_from_db(symbol)
-                            if db_quote:
-                                stock_data[symbol] = {
-                                    "current_price": db_quote["c"],
-                                    "high_price": db_quote["h"],
-                                    "low_price": db_quote["l"],
-                                    "previous_close": db_quote["pc"]
-                                }
-                                price_cache[cache_key] = stock_data[symbol]
-                                logger.info(f"Used DB price for {symbol}: ${db_quote['c']:.2f}")
-                            else:
-                                logger.error(f"No DB price for {symbol}, using default 0.0")
-                                stock_data[symbol] = {
-                                    "current_price": 0.0,
-                                    "high_price": 0.0,
-                                    "low_price": 0.0,
-                                    "previous_close": 0.0
-                                }
-                                price_cache[cache_key] = stock_data[symbol]
-                            break
-                    else:
-                        logger.error(f"Failed to fetch Finnhub price for {symbol}: {str(e)}")
-                        stock_data[symbol] = {
-                            "current_price": 0.0,
-                            "high_price": 0.0,
-                            "low_price": 0.0,
-                            "previous_close": 0.0
-                        }
-                        price_cache[cache_key] = stock_data[symbol]
-                        break
-        except Exception as e:
-            logger.error(f"Unexpected error processing {symbol}: {str(e)}")
-            stock_data[symbol] = {
-                "current_price": 0.0,
-                "high_price": 0.0,
-                "low_price": 0.0,
-                "previous_close": 0.0
-            }
-            price_cache[cache_key] = stock_data[symbol]
-
-    return stock_data
+    quotes, unresolved = quote_fetcher.fetch(missing, budget) if quote_fetcher else ({}, missing)
+    for symbol, quote in quotes.items():
+        stock_data[symbol] = quote_to_stock_data(quote)
+        price_cache[f"price_{symbol}"] = stock_data[symbol]
+        logger.info(f"Fetched price for {symbol}: ${quote['c']:.2f}")
+    update_stock_prices_in_db(quotes)
+
+    # Unresolved symbols are not cached, so the next call picks up whatever the
+    # background retry stored in the meantime.
+    for symbol in unresolved:
+        logger.warning(f"No price for {symbol} within budget, using default 0.0")
+        stock_data[symbol] = dict(EMPTY_STOCK_DATA)
+
+    return {symbol: stock_data[symbol] for symbol in STOCK_LIST if symbol in stock_data}
+
+def write_shared_prices(stock_data: Dict[str, dict], refreshed_at: Optional[datetime] = None):
+    """Atomically replace the shared price cache file."""
+    SHARED_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "refreshed_at": (refreshed_at or datetime.now(timezone.utc)).isoformat(),
+        "prices": stock_data
+    }
+    tmp_file = SHARED_CACHE_FILE.with_suffix(".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_file, SHARED_CACHE_FILE)
+
+def read_shared_prices() -> Tuple[Dict[str, dict], Optional[datetime]]:
+    """Return (stock_data, refreshed_at) from the shared cache, or ({}, None) if it is missing."""
+    try:
+        with open(SHARED_CACHE_FILE) as f:
+            payload = json.load(f)
+        return payload.get("prices", {}), datetime.fromisoformat(payload["refreshed_at"])
+    except FileNotFoundError:
+        return {}, None
+    except Exception as e:
+        logger.error(f"Failed to read shared price cache: {str(e)}")
+        return {}, None
+
+def get_last_refresh_age() -> Optional[float]:
+    """Seconds since the refresher last wrote prices, or None if it never has."""
+    _, refreshed_at = read_shared_prices()
+    if refreshed_at is None:
+        return None
+    return (datetime.now(timezone.utc) - refreshed_at).total_seconds()
+
+def read_stock_prices() -> Dict[str, dict]:
+    """Read prices without touching the network: shared cache, then the DB (any age), then 0.0."""
+    stock_data, _ = read_shared_prices()
+    missing = [symbol for symbol in STOCK_LIST if symbol not in stock_data]
+    if missing:
+        db_quotes = get_stock_prices_from_db(missing, max_age=None)
+        for symbol, quote in db_quotes.items():
+            stock_data[symbol] = quote_to_stock_data(quote)
+    return {symbol: stock_data.get(symbol, dict(EMPTY_STOCK_DATA)) for symbol in STOCK_LIST}
 
 def main():
     logger.info("Starting stock price fetch")
@@ -0,0 +1,78 @@
+import argparse
+import time
+from datetime import datetime, timezone
+
+from scripts.fetch_stock_prices import (
+    STOCK_LIST,
+    EMPTY_STOCK_DATA,
+    logger,
+    price_cache,
+    get_quote_fetcher,
+    get_stock_prices_from_db,
+    update_stock_prices_in_db,
+    read_shared_prices,
+    write_shared_prices,
+    quote_to_stock_data,
+)
+
+# 20 symbols per minute stays well inside Finnhub's 60 calls/minute quota
+REFRESH_INTERVAL = 60  # seconds
+# The refresher is off the request path, so it can wait longer than a page render
+REFRESH_BUDGET = 30.0  # seconds
+
+def refresh_once(budget: float = REFRESH_BUDGET) -> dict:
+    """Fetch every symbol once and publish the result to the DB and the shared cache."""
+    quotes, unresolved = get_quote_fetcher().fetch(STOCK_LIST, budget)
+    update_stock_prices_in_db(quotes)
+
+    # Keep the last known price for anything Finnhub did not return this round
+    previous, _ = read_shared_prices()
+    stale = [symbol for symbol in unresolved if symbol not in previous]
+    db_quotes = get_stock_prices_from_db(stale, max_age=None) if stale else {}
+
+    stock_data = {}
+    for symbol in STOCK_LIST:
+        if symbol in quotes:
+            stock_data[symbol] = quote_to_stock_data(quotes[symbol])
+        elif symbol in previous:
+            stock_data[symbol] = previous[symbol]
+        elif symbol in db_quotes:
+            stock_data[symbol] = quote_to_stock_data(db_quotes[symbol])
+        else:
+            stock_data[symbol] = dict(EMPTY_STOCK_DATA)
+        price_cache[f"price_{symbol}"] = stock_data[symbol]
+
+    write_shared_prices(stock_data, datetime.now(timezone.utc))
+    logger.info(f"Refreshed {len(quotes)}/{len(STOCK_LIST)} prices ({len(unresolved)} carried over)")
+    return stock_data
+
+def run(interval: float = REFRESH_INTERVAL, budget: float = REFRESH_BUDGET):
+    """Refresh prices forever on a fixed schedule."""
+    logger.info(f"Starting price refresher (every {interval}s)")
+    while True:
+        started = time.monotonic()
+        try:
+            refresh_once(budget)
+        except Exception as e:
+            logger.error(f"Price refresh failed: {str(e)}")
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep stock_prices and the shared price cache warm.")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL, help="Seconds between refreshes")
+    parser.add_argument("--budget", type=float, default=REFRESH_BUDGET, help="Seconds to wait for Finnhub per refresh")
+    parser.add_argument("--once", action="store_true", help="Refresh a single time and exit")
+    args = parser.parse_args()
+
+    try:
+        if args.once:
+            stock_data = refresh_once(args.budget)
+            for symbol, data in stock_data.items():
+                print(f"{symbol}: ${data['current_price']:.2f}")
+        else:
+            run(args.interval, args.budget)
+    except KeyboardInterrupt:
+        logger.info("Price refresher stopped")
+
+if __name__ == "__main__":
+    main()
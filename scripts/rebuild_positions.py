@@ -0,0 +1,16 @@
+import argparse
+
+from gamification.virtual_currency import rebuild_positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the positions table from the trade ledger.")
+    parser.add_argument("--user-id", help="Only rebuild this user's positions (default: every user with trades)")
+    args = parser.parse_args()
+
+    users = rebuild_positions(args.user_id)
+    print(f"Rebuilt positions for {users} users")
+
+
+if __name__ == "__main__":
+    main()
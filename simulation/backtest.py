@@ -0,0 +1,195 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from data.mysql_db import db_connection
+from data.price_history import get_close_matrix
+from portfolio.accounting import _epoch, build_book, trade_quantity
+from utils.logger import logger
+
+TRADING_DAYS = 252
+DAY = 86400
+DEFAULT_INITIAL_CASH = 100000.0  # starting balance of every new user
+DEFAULT_SLIPPAGE_BPS = 5.0
+DEFAULT_FEE_BPS = 10.0           # 0.1%, the transaction cost the agents assume
+
+
+@dataclass(frozen=True)
+class Order:
+    symbol: str
+    quantity: float  # positive buys, negative sells
+    timestamp: int   # epoch seconds
+
+
+def orders_from_recommendations(recommendations: Iterable[Dict], timestamp) -> List[Order]:
+    """Orders for recommendations in the run_workflow / StrategistAgent schema."""
+    orders = []
+    for rec in recommendations:
+        try:
+            quantity = float(rec["Quantity"])
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Skipping recommendation without a usable quantity: {rec.get('Symbol')}")
+            continue
+        sign = -1 if str(rec.get("Action", "Buy")).lower() == "sell" else 1
+        orders.append(Order(rec["Symbol"].upper(), sign * quantity, _epoch(timestamp)))
+    return orders
+
+
+def orders_from_trades(trades: Iterable[Dict]) -> List[Order]:
+    """Orders for rows of the trades table."""
+    orders = []
+    for trade in trades:
+        quantity = trade_quantity(trade)
+        sign = -1 if trade["trade_type"] == "sell" else 1
+        orders.append(Order(trade["symbol"], sign * quantity, _epoch(trade["timestamp"])))
+    return orders
+
+
+def load_trades(user_id: Optional[str] = None) -> List[Dict]:
+    """Trades in time order, for one user or everyone."""
+    query = "SELECT * FROM trades"
+    params: Tuple = ()
+    if user_id is not None:
+        query += " WHERE user_id = %s"
+        params = (user_id,)
+    query += " ORDER BY timestamp"
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params)
+            trades = cursor.fetchall()
+            cursor.close()
+        return trades
+    except Exception as e:
+        logger.error(f"Failed to load trades for backtest: {str(e)}")
+        return []
+
+
+@dataclass(frozen=True)
+class BacktestResult:
+    symbols: List[str]
+    days: np.ndarray        # epoch seconds at the start of each day
+    positions: np.ndarray   # (days, symbols) shares held at each close
+    cash: np.ndarray
+    equity: np.ndarray
+    fills: Dict[str, np.ndarray]
+    stats: Dict[str, float]
+
+    def to_dict(self) -> Dict:
+        return {
+            "symbols": self.symbols,
+            "days": self.days.tolist(),
+            "equity": self.equity.round(2).tolist(),
+            "cash": self.cash.round(2).tolist(),
+            "stats": self.stats,
+        }
+
+
+def compute_stats(equity: np.ndarray, risk_free_rate: float = 0.0) -> Dict[str, float]:
+    """Return, volatility, Sharpe ratio and max drawdown of a daily equity curve."""
+    if len(equity) < 2 or equity[0] <= 0:
+        return {"total_return": 0.0, "annual_return": 0.0, "annual_volatility": 0.0,
+                "sharpe_ratio": 0.0, "max_drawdown": 0.0}
+    returns = np.diff(equity) / equity[:-1]
+    years = len(returns) / TRADING_DAYS
+    total_return = equity[-1] / equity[0] - 1
+    annual_return = (1 + total_return) ** (1 / years) - 1 if total_return > -1 else -1.0
+    annual_volatility = returns.std(ddof=1) * np.sqrt(TRADING_DAYS) if len(returns) > 1 else 0.0
+    excess = returns.mean() * TRADING_DAYS - risk_free_rate
+    peaks = np.maximum.accumulate(equity)
+    return {
+        "total_return": float(total_return),
+        "annual_return": float(annual_return),
+        "annual_volatility": float(annual_volatility),
+        "sharpe_ratio": float(excess / annual_volatility) if annual_volatility > 0 else 0.0,
+        "max_drawdown": float((1 - equity / peaks).max()),
+    }
+
+
+def run_backtest(orders: List[Order], symbols: Optional[List[str]] = None,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 initial_cash: float = DEFAULT_INITIAL_CASH,
+                 slippage_bps: float = DEFAULT_SLIPPAGE_BPS, fee_bps: float = DEFAULT_FEE_BPS,
+                 prices: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 risk_free_rate: float = 0.0, accounting_method: str = "fifo") -> BacktestResult:
+    """Replay orders against daily closes and return the equity curve and stats.
+
+    Each order fills at the close of its day (or the first day after it with
+    data), moved against the trader by `slippage_bps` and charged `fee_bps`.
+    Orders are replayed as recorded; cash is not checked, since the trades
+    table already enforced balances. `prices` may pass (days, closes) directly
+    instead of reading stored history. Realized and unrealized P&L of the
+    fills are reported with `accounting_method` (fifo, lifo or average).
+    """
+    symbols = list(symbols or sorted({order.symbol for order in orders}))
+    days, closes = prices if prices is not None else get_close_matrix(symbols, start, end)
+    n_days, n_symbols = len(days), len(symbols)
+    positions = np.zeros((n_days, n_symbols))
+    cash_flows = np.zeros(n_days)
+
+    column = {symbol: j for j, symbol in enumerate(symbols)}
+    known = [order for order in orders if order.symbol in column]
+    sym_idx = np.array([column[order.symbol] for order in known], dtype=np.int64)
+    qty = np.array([order.quantity for order in known], dtype=np.float64)
+    order_days = np.array([order.timestamp // DAY * DAY for order in known], dtype=np.int64)
+
+    # Vectorized fills: locate each order's bar, then price every fill at once
+    day_idx = np.searchsorted(days, order_days)
+    in_range = day_idx < n_days
+    fill_price = np.full(len(known), np.nan)
+    fill_price[in_range] = closes[day_idx[in_range], sym_idx[in_range]]
+    filled = in_range & np.isfinite(fill_price)
+    if (~filled).any():
+        logger.warning(f"Backtest skipped {int((~filled).sum())} orders with no price data")
+    day_idx, sym_idx, qty = day_idx[filled], sym_idx[filled], qty[filled]
+    slippage = np.abs(qty) * fill_price[filled] * slippage_bps / 10000
+    fill_price = fill_price[filled] * (1 + np.sign(qty) * slippage_bps / 10000)
+    notional = qty * fill_price
+    fees = np.abs(notional) * fee_bps / 10000
+
+    np.add.at(positions, (day_idx, sym_idx), qty)
+    np.cumsum(positions, axis=0, out=positions)
+    np.add.at(cash_flows, day_idx, -notional - fees)
+    cash = initial_cash + np.cumsum(cash_flows)
+    # Before a symbol's first close the position is necessarily zero, so NaN prices count as 0
+    marks = np.where(positions != 0, np.nan_to_num(closes), 0.0)
+    equity = cash + (positions * marks).sum(axis=1)
+
+    stats = compute_stats(equity, risk_free_rate)
+    book = build_book([symbols[j] for j in sym_idx], qty, fill_price, days[day_idx], accounting_method)
+    last_closes = {}
+    if n_days:
+        # Latest known close per symbol, for marking whatever is still held
+        filled_rows = np.where(np.isfinite(closes), np.arange(n_days)[:, None], -1)
+        last_row = filled_rows.max(axis=0)
+        last_closes = {symbol: float(closes[last_row[j], j]) for j, symbol in enumerate(symbols) if last_row[j] >= 0}
+    totals = book.totals(last_closes)
+    stats.update({
+        "fills": int(filled.sum()),
+        "realized_pnl": totals["realized_pnl"],
+        "unrealized_pnl": totals["unrealized_pnl"],
+        "total_fees": float(fees.sum()),
+        "total_slippage": float(slippage.sum()),
+        "turnover": float(np.abs(notional).sum() / initial_cash) if initial_cash else 0.0,
+    })
+    return BacktestResult(
+        symbols=symbols,
+        days=np.asarray(days),
+        positions=positions,
+        cash=cash,
+        equity=equity,
+        fills={"day_index": day_idx, "symbol_index": sym_idx, "quantity": qty,
+               "price": fill_price, "fee": fees},
+        stats=stats,
+    )
+
+
+def backtest_user_trades(user_id: str, **kwargs) -> Optional[BacktestResult]:
+    """Backtest a user's recorded trades from the trades table."""
+    orders = orders_from_trades(load_trades(user_id))
+    if not orders:
+        logger.info(f"No trades to backtest for user {user_id}")
+        return None
+    return run_backtest(orders, **kwargs)
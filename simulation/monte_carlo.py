@@ -0,0 +1,197 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from data.price_history import get_close_matrix
+from simulation.paths import simulate_paths
+from utils.logger import logger
+
+TRADING_DAYS = 252
+DEFAULT_PATHS = 20000
+LOOKBACK_DAYS = 3 * 365
+MIN_OBSERVATIONS = 60  # daily returns needed before a symbol's history is trusted
+STEPS_PER_YEAR = 4     # checkpoints per simulated year
+MAX_STEPS = 40
+PERCENTILES = (5, 25, 50, 75, 95)
+SHRINKAGE = 0.1        # blend of the sample covariance towards its diagonal
+
+
+def _cholesky(cov: np.ndarray) -> np.ndarray:
+    """Cholesky factor, nudging the diagonal until the matrix is positive definite."""
+    jitter = 0.0
+    scale = float(np.mean(np.diag(cov))) or 1e-8
+    for _ in range(6):
+        try:
+            return np.linalg.cholesky(cov + jitter * np.eye(len(cov)))
+        except np.linalg.LinAlgError:
+            jitter = scale * 1e-6 if jitter == 0.0 else jitter * 10
+    return np.diag(np.sqrt(np.clip(np.diag(cov), 0.0, None)))
+
+
+@dataclass(frozen=True)
+class MarketModel:
+    """Daily log-return drift and covariance for a fixed list of symbols."""
+    symbols: List[str]
+    mu: np.ndarray       # mean daily log return per symbol
+    cov: np.ndarray      # daily log-return covariance
+    chol: np.ndarray
+    observations: int
+    estimated: List[str] = field(default_factory=list)  # symbols backed by their own history
+
+    @classmethod
+    def from_returns(cls, symbols: List[str], returns: np.ndarray) -> "MarketModel":
+        mu = returns.mean(axis=0)
+        sample = np.atleast_2d(np.cov(returns, rowvar=False))
+        cov = (1 - SHRINKAGE) * sample + SHRINKAGE * np.diag(np.diag(sample))
+        return cls(list(symbols), mu, cov, _cholesky(cov), len(returns), list(symbols))
+
+    @classmethod
+    def from_history(cls, symbols: List[str], lookback_days: int = LOOKBACK_DAYS) -> Optional["MarketModel"]:
+        """Estimate the model from stored daily closes.
+
+        Symbols without enough history borrow the average drift and median variance
+        of the others and are treated as uncorrelated. Returns None when no symbol
+        has enough history to estimate anything.
+        """
+        start = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+        _, closes = get_close_matrix(symbols, start=start)
+        if len(closes) < MIN_OBSERVATIONS + 1:
+            return None
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.diff(np.log(closes), axis=0)
+        has_data = np.isfinite(returns).sum(axis=0) >= MIN_OBSERVATIONS
+        if not has_data.any():
+            return None
+
+        usable = returns[:, has_data]
+        usable = usable[np.isfinite(usable).all(axis=1)]
+        if len(usable) < MIN_OBSERVATIONS:
+            return None
+        known = cls.from_returns([s for s, ok in zip(symbols, has_data) if ok], usable)
+        if has_data.all():
+            return known
+
+        mu = np.full(len(symbols), known.mu.mean())
+        cov = np.diag(np.full(len(symbols), np.median(np.diag(known.cov))))
+        idx = np.flatnonzero(has_data)
+        mu[idx] = known.mu
+        cov[np.ix_(idx, idx)] = known.cov
+        logger.info(f"No usable price history for {[s for s, ok in zip(symbols, has_data) if not ok]}, using universe averages")
+        return cls(list(symbols), mu, cov, _cholesky(cov), known.observations, known.symbols)
+
+    def annual_volatility(self, weights: np.ndarray) -> float:
+        """Annualized volatility of a portfolio with the given dollar weights."""
+        total = weights.sum()
+        if total <= 0:
+            return 0.0
+        w = weights / total
+        return float(np.sqrt(max(w @ self.cov @ w, 0.0) * TRADING_DAYS))
+
+
+@dataclass(frozen=True)
+class RiskProjection:
+    """Distribution of simulated portfolio values at each checkpoint."""
+    horizon_years: float
+    n_paths: int
+    initial_value: float
+    checkpoints: np.ndarray            # years from now
+    bands: Dict[int, np.ndarray]       # percentile -> value at each checkpoint
+    expected_value: float
+    prob_loss: float
+    value_at_risk: float               # 95% VaR at the horizon, in dollars
+    expected_shortfall: float          # mean loss in the worst 5% of paths, in dollars
+    median_max_drawdown: float         # fraction of peak value
+    annual_volatility: float
+    observations: int
+
+    @property
+    def final_bands(self) -> Dict[int, float]:
+        return {p: float(values[-1]) for p, values in self.bands.items()}
+
+    def to_dict(self) -> Dict:
+        """JSON-friendly view for workflow results and the UI."""
+        return {
+            "horizon_years": self.horizon_years,
+            "n_paths": self.n_paths,
+            "initial_value": self.initial_value,
+            "checkpoints": self.checkpoints.round(4).tolist(),
+            "bands": {str(p): values.round(2).tolist() for p, values in self.bands.items()},
+            "expected_value": round(self.expected_value, 2),
+            "prob_loss": round(self.prob_loss, 4),
+            "value_at_risk": round(self.value_at_risk, 2),
+            "expected_shortfall": round(self.expected_shortfall, 2),
+            "median_max_drawdown": round(self.median_max_drawdown, 4),
+            "annual_volatility": round(self.annual_volatility, 4),
+            "observations": self.observations,
+        }
+
+
+def simulate_portfolio(holdings: Dict[str, float], model: MarketModel, horizon_years: float,
+                       cash: float = 0.0, n_paths: int = DEFAULT_PATHS,
+                       steps_per_year: int = STEPS_PER_YEAR, seed: Optional[int] = None,
+                       workers: Optional[int] = None) -> RiskProjection:
+    """Simulate buy-and-hold dollar `holdings` under correlated GBM.
+
+    Paths are advanced one checkpoint at a time with exact lognormal increments.
+    Large runs are split across processes (see simulation.paths); a fixed seed
+    gives the same projection for any `workers`.
+    """
+    weights = np.array([float(holdings.get(symbol, 0.0)) for symbol in model.symbols])
+    initial = float(weights.sum() + cash)
+    n_steps = int(min(MAX_STEPS, max(1, round(horizon_years * steps_per_year))))
+    dt = horizon_years * TRADING_DAYS / n_steps
+    drift = model.mu * dt
+    chol_t = (model.chol * np.sqrt(dt)).T
+    annual_volatility = model.annual_volatility(weights)
+    return simulate_paths(
+        weights, cash, drift, chol_t, n_paths, n_steps,
+        lambda values: summarize_paths(values, initial, horizon_years, annual_volatility, model.observations),
+        seed=seed, workers=workers
+    )
+
+
+def summarize_paths(values: np.ndarray, initial: float, horizon_years: float,
+                    annual_volatility: float = 0.0, observations: int = 0) -> RiskProjection:
+    """Turn simulated (paths, checkpoints) values into risk statistics."""
+    n_paths, n_steps = values.shape
+    final = values[:, -1]
+    bands = dict(zip(PERCENTILES, np.percentile(values, PERCENTILES, axis=0)))
+    tail_cutoff = np.percentile(final, 5)
+    tail = final[final <= tail_cutoff]
+    peaks = np.maximum.accumulate(np.concatenate([np.full((n_paths, 1), initial), values], axis=1), axis=1)[:, 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdowns = np.where(peaks > 0, 1 - values / peaks, 0.0).max(axis=1)
+    return RiskProjection(
+        horizon_years=float(horizon_years),
+        n_paths=n_paths,
+        initial_value=initial,
+        checkpoints=np.linspace(horizon_years / n_steps, horizon_years, n_steps),
+        bands=bands,
+        expected_value=float(final.mean()),
+        prob_loss=float((final < initial).mean()),
+        value_at_risk=float(max(initial - tail_cutoff, 0.0)),
+        expected_shortfall=float(max(initial - tail.mean(), 0.0)) if len(tail) else 0.0,
+        median_max_drawdown=float(np.median(drawdowns)),
+        annual_volatility=annual_volatility,
+        observations=observations,
+    )
+
+
+def project_portfolio(holdings: Dict[str, float], horizon_years: float, cash: float = 0.0,
+                      n_paths: int = DEFAULT_PATHS, seed: Optional[int] = None,
+                      workers: Optional[int] = None) -> Optional[RiskProjection]:
+    """Estimate a model from price history and simulate `holdings`; None if history is too thin."""
+    holdings = {symbol: amount for symbol, amount in holdings.items() if amount > 0}
+    if not holdings:
+        return None
+    try:
+        model = MarketModel.from_history(sorted(holdings))
+        if model is None:
+            logger.info("Not enough price history for a Monte Carlo projection")
+            return None
+        return simulate_portfolio(holdings, model, horizon_years, cash, n_paths, seed=seed, workers=workers)
+    except Exception as e:
+        logger.error(f"Monte Carlo projection failed: {str(e)}")
+        return None
@@ -0,0 +1,107 @@
+"""Path generation for the Monte Carlo simulator.
+
+Kept free of database and agent imports so spawned worker processes only load NumPy.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from typing import Callable, Optional, TypeVar
+import math
+import os
+import threading
+
+import numpy as np
+
+BATCH_PATHS = 2500  # paths per batch; batches (not workers) own the random streams
+PARALLEL_MIN_DRAWS = 20_000_000  # below this many normal draws a process pool costs more than it saves
+
+T = TypeVar("T")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def simulate_batch(out: np.ndarray, weights: np.ndarray, cash: float, drift: np.ndarray,
+                   chol_t: np.ndarray, seed: np.random.SeedSequence):
+    """Fill `out` (paths, steps) with portfolio values for one batch of GBM paths."""
+    n_paths, n_steps = out.shape
+    rng = np.random.default_rng(seed)
+    half = (n_paths + 1) // 2
+    log_growth = np.zeros((n_paths, len(weights)))
+    for k in range(n_steps):
+        # Antithetic pairs halve the normal draws and reduce the variance of the estimates
+        z = rng.standard_normal((half, len(weights)))
+        log_growth += drift + np.concatenate([z, -z])[:n_paths] @ chol_t
+        out[:, k] = np.exp(log_growth) @ weights + cash
+
+
+def _simulate_batch_shared(shm_name: str, shape, start: int, stop: int, weights, cash, drift, chol_t, seed):
+    """Worker entry point: write one batch straight into the parent's shared buffer."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        simulate_batch(values[start:stop], weights, cash, drift, chol_t, seed)
+        del values
+    finally:
+        shm.close()
+    return stop - start
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared process pool, rebuilt only when a different size is requested."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn rather than fork: the app process runs threads (Streamlit, quote fetchers)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def default_workers(n_paths: int, n_steps: int, n_assets: int) -> int:
+    if n_paths * n_steps * n_assets < PARALLEL_MIN_DRAWS:
+        return 1
+    return max(1, min(os.cpu_count() or 1, math.ceil(n_paths / BATCH_PATHS)))
+
+
+def simulate_paths(weights: np.ndarray, cash: float, drift: np.ndarray, chol_t: np.ndarray,
+                   n_paths: int, n_steps: int, summarize: Callable[[np.ndarray], T],
+                   seed: Optional[int] = None, workers: Optional[int] = None) -> T:
+    """Simulate (n_paths, n_steps) portfolio values and return summarize(values).
+
+    Paths are split into fixed batches seeded from one SeedSequence, so a given
+    seed produces identical values for any worker count. With more than one
+    worker, batches run in a process pool and write into shared memory, which is
+    released once `summarize` returns; it must not keep views of the array.
+    """
+    batches = [(start, min(start + BATCH_PATHS, n_paths)) for start in range(0, n_paths, BATCH_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    if workers is None:
+        workers = default_workers(n_paths, n_steps, len(weights))
+
+    if workers <= 1:
+        values = np.empty((n_paths, n_steps))
+        for (start, stop), batch_seed in zip(batches, seeds):
+            simulate_batch(values[start:stop], weights, cash, drift, chol_t, batch_seed)
+        return summarize(values)
+
+    shape = (n_paths, n_steps)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, n_paths * n_steps * 8))
+    try:
+        pool = get_pool(workers)
+        futures = [
+            pool.submit(_simulate_batch_shared, shm.name, shape, start, stop, weights, cash, drift, chol_t, batch_seed)
+            for (start, stop), batch_seed in zip(batches, seeds)
+        ]
+        for future in futures:
+            future.result()
+        values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        try:
+            return summarize(values)
+        finally:
+            del values
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,89 @@
+import random
+
+import numpy as np
+import pytest
+
+from portfolio.accounting import METHODS, build_book
+
+
+def reference_book(symbols, quantities, prices, method):
+    """Per-trade realized P&L, open lots and oversold shares from a plain lot-by-lot loop."""
+    lots, realized, unmatched = {}, [], {}
+    for symbol, quantity, price in zip(symbols, quantities, prices):
+        open_lots = lots.setdefault(symbol, [])
+        if quantity > 0:
+            open_lots.append([quantity, price])
+            realized.append(0.0)
+            continue
+        held = sum(lot[0] for lot in open_lots)
+        needed = min(-quantity, held)
+        unmatched[symbol] = unmatched.get(symbol, 0.0) + (-quantity - needed)
+        if method == "average":
+            avg_cost = sum(lot[0] * lot[1] for lot in open_lots) / held if held > 0 else 0.0
+            realized.append(needed * (price - avg_cost))
+            remaining = held - needed
+            open_lots[:] = [[remaining, avg_cost]] if remaining > 1e-6 else []
+            continue
+        sold, cost = needed, 0.0
+        while needed > 1e-9 and open_lots:
+            lot = open_lots[0] if method == "fifo" else open_lots[-1]
+            take = min(lot[0], needed)
+            cost += take * lot[1]
+            lot[0] -= take
+            needed -= take
+            if lot[0] <= 1e-9:
+                open_lots.remove(lot)
+        realized.append(sold * price - cost)
+    return realized, lots, unmatched
+
+
+def assert_matches_reference(symbols, quantities, prices, method):
+    book = build_book(symbols, quantities, prices, method=method)
+    realized, lots, unmatched = reference_book(symbols, quantities, prices, method)
+    np.testing.assert_allclose(book.realized, realized, rtol=1e-9, atol=1e-6)
+    for symbol, open_lots in lots.items():
+        position = book.positions[symbol]
+        assert position.quantity == pytest.approx(sum(lot[0] for lot in open_lots), abs=1e-6)
+        assert position.cost_basis == pytest.approx(sum(lot[0] * lot[1] for lot in open_lots), rel=1e-9, abs=1e-6)
+        assert position.unmatched_quantity == pytest.approx(unmatched.get(symbol, 0.0), abs=1e-6)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_random_ledgers_match_reference(method):
+    rng = random.Random(7)
+    for _ in range(200):
+        n = rng.randint(1, 60)
+        symbols = [rng.choice("ABC") for _ in range(n)]
+        quantities = [round(rng.uniform(1, 20), 2) * (1 if rng.random() < 0.55 else -1) for _ in range(n)]
+        prices = [round(rng.uniform(5, 50), 2) for _ in range(n)]
+        assert_matches_reference(symbols, quantities, prices, method)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_long_partial_sell_sequence_stays_finite(method):
+    quantities = [10.0] + [-5.0, 5.0] * 2000
+    prices = [100.0] + [101.0, 99.0] * 2000
+    book = build_book(["AAPL"] * len(quantities), quantities, prices, method=method)
+    assert np.isfinite(book.realized).all()
+    assert book.positions["AAPL"].quantity == pytest.approx(10.0)
+    assert np.isfinite(book.positions["AAPL"].cost_basis)
+    assert_matches_reference(["AAPL"] * len(quantities), quantities, prices, method)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_sell_to_zero_then_rebuy_starts_fresh(method):
+    book = build_book(["X"] * 4, [10, -10, 4, -2], [10.0, 12.0, 20.0, 25.0], method=method)
+    assert book.realized.tolist() == pytest.approx([0.0, 20.0, 0.0, 10.0])
+    assert book.positions["X"].cost_basis == pytest.approx(40.0)
+
+
+def test_oversell_is_clipped_and_reported():
+    book = build_book(["X", "X"], [5, -8], [10.0, 11.0], method="average")
+    assert book.executed.tolist() == [5.0, -5.0]
+    assert book.positions["X"].unmatched_quantity == pytest.approx(3.0)
+    assert book.positions["X"].quantity == 0.0
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        build_book(["X"], [1], [1.0], method="hifo")
@@ -0,0 +1,85 @@
+import importlib
+import sys
+import types
+
+import numpy as np
+import pytest
+
+DAY = 86400
+
+
+@pytest.fixture
+def backtest(monkeypatch):
+    """simulation.backtest without MySQL: the tests pass prices in instead of reading stored history."""
+    mysql_db = types.ModuleType("data.mysql_db")
+    mysql_db.db_connection = lambda: pytest.fail("the database should not be touched")
+    price_history = types.ModuleType("data.price_history")
+    price_history.get_close_matrix = lambda *args, **kwargs: pytest.fail("stored history should not be read")
+    monkeypatch.setitem(sys.modules, "data.mysql_db", mysql_db)
+    monkeypatch.setitem(sys.modules, "data.price_history", price_history)
+    monkeypatch.delitem(sys.modules, "simulation.backtest", raising=False)
+    module = importlib.import_module("simulation.backtest")
+    # Dropped again afterwards so no other test sees the module bound to the stubs
+    monkeypatch.setitem(sys.modules, "simulation.backtest", module)
+    return module
+
+
+@pytest.fixture
+def prices():
+    days = np.arange(4) * DAY
+    closes = np.array([[10.0, np.nan],
+                       [11.0, 20.0],
+                       [12.0, 22.0],
+                       [13.0, 21.0]])
+    return days, closes
+
+
+def test_fills_cash_and_positions(backtest, prices):
+    Order = backtest.Order
+    orders = [
+        Order("AAA", 10, 3600),
+        Order("BBB", 5, DAY + 100),
+        Order("AAA", -4, 2 * DAY + 100),
+        Order("BBB", 1, 0),          # before BBB's first close
+        Order("AAA", 1, 9 * DAY),    # after the last day
+        Order("ZZZ", 1, DAY),        # not a backtested symbol
+    ]
+    result = backtest.run_backtest(orders, symbols=["AAA", "BBB"], initial_cash=1000.0,
+                                   slippage_bps=10, fee_bps=10, prices=prices)
+
+    # Fills at the day's close, moved 10bps against the trader
+    np.testing.assert_allclose(result.fills["price"], [10.01, 20.02, 11.988])
+    np.testing.assert_allclose(result.fills["fee"], [0.1001, 0.1001, 0.047952])
+    np.testing.assert_array_equal(result.positions, [[10, 0], [10, 5], [6, 5], [6, 5]])
+    np.testing.assert_allclose(result.cash, [899.7999, 799.5998, 847.503848, 847.503848])
+    np.testing.assert_allclose(result.equity, [999.7999, 1009.5998, 1029.503848, 1030.503848])
+
+    stats = result.stats
+    assert stats["fills"] == 3
+    assert stats["total_return"] == pytest.approx(1030.503848 / 999.7999 - 1)
+    assert stats["max_drawdown"] == 0.0
+    assert stats["realized_pnl"] == pytest.approx(4 * (11.988 - 10.01))
+    assert stats["unrealized_pnl"] == pytest.approx(6 * (13 - 10.01) + (5 * 21 - 100.1))
+    assert stats["total_fees"] == pytest.approx(0.1001 + 0.1001 + 0.047952)
+    assert stats["turnover"] == pytest.approx((100.1 + 100.1 + 47.952) / 1000.0)
+
+
+def test_compute_stats(backtest):
+    stats = backtest.compute_stats(np.array([100.0, 110.0, 99.0, 121.0]))
+    assert stats["total_return"] == pytest.approx(0.21)
+    assert stats["max_drawdown"] == pytest.approx(0.1)
+    returns = np.array([0.1, -0.1, 121.0 / 99.0 - 1])
+    volatility = returns.std(ddof=1) * np.sqrt(backtest.TRADING_DAYS)
+    assert stats["annual_volatility"] == pytest.approx(volatility)
+    assert stats["sharpe_ratio"] == pytest.approx(returns.mean() * backtest.TRADING_DAYS / volatility)
+    assert backtest.compute_stats(np.array([100.0]))["total_return"] == 0.0
+
+
+def test_orders_from_recommendations_and_trades(backtest):
+    orders = backtest.orders_from_recommendations(
+        [{"Symbol": "aaa", "Action": "Sell", "Quantity": "2"}, {"Symbol": "BBB", "Quantity": None}],
+        "1970-01-02 00:00:00")
+    assert orders == [backtest.Order("AAA", -2.0, DAY)]
+    orders = backtest.orders_from_trades([{"symbol": "AAA", "trade_type": "buy", "amount": 50.0, "price": 10.0,
+                                           "quantity": None, "timestamp": "1970-01-03 00:00:00"}])
+    assert orders == [backtest.Order("AAA", 5.0, 2 * DAY)]
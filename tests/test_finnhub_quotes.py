@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from data import finnhub_quotes
+from data.finnhub_quotes import RETRY_DELAYS, QuoteFetcher, TokenBucket
+
+
+class FakeClock:
+    """Stands in for the time module: sleeping advances the clock instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._lock = threading.Lock()
+
+    def monotonic(self):
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += max(0.0, seconds)
+
+
+class StubClient:
+    def __init__(self, errors=None):
+        self.errors = dict(errors or {})
+        self.calls = []
+
+    def quote(self, symbol):
+        self.calls.append(symbol)
+        if symbol in self.errors:
+            raise self.errors[symbol]
+        return {"c": 100.0 + len(self.calls), "o": 99.0, "h": 101.0, "l": 98.0, "pc": 99.5}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(finnhub_quotes, "time", clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    bucket = TokenBucket(60, capacity=2)
+    assert bucket.acquire(timeout=0) and bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0.5)
+    assert clock.now == pytest.approx(0.5)
+    # Half a token is left from the wait above, so the next one is due half a second later
+    assert bucket.acquire()
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_bucket_never_holds_more_than_capacity(clock):
+    bucket = TokenBucket(60, capacity=3)
+    clock.sleep(3600)
+    assert all(bucket.acquire(timeout=0) for _ in range(3))
+    assert not bucket.acquire(timeout=0)
+
+
+def test_drain_makes_every_caller_wait(clock):
+    bucket = TokenBucket(60, capacity=5)
+    bucket.drain()
+    assert not bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=1.0)
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_symbols_over_budget_are_deferred(clock):
+    client = StubClient()
+    fetcher = QuoteFetcher(client, bucket=TokenBucket(60, capacity=2), max_workers=1)
+    quotes, unresolved = fetcher.fetch(["AAPL", "MSFT", "NVDA", "TSLA"], budget=0.5)
+    assert sorted(quotes) == ["AAPL", "MSFT"]
+    assert sorted(unresolved) == ["NVDA", "TSLA"]
+    assert fetcher.pending() == ["NVDA", "TSLA"]
+    # Deferred symbols never reached the client
+    assert client.calls == ["AAPL", "MSFT"]
+
+
+def test_throttled_symbols_carry_over_and_other_failures_do_not(clock):
+    client = StubClient({"MSFT": Exception("429 Too Many Requests"), "NVDA": Exception("boom")})
+    bucket = TokenBucket(60, capacity=10)
+    fetcher = QuoteFetcher(client, bucket=bucket, max_workers=1)
+    quotes, unresolved = fetcher.fetch(["MSFT", "NVDA"], budget=5.0)
+    assert quotes == {}
+    assert sorted(unresolved) == ["MSFT", "NVDA"]
+    assert fetcher.pending() == ["MSFT"]
+    # A 429 drains the shared bucket so other callers back off too
+    assert not bucket.acquire(timeout=0)
+
+    # Deferring again while a retry is queued does not duplicate it
+    fetcher.defer("MSFT")
+    assert len(fetcher._retry_heap) == 1
+
+
+def test_background_retry_backs_off_then_delivers(clock):
+    late = {}
+    client = StubClient({"MSFT": Exception("429 Too Many Requests")})
+    fetcher = QuoteFetcher(client, bucket=TokenBucket(60, capacity=10), max_workers=1,
+                           on_late_quote=lambda symbol, quote: late.setdefault(symbol, quote))
+    fetcher._retry_one("MSFT", 0)
+    assert fetcher.pending() == ["MSFT"]
+    assert [entry[1:] for entry in fetcher._retry_heap] == [("MSFT", 1)]
+
+    del client.errors["MSFT"]
+    fetcher._retry_one("MSFT", 1)
+    assert fetcher.pending() == []
+    assert late["MSFT"]["c"] > 0
+
+
+def test_retries_give_up_after_the_last_delay(clock):
+    client = StubClient({"MSFT": Exception("429 Too Many Requests")})
+    fetcher = QuoteFetcher(client, bucket=TokenBucket(60, capacity=10), max_workers=1)
+    fetcher._retry_one("MSFT", len(RETRY_DELAYS) - 1)
+    assert fetcher.pending() == []
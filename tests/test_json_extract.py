@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from utils.json_extract import ArrayItemStream, JSONExtractor, extract_json
+
+DOCUMENT = {"recommendations": [{"Symbol": "AAPL", "Reason": "Strong {margins} and \"fair\" value [see notes]"},
+                                {"Symbol": "MSFT", "Quantity": 2.5}],
+            "insights": "Balanced exposure."}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('Sure!\n```json\n{"a": 1, "b": [1, 2]}\n```\nLet me know.', {"a": 1, "b": [1, 2]}),
+    ('Values like {x} and [y] are placeholders. {"a": 1}', {"a": 1}),
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+    ('}} ]] stray closers first {"a": 1}', {"a": 1}),
+    ('{"a": "x } y ] {"}', {"a": "x } y ] {"}),
+    (r'{"a": "he said \"hi\" {"}', {"a": 'he said "hi" {'}),
+    ('{"a": "line\nbreak"}', {"a": "line\nbreak"}),
+    ('{bad} {"ok": true}', {"ok": True}),
+    ('{"a": [1, 2} mismatched, then {"b": 3}', {"b": 3}),
+    ('{"a": 1} {"b": 2}', {"a": 1}),
+])
+def test_malformed_text_yields_first_valid_value(text, expected):
+    assert extract_json(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1, 2], "b": "tru', {"a": [1, 2], "b": "tru"}),
+    ('{"a": 1, "b":', {"a": 1, "b": None}),
+    ('{"a": 1, "b": 2,', {"a": 1, "b": 2}),
+    ('[{"a": 1}, {"b"', None),
+])
+def test_truncated_values_are_closed(text, expected):
+    assert extract_json(text, default=None) == expected
+
+
+@pytest.mark.parametrize("text", ["", None, "no json here", "{not json}", '{"a": [1, 2}', "```json\n```"])
+def test_no_value_returns_default(text):
+    assert extract_json(text, default={"fallback": True}) == {"fallback": True}
+
+
+def test_openers_restrict_the_value_type():
+    text = '[1, 2] then {"a": 1}'
+    assert extract_json(text) == [1, 2]
+    assert extract_json(text, openers="{") == {"a": 1}
+    assert extract_json('{"a": 1}', openers="[") is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 16, 1000])
+def test_streamed_chunks_match_whole_text(chunk_size):
+    text = "Here you go {draft} ```json\n" + json.dumps(DOCUMENT, indent=2) + "\n``` done"
+    extractor = JSONExtractor("{")
+    value = None
+    for i in range(0, len(text), chunk_size):
+        value = extractor.feed(text[i:i + chunk_size])
+        if value is not None:
+            break
+    assert value == DOCUMENT == extract_json(text)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_array_items_stream_skips_broken_items(chunk_size):
+    text = ('{"recommendations": [{"Symbol": "AAPL", "Reason": "a } b"}, {"Symbol": oops}, '
+            '{"Symbol": "MSFT", "Score": 80,}], "other": [{"Symbol": "X"}]}')
+    stream = ArrayItemStream("recommendations")
+    items = []
+    for i in range(0, len(text), chunk_size):
+        items.extend(stream.feed(text[i:i + chunk_size]))
+    assert items == [{"Symbol": "AAPL", "Reason": "a } b"}, {"Symbol": "MSFT", "Score": 80}]
@@ -0,0 +1,121 @@
+import types
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from utils import llm_cache
+from utils.llm_cache import CachedChatModel, LLMCache, cache_key, snapshot_scope
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(llm_cache, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return LLMCache(tmp_path / "llm_cache.sqlite3", ttl=60, max_entries=3)
+
+
+class StubModel:
+    model_name = "stub-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return AIMessage(content=f"reply {self.calls}")
+
+    def stream(self, prompt):
+        self.calls += 1
+        for part in ("re", "ply ", str(self.calls)):
+            yield AIMessageChunk(content=part)
+
+
+def test_entries_expire_after_the_ttl(cache, clock):
+    cache.put("k", "m", "hello")
+    clock.now += 60
+    assert cache.get("k") == "hello"
+    clock.now += 1
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(cache, clock):
+    for key in ("a", "b", "c"):
+        cache.put(key, "m", key)
+        clock.now += 1
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == "a"
+    clock.now += 1
+    cache.put("d", "m", "d")
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["a", "c", "d"]
+    assert cache.stats()["entries"] == 3
+
+
+def test_put_drops_expired_entries(cache, clock):
+    cache.put("old", "m", "x")
+    clock.now += 61
+    cache.put("new", "m", "y")
+    assert cache.stats()["entries"] == 1
+
+
+def test_entries_survive_reopening(tmp_path, clock):
+    LLMCache(tmp_path / "llm_cache.sqlite3").put("k", "m", "kept")
+    assert LLMCache(tmp_path / "llm_cache.sqlite3").get("k") == "kept"
+
+
+def test_cache_key_normalizes_prompts_and_scopes_versions():
+    assert cache_key("m", "Buy  AAPL?\n") == cache_key("m", "Buy AAPL?")
+    assert cache_key("m", [HumanMessage(content="hi")]) == cache_key("m", [("human", "hi")])
+    assert cache_key("m", "hi") != cache_key("other", "hi")
+    assert cache_key("m", "hi", "v1") != cache_key("m", "hi", "v2")
+
+
+def test_replies_are_scoped_to_the_snapshot_version(cache):
+    model = StubModel()
+    llm = CachedChatModel(model, cache)
+    with snapshot_scope("v1"):
+        assert llm.invoke("prompt").content == "reply 1"
+        hit = llm.invoke("prompt")
+        assert hit.content == "reply 1" and hit.response_metadata["cache_hit"]
+    with snapshot_scope("v2"):
+        assert llm.invoke("prompt").content == "reply 2"
+    assert llm.invoke("prompt").content == "reply 3"
+    assert model.calls == 3
+    assert llm.stats()["hits"] == 1
+
+
+def test_forget_and_refresh_reach_the_model(cache):
+    model = StubModel()
+    llm = CachedChatModel(model, cache)
+    with snapshot_scope("v1"):
+        llm.invoke("prompt")
+        llm.forget("prompt")
+        assert llm.invoke("prompt").content == "reply 2"
+        # A refreshed reply replaces the cached one
+        assert llm.invoke("prompt", refresh=True).content == "reply 3"
+        assert llm.invoke("prompt").content == "reply 3"
+    # Forgetting under another version leaves v1's reply alone
+    with snapshot_scope("v2"):
+        llm.forget("prompt")
+    with snapshot_scope("v1"):
+        assert llm.invoke("prompt").content == "reply 3"
+    assert model.calls == 3
+
+
+def test_complete_streams_are_cached(cache):
+    model = StubModel()
+    llm = CachedChatModel(model, cache)
+    assert "".join(chunk.content for chunk in llm.stream("prompt")) == "reply 1"
+    chunks = list(llm.stream("prompt"))
+    assert [chunk.content for chunk in chunks] == ["reply 1"]
+    # An abandoned stream is not cached
+    next(llm.stream("other"))
+    assert "".join(chunk.content for chunk in llm.stream("other")) == "reply 3"
+    assert model.calls == 3
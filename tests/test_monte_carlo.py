@@ -0,0 +1,49 @@
+import importlib
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from simulation.paths import BATCH_PATHS
+
+
+@pytest.fixture
+def monte_carlo(monkeypatch):
+    """simulation.monte_carlo without MySQL: these tests build the model from returns, not stored history."""
+    price_history = types.ModuleType("data.price_history")
+    price_history.get_close_matrix = lambda *args, **kwargs: pytest.fail("stored history should not be read")
+    monkeypatch.setitem(sys.modules, "data.price_history", price_history)
+    monkeypatch.delitem(sys.modules, "simulation.monte_carlo", raising=False)
+    module = importlib.import_module("simulation.monte_carlo")
+    # Dropped again afterwards so no other test sees the module bound to the stub
+    monkeypatch.setitem(sys.modules, "simulation.monte_carlo", module)
+    return module
+
+
+@pytest.fixture
+def model(monte_carlo):
+    rng = np.random.default_rng(3)
+    returns = rng.multivariate_normal([0.0004, 0.0002, 0.0006],
+                                      [[4e-4, 1e-4, 0.0], [1e-4, 2e-4, 5e-5], [0.0, 5e-5, 9e-4]], size=500)
+    return monte_carlo.MarketModel.from_returns(["AAPL", "MSFT", "NVDA"], returns)
+
+
+def test_fixed_seed_is_identical_across_worker_counts(monte_carlo, model):
+    holdings = {"AAPL": 5000.0, "MSFT": 3000.0, "NVDA": 2000.0}
+    # Not a multiple of the batch size, so the last batch is a short one
+    n_paths = 2 * BATCH_PATHS + 301
+    serial = monte_carlo.simulate_portfolio(holdings, model, 2.0, cash=1000.0, n_paths=n_paths, seed=42, workers=1)
+    parallel = monte_carlo.simulate_portfolio(holdings, model, 2.0, cash=1000.0, n_paths=n_paths, seed=42, workers=2)
+    assert serial.to_dict() == parallel.to_dict()
+    for percentile, values in serial.bands.items():
+        np.testing.assert_array_equal(values, parallel.bands[percentile])
+
+
+def test_seed_changes_the_paths(monte_carlo, model):
+    holdings = {"AAPL": 5000.0}
+    first = monte_carlo.simulate_portfolio(holdings, model, 1.0, n_paths=1000, seed=1, workers=1)
+    again = monte_carlo.simulate_portfolio(holdings, model, 1.0, n_paths=1000, seed=1, workers=1)
+    other = monte_carlo.simulate_portfolio(holdings, model, 1.0, n_paths=1000, seed=2, workers=1)
+    assert first.to_dict() == again.to_dict()
+    assert first.expected_value != other.expected_value
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from data.price_store import COLUMNS, FLAG_BACKFILLED, INITIAL_CAPACITY, PriceStore, PriceStoreError, SymbolHistory
+
+
+def make_columns(ts, close=None):
+    ts = np.asarray(ts, dtype=np.int64)
+    close = ts.astype(np.float64) if close is None else np.asarray(close, dtype=np.float64)
+    return {"ts": ts, "open": close - 1, "high": close + 1, "low": close - 2, "close": close,
+            "volume": np.full(len(ts), 10.0)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PriceStore(tmp_path)
+
+
+def test_append_round_trips_every_column(store):
+    columns = make_columns([100, 200, 300])
+    assert store.append("AAPL", columns) == 3
+    history = store.open("AAPL")
+    assert len(history) == 3
+    assert (history.first_ts, history.last_ts) == (100, 300)
+    for name in COLUMNS:
+        np.testing.assert_array_equal(history.columns[name], columns[name])
+    assert store.last_ts("AAPL") == 300
+
+
+def test_append_sorts_the_batch_and_drops_stale_and_duplicate_rows(store):
+    store.append("AAPL", make_columns([300, 100, 200]))
+    # 150 and 300 are not newer than the stored tail; the second 400 repeats the first
+    written = store.append("AAPL", make_columns([150, 400, 300, 400, 500], close=[1, 2, 3, 4, 5]))
+    assert written == 2
+    history = store.open("AAPL")
+    np.testing.assert_array_equal(history.ts, [100, 200, 300, 400, 500])
+    np.testing.assert_array_equal(history.columns["close"][-2:], [2, 5])
+    assert store.append("AAPL", make_columns([50, 500])) == 0
+
+
+def test_append_grows_the_file_past_its_capacity(store):
+    store.append("AAPL", make_columns(np.arange(INITIAL_CAPACITY)))
+    store.append("AAPL", make_columns(np.arange(INITIAL_CAPACITY, INITIAL_CAPACITY + 10)))
+    history = store.open("AAPL")
+    assert history.capacity == 2 * INITIAL_CAPACITY
+    np.testing.assert_array_equal(history.ts, np.arange(INITIAL_CAPACITY + 10))
+
+
+def test_backfill_merges_older_rows_and_sets_the_flag(store):
+    store.append("AAPL", make_columns([300, 400], close=[30, 40]))
+    assert not store.open("AAPL").backfilled
+    # 300 is already stored, so the live tick wins over the MySQL row
+    assert store.backfill("AAPL", make_columns([100, 300, 200, 100], close=[10, 99, 20, 11])) == 2
+    history = store.open("AAPL")
+    assert history.backfilled and history.flags & FLAG_BACKFILLED
+    np.testing.assert_array_equal(history.ts, [100, 200, 300, 400])
+    np.testing.assert_array_equal(history.columns["close"], [10, 20, 30, 40])
+    assert history.first_ts == 100
+
+
+def test_flag_survives_appends_that_resize(store):
+    store.backfill("AAPL", make_columns([]))
+    assert store.open("AAPL").backfilled
+    store.append("AAPL", make_columns(np.arange(INITIAL_CAPACITY * 2)))
+    history = store.open("AAPL")
+    assert history.backfilled and len(history) == INITIAL_CAPACITY * 2
+
+
+def test_slice_is_half_open(store):
+    store.append("AAPL", make_columns([100, 200, 300, 400]))
+    window = store.open("AAPL").slice(200, 400)
+    np.testing.assert_array_equal(window["ts"], [200, 300])
+    np.testing.assert_array_equal(window["close"], [200.0, 300.0])
+
+
+def test_missing_and_foreign_files(store):
+    assert store.open("MSFT") is None and store.last_ts("MSFT") is None
+    store.path("MSFT").write_bytes(b"not a history file" * 8)
+    assert store.open("MSFT") is None
+    with pytest.raises(PriceStoreError):
+        SymbolHistory(store.path("MSFT"))
+    store.append("AAPL", make_columns([100]))
+    store.remove("AAPL")
+    assert not store.exists("AAPL")
@@ -0,0 +1,89 @@
+import importlib
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from data.price_snapshot import PriceSnapshot
+
+SYMBOLS = ["AAA", "BBB", "CCC", "DDD", "EEE"]
+PRICES = {"AAA": 50.0, "BBB": 120.0, "CCC": 75.5, "DDD": 310.0, "EEE": 9.99}
+# AAA is best on every factor and EEE worst; the others sit in between
+FUNDAMENTALS = {
+    "AAA": {"pe_ratio": 8.0, "debt_to_equity": 0.1, "news_sentiment": "Positive"},
+    "BBB": {"pe_ratio": 15.0, "debt_to_equity": 0.5, "news_sentiment": "Positive"},
+    "CCC": {"pe_ratio": 22.0, "debt_to_equity": 1.0, "news_sentiment": "Neutral"},
+    "DDD": {"pe_ratio": 35.0, "debt_to_equity": 2.0, "news_sentiment": "Neutral"},
+    "EEE": {"pe_ratio": -12.0, "debt_to_equity": 4.0, "news_sentiment": "Negative"},
+}
+DRIFT = {"AAA": 0.002, "BBB": 0.001, "CCC": 0.0005, "DDD": 0.0, "EEE": -0.002}
+NOISE = {"AAA": 0.005, "BBB": 0.01, "CCC": 0.015, "DDD": 0.02, "EEE": 0.04}
+
+
+@pytest.fixture
+def quant_scorer(monkeypatch):
+    """agents.quant_scorer without MySQL: the tests pass closes in instead of reading stored history."""
+    price_history = types.ModuleType("data.price_history")
+    price_history.get_close_matrix = lambda *args, **kwargs: pytest.fail("stored history should not be read")
+    monkeypatch.setitem(sys.modules, "data.price_history", price_history)
+    monkeypatch.delitem(sys.modules, "agents.quant_scorer", raising=False)
+    module = importlib.import_module("agents.quant_scorer")
+    # Dropped again afterwards so no other test sees the module bound to the stub
+    monkeypatch.setitem(sys.modules, "agents.quant_scorer", module)
+    return module
+
+
+@pytest.fixture
+def snapshot():
+    return PriceSnapshot.from_stock_data({symbol: {"current_price": price} for symbol, price in PRICES.items()})
+
+
+@pytest.fixture
+def market_data(snapshot):
+    return [{"symbol": symbol, "price": snapshot.price(symbol), **FUNDAMENTALS[symbol]} for symbol in SYMBOLS]
+
+
+@pytest.fixture
+def closes():
+    rng = np.random.default_rng(5)
+    noise = rng.standard_normal((130, len(SYMBOLS)))
+    log_returns = np.array([DRIFT[s] for s in SYMBOLS]) + noise * np.array([NOISE[s] for s in SYMBOLS])
+    return 100.0 * np.exp(np.cumsum(log_returns, axis=0))
+
+
+def test_scores_follow_the_factors(quant_scorer, market_data, closes):
+    scored = quant_scorer.QuantScorer().score(market_data, {"risk_appetite": "medium"}, closes)
+    assert scored.symbols == SYMBOLS
+    assert scored.weights.sum() == pytest.approx(1.0)
+    assert list(np.argsort(-scored.composite)) == [0, 1, 2, 3, 4]
+    assert all(np.diff(scored.scores) <= 0)
+    assert ((scored.scores >= 0) & (scored.scores <= 100)).all()
+
+
+@pytest.mark.parametrize("risk", ["low", "medium", "high"])
+@pytest.mark.parametrize("amount", [250.0, 10000.0, 1234567.0])
+def test_sizing_stays_within_the_investment_amount(quant_scorer, market_data, closes, risk, amount):
+    scorer = quant_scorer.QuantScorer()
+    preferences = {"risk_appetite": risk, "investment_amount": amount}
+    recommendations = scorer.recommend(preferences, market_data, closes)
+
+    assert sum(rec["TotalCost"] for rec in recommendations) <= amount
+    cap = quant_scorer.MAX_POSITION_FRACTION[risk]
+    for rec in recommendations:
+        assert rec["Action"] == "Buy"
+        assert rec["Weight"] <= cap + 1e-9
+        # Weight is reported to 4 decimals
+        assert rec["Quantity"] * rec["CurrentPrice"] <= amount * (rec["Weight"] + 5e-5)
+        assert rec["CurrentPrice"] == PRICES[rec["Symbol"]]
+    # Best first, and never more than max_positions
+    scores = [rec["Score"] for rec in recommendations]
+    assert scores == sorted(scores, reverse=True)
+    assert [rec["Symbol"] for rec in recommendations] == ["AAA", "BBB", "CCC"][:len(recommendations)]
+
+
+def test_unpriced_symbols_are_never_recommended(quant_scorer, market_data, closes):
+    market_data[0] = {**market_data[0], "price": 0.0}
+    recommendations = quant_scorer.QuantScorer().recommend({"investment_amount": 10000}, market_data, closes)
+    assert "AAA" not in [rec["Symbol"] for rec in recommendations]
+    assert quant_scorer.QuantScorer().recommend({"investment_amount": 10000}, [{"symbol": "AAA"}]) == []
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from gamification.rank_index import EquityRankIndex
+
+
+def sorted_reference(equities):
+    return sorted(equities.items(), key=lambda item: (-item[1], item[0]))
+
+
+def assert_matches_reference(index, equities):
+    ranking = sorted_reference(equities)
+    assert len(index) == len(ranking)
+    assert index.top(len(ranking) + 5) == [(equity, user_id) for user_id, equity in ranking]
+    total = len(ranking)
+    for rank, (user_id, equity) in enumerate(ranking, start=1):
+        assert index.rank(equity, user_id) == rank
+        expected = 100.0 * (total - rank) / (total - 1) if total > 1 else 100.0
+        assert index.percentile(rank) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("load", [2, 16, 256])
+def test_random_updates_match_sorted_list(load):
+    rng = random.Random(11)
+    index, equities = EquityRankIndex(load=load), {}
+    for step in range(3000):
+        user_id = f"user-{rng.randrange(400)}"
+        if user_id in equities:
+            index.remove(equities.pop(user_id), user_id)
+        if rng.random() < 0.85:
+            # Most users sit near the starting balance, with the odd outlier and bankruptcy
+            equity = rng.choice([100_000.0 + rng.uniform(-50, 50), rng.uniform(0, 1e7), 0.0])
+            index.add(equity, user_id)
+            equities[user_id] = equity
+        if step % 250 == 0:
+            assert_matches_reference(index, equities)
+    assert_matches_reference(index, equities)
+
+
+def test_ties_are_broken_by_user_id():
+    index = EquityRankIndex(load=2)
+    for user_id in ["c", "a", "d", "b"]:
+        index.add(100_000.0, user_id)
+    assert [user_id for _, user_id in index.top(4)] == ["a", "b", "c", "d"]
+    assert index.rank(100_000.0, "c") == 3
+
+
+def test_rank_of_a_missing_key_is_its_insertion_point():
+    index = EquityRankIndex()
+    assert index.rank(5.0, "x") == 1
+    index.add(10.0, "a")
+    index.add(1.0, "b")
+    assert index.rank(5.0, "x") == 2
+    assert index.rank(0.5, "x") == 3
+
+
+def test_single_user_is_top_percentile():
+    index = EquityRankIndex()
+    index.add(1.0, "only")
+    assert index.percentile(index.rank(1.0, "only")) == 100.0
+    index.remove(1.0, "only")
+    assert len(index) == 0 and index.top(3) == []
@@ -0,0 +1,65 @@
+import pytest
+
+from data.price_snapshot import PriceSnapshot
+from portfolio.valuation import value_holdings
+
+
+@pytest.fixture
+def snapshot():
+    return PriceSnapshot.from_stock_data({
+        "AAPL": {"current_price": 150.0, "previous_close": 145.0},
+        "MSFT": {"current_price": 300.0, "previous_close": 0.0},
+    })
+
+
+def position(symbol, quantity, cost_basis, realized_pnl=0.0):
+    return {"symbol": symbol, "quantity": quantity, "cost_basis": cost_basis, "realized_pnl": realized_pnl}
+
+
+def test_unrealized_pnl_and_day_change(snapshot):
+    valuation = value_holdings([position("AAPL", 10, 1200.0, 25.0), position("MSFT", 2, 700.0)], snapshot)
+    aapl, msft = valuation.holdings
+    assert aapl["market_value"] == pytest.approx(1500.0)
+    assert aapl["avg_cost"] == pytest.approx(120.0)
+    assert aapl["unrealized_pnl"] == pytest.approx(300.0)
+    assert aapl["unrealized_pnl_pct"] == pytest.approx(0.25)
+    assert aapl["day_change"] == pytest.approx(50.0)
+    assert aapl["day_change_pct"] == pytest.approx(150.0 / 145.0 - 1)
+    # No previous close: no day change, but still marked to the current price
+    assert msft["unrealized_pnl"] == pytest.approx(-100.0)
+    assert (msft["day_change"], msft["day_change_pct"]) == (0.0, 0.0)
+    assert aapl["weight"] + msft["weight"] == pytest.approx(1.0)
+
+    totals = valuation.totals
+    assert totals["market_value"] == pytest.approx(2100.0)
+    assert totals["unrealized_pnl"] == pytest.approx(200.0)
+    assert totals["realized_pnl"] == pytest.approx(25.0)
+    # Only holdings with a previous close count towards the day's opening value
+    assert totals["day_change_pct"] == pytest.approx(50.0 / 1450.0)
+    assert valuation.unpriced == [] and valuation.snapshot_version == snapshot.version
+
+
+def test_unpriced_symbols_fall_back_to_cost_basis(snapshot):
+    valuation = value_holdings([position("AAPL", 10, 1200.0), position("TSLA", 4, 800.0)], snapshot)
+    tsla = valuation.holdings[1]
+    assert valuation.unpriced == ["TSLA"]
+    assert not tsla["priced"]
+    assert tsla["market_value"] == pytest.approx(800.0)
+    assert (tsla["unrealized_pnl"], tsla["day_change"]) == (0.0, 0.0)
+    assert valuation.totals["market_value"] == pytest.approx(2300.0)
+    assert valuation.totals["unrealized_pnl"] == pytest.approx(300.0)
+    assert tsla["weight"] == pytest.approx(800.0 / 2300.0)
+
+
+def test_closed_positions_only_add_realized_pnl(snapshot):
+    valuation = value_holdings([position("AAPL", 0.0, 0.0, 40.0), position("MSFT", 1, 250.0, -10.0)], snapshot)
+    assert [holding["symbol"] for holding in valuation.holdings] == ["MSFT"]
+    assert valuation.totals["realized_pnl"] == pytest.approx(30.0)
+    assert valuation.totals["cost_basis"] == pytest.approx(250.0)
+
+
+def test_no_positions(snapshot):
+    valuation = value_holdings([], snapshot)
+    assert valuation.holdings == [] and valuation.unpriced == []
+    assert valuation.totals == {"market_value": 0.0, "cost_basis": 0.0, "day_change": 0.0,
+                                "day_change_pct": 0.0, "unrealized_pnl": 0.0, "realized_pnl": 0.0}
@@ -0,0 +1,44 @@
+from typing import Dict, Optional
+import threading
+
+import finnhub
+from langchain_groq import ChatGroq
+from newsapi import NewsApiClient
+
+from utils.config import FINNHUB_API_KEY, GROQ_API_KEY, NEWSAPI_KEY
+from utils.llm_cache import CachedChatModel
+from utils.logger import logger
+
+# One client per upstream (and per Groq model) for the whole process, so
+# connection pools and the LLM cache counters are shared by every agent.
+_chat_models: Dict[str, CachedChatModel] = {}
+_finnhub_client: Optional[finnhub.Client] = None
+_newsapi_client: Optional[NewsApiClient] = None
+_clients_lock = threading.Lock()
+
+
+def get_chat_model(model_name: str) -> CachedChatModel:
+    """Process-wide cached Groq chat model for `model_name`."""
+    with _clients_lock:
+        if model_name not in _chat_models:
+            _chat_models[model_name] = CachedChatModel(ChatGroq(model_name=model_name, api_key=GROQ_API_KEY))
+            logger.info(f"Initialized Groq client for {model_name}")
+        return _chat_models[model_name]
+
+
+def get_finnhub_client() -> finnhub.Client:
+    global _finnhub_client
+    with _clients_lock:
+        if _finnhub_client is None:
+            _finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
+            logger.info("Initialized Finnhub client")
+        return _finnhub_client
+
+
+def get_newsapi_client() -> NewsApiClient:
+    global _newsapi_client
+    with _clients_lock:
+        if _newsapi_client is None:
+            _newsapi_client = NewsApiClient(api_key=NEWSAPI_KEY)
+            logger.info("Initialized NewsAPI client")
+        return _newsapi_client
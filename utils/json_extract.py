@@ -0,0 +1,216 @@
+from typing import Any, List, Optional
+import json
+import re
+
+# Characters that matter outside / inside a JSON string; everything else is
+# skipped with a regex search, so each character is looked at once.
+_STRUCTURE = re.compile(r'[{}\[\]",]')
+_STRING = re.compile(r'["\\]')
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class _Scanner:
+    """String-aware bracket scanner over text that may arrive in pieces."""
+
+    def __init__(self, openers: str = "{["):
+        # Outside any value only openers matter; quotes in surrounding prose are ignored
+        self._top = re.compile("[" + re.escape(openers) + "]")
+        self.buffer = ""
+        self.pos = 0
+        self.stack: List[str] = []  # expected closers
+        self.in_string = False
+
+    @property
+    def stopped(self) -> bool:
+        return False
+
+    def _scan(self):
+        buffer = self.buffer
+        end = len(buffer)
+        while self.pos < end and not self.stopped:
+            if self.in_string:
+                match = _STRING.search(buffer, self.pos)
+                if match is None:
+                    self.pos = end
+                    break
+                if match.group() == '"':
+                    self.in_string = False
+                    self.pos = match.end()
+                else:
+                    # Skip the escaped character; it may not have arrived yet
+                    self.pos = match.end() + 1
+                continue
+            match = (_STRUCTURE if self.stack else self._top).search(buffer, self.pos)
+            if match is None:
+                self.pos = end
+                break
+            char, index = match.group(), match.start()
+            self.pos = match.end()
+            if char == '"':
+                self.in_string = True
+            elif char in _CLOSERS:
+                self._open(char, index)
+                self.stack.append(_CLOSERS[char])
+            elif char in "}]":
+                if char == self.stack.pop():
+                    self._close(char, index)
+                else:
+                    # A mismatched closer breaks the candidate; drop it and look for the next opener
+                    self.stack.clear()
+                    self._abandon(index)
+            else:
+                self._comma(index)
+
+    def _open(self, char: str, index: int):
+        pass
+
+    def _close(self, char: str, index: int):
+        pass
+
+    def _comma(self, index: int):
+        pass
+
+    def _abandon(self, index: int):
+        pass
+
+
+class JSONExtractor(_Scanner):
+    """Find and decode the first valid JSON object or array in text, in one pass.
+
+    Text can be fed in chunks (e.g. from an LLM token stream); `feed` returns
+    the value as soon as it is complete. Surrounding prose and markdown fences
+    are skipped, trailing commas are tolerated, and a balanced candidate that
+    still fails to decode is stepped over as a whole rather than rescanned.
+    """
+
+    def __init__(self, openers: str = "{["):
+        super().__init__(openers)
+        self.start: Optional[int] = None
+        self.last_comma: Optional[int] = None
+        self.trailing_commas: List[int] = []
+        self.found = False
+        self.value: Any = None
+
+    @property
+    def stopped(self) -> bool:
+        return self.found
+
+    def feed(self, text: str) -> Any:
+        """Add text; returns the decoded value once found, else None."""
+        if self.found:
+            return self.value
+        self.buffer += text
+        self._scan()
+        if self.start is None and not self.found:
+            # Nothing open: text before pos can never be part of a value
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        return self.value
+
+    def finish(self) -> Any:
+        """End of input. A value cut off mid-way (e.g. a truncated response) is closed and tried once."""
+        if self.found or self.start is None:
+            return self.value
+        text = self.buffer[self.start:]
+        if self.in_string:
+            text += '"'
+        text = text.rstrip().rstrip(",")
+        if text.endswith(":"):
+            text += "null"
+        self._decode(text + "".join(reversed(self.stack)))
+        return self.value
+
+    def _open(self, char: str, index: int):
+        if not self.stack:
+            self.start = index
+            self.trailing_commas = []
+        self.last_comma = None
+
+    def _comma(self, index: int):
+        self.last_comma = index
+
+    def _abandon(self, index: int):
+        self.start = None
+        self.last_comma = None
+
+    def _close(self, char: str, index: int):
+        if self.last_comma is not None and not self.buffer[self.last_comma + 1:index].strip():
+            self.trailing_commas.append(self.last_comma - self.start)
+        self.last_comma = None
+        if not self.stack:
+            self._decode(self.buffer[self.start:index + 1])
+            self.start = None
+
+    def _decode(self, text: str):
+        try:
+            self.value = json.loads(text, strict=False)
+        except ValueError:
+            if not self.trailing_commas:
+                return
+            pieces, previous = [], 0
+            for comma in self.trailing_commas:
+                pieces.append(text[previous:comma])
+                previous = comma + 1
+            pieces.append(text[previous:])
+            try:
+                self.value = json.loads("".join(pieces), strict=False)
+            except ValueError:
+                return
+        self.found = True
+
+
+class ArrayItemStream(_Scanner):
+    """Yield complete objects from the array under `key` while the document is still streaming."""
+
+    def __init__(self, key: str):
+        super().__init__("{[")
+        self.key_pattern = re.compile(r'"%s"\s*:\s*$' % re.escape(key))
+        self.array_depth: Optional[int] = None  # depth inside the target array
+        self.item_start: Optional[int] = None
+        self.items: List[Any] = []
+
+    def feed(self, text: str) -> List[Any]:
+        """Add text; returns the array items completed by it."""
+        self.buffer += text
+        self._scan()
+        items, self.items = self.items, []
+        return items
+
+    def _open(self, char: str, index: int):
+        depth = len(self.stack)
+        if char == "[" and self.array_depth is None and self.key_pattern.search(self.buffer, max(0, index - 256), index):
+            self.array_depth = depth + 1
+        elif char == "{" and depth == self.array_depth:
+            self.item_start = index
+
+    def _close(self, char: str, index: int):
+        depth = len(self.stack)
+        if char == "}" and self.item_start is not None and depth == self.array_depth:
+            text = self.buffer[self.item_start:index + 1]
+            try:
+                self.items.append(json.loads(text, strict=False))
+            except ValueError:
+                # Same trailing-comma tolerance as JSONExtractor, but only as a fallback
+                try:
+                    self.items.append(json.loads(_TRAILING_COMMA.sub(r"\1", text), strict=False))
+                except ValueError:
+                    pass
+            self.item_start = None
+        elif char == "]" and self.array_depth is not None and depth == self.array_depth - 1:
+            self.array_depth = -1  # done; later arrays with the same key are ignored
+
+    def _abandon(self, index: int):
+        self.item_start = None
+        if self.array_depth != -1:
+            self.array_depth = None
+
+
+def extract_json(text: str, default: Any = None, openers: str = "{[") -> Any:
+    """First valid JSON value in `text` that starts with one of `openers`, or `default`."""
+    if not text:
+        return default
+    extractor = JSONExtractor(openers)
+    extractor.feed(text)
+    value = extractor.finish()
+    return value if extractor.found else default
@@ -0,0 +1,243 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Optional
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from utils.logger import logger
+
+LLM_CACHE_PATH = Path("finance_simulator/cache/llm_cache.sqlite3")
+LLM_CACHE_TTL = 6 * 3600        # seconds a cached response stays valid
+LLM_CACHE_MAX_ENTRIES = 2000    # least recently used entries beyond this are evicted
+
+# Price snapshot the current run is based on; part of every cache key so a
+# response is never reused against different market data.
+snapshot_version: ContextVar[str] = ContextVar("snapshot_version", default="")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@contextmanager
+def snapshot_scope(version: str):
+    """Key LLM cache lookups made inside the block to a price snapshot version."""
+    token = snapshot_version.set(version)
+    try:
+        yield
+    finally:
+        snapshot_version.reset(token)
+
+
+def normalize_prompt(prompt) -> str:
+    """Canonical text for a prompt: strings, message lists and prompt values alike."""
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    if isinstance(prompt, (list, tuple)):
+        parts = []
+        for message in prompt:
+            if isinstance(message, tuple):
+                role, content = message
+            else:
+                role, content = getattr(message, "type", "human"), getattr(message, "content", message)
+            parts.append(f"{role}: {content}")
+        prompt = "\n".join(parts)
+    return _WHITESPACE.sub(" ", str(prompt)).strip()
+
+
+def cache_key(model: str, prompt, version: str = "") -> str:
+    payload = "\x00".join((model, normalize_prompt(prompt), version))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed response cache with a TTL and LRU eviction."""
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, content: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, content, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, content, now, now)
+            )
+            # Expired rows go first, then the least recently used beyond the bound
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+_default_cache: Optional[LLMCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    """Process-wide cache shared by every agent."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
+
+
+class CachedChatModel:
+    """Wrap a chat model so invoke/stream are served from the LLM cache when possible.
+
+    Anything else is delegated to the wrapped model, so agents can keep using
+    `self.llm` exactly as before. A caller that rejects a reply should
+    `forget` it, and retries pass `refresh=True` so they reach the model.
+    """
+
+    def __init__(self, llm, cache: Optional[LLMCache] = None):
+        self.llm = llm
+        self.cache = cache
+        self.model_name = getattr(llm, "model_name", None) or getattr(llm, "model", "") or type(llm).__name__
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["llm"], name)
+
+    def _cache(self) -> Optional[LLMCache]:
+        if self.cache is None:
+            try:
+                self.cache = get_llm_cache()
+            except Exception as e:
+                logger.error(f"LLM cache unavailable, calling {self.model_name} directly: {str(e)}")
+                return None
+        return self.cache
+
+    def _lookup(self, prompt, refresh: bool = False):
+        cache = self._cache()
+        if cache is None:
+            return None, None
+        key = cache_key(self.model_name, prompt, snapshot_version.get())
+        if refresh:
+            self.misses += 1
+            return key, None
+        try:
+            content = cache.get(key)
+        except sqlite3.Error as e:
+            logger.error(f"LLM cache read failed: {str(e)}")
+            return None, None
+        if content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            logger.info(f"LLM cache hit for {self.model_name} ({self.hits} hits, {self.misses} misses)")
+        return key, content
+
+    def _store(self, key: Optional[str], content: str):
+        if key is None or not content:
+            return
+        try:
+            self.cache.put(key, self.model_name, content)
+        except sqlite3.Error as e:
+            logger.error(f"LLM cache write failed: {str(e)}")
+
+    def forget(self, prompt):
+        """Drop the cached reply to `prompt` under the current snapshot, e.g. after it failed validation."""
+        cache = self._cache()
+        if cache is None:
+            return
+        try:
+            cache.delete(cache_key(self.model_name, prompt, snapshot_version.get()))
+        except sqlite3.Error as e:
+            logger.error(f"LLM cache delete failed: {str(e)}")
+
+    def invoke(self, prompt, *args, refresh: bool = False, **kwargs):
+        key, content = self._lookup(prompt, refresh)
+        if content is not None:
+            return AIMessage(content=content, response_metadata={"cache_hit": True, "model_name": self.model_name})
+        response = self.llm.invoke(prompt, *args, **kwargs)
+        self._store(key, getattr(response, "content", ""))
+        return response
+
+    def stream(self, prompt, *args, refresh: bool = False, **kwargs):
+        key, content = self._lookup(prompt, refresh)
+        if content is not None:
+            yield AIMessageChunk(content=content, response_metadata={"cache_hit": True, "model_name": self.model_name})
+            return
+        parts = []
+        for chunk in self.llm.stream(prompt, *args, **kwargs):
+            parts.append(getattr(chunk, "content", ""))
+            yield chunk
+        # Only complete streams are cached; an abandoned generator never reaches here
+        self._store(key, "".join(parts))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }